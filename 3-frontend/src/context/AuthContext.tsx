@@ -43,12 +43,13 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
       try {
         const decoded = jwtDecode<JWTPayload>(storedToken);
         
-        if (decoded.exp && decoded.exp * 1000 < Date.now()) {
+        if (decoded.exp && decoded.exp * 1000 < Date.now() && !localStorage.getItem('refresh_token')) {
           localStorage.removeItem('token');
           localStorage.removeItem('user');
           return;
         }
         
+        // Token expired tapi refresh token ada: getProfile di bawah kena 401 lalu di-refresh oleh interceptor api.ts
         setToken(storedToken);
         
         const storedUser = localStorage.getItem('user');
@@ -66,6 +67,7 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
             // Support kedua format response (jaga-jaga)
             const userData = data.data || data; 
             if (userData && userData.id) {
+              setToken(localStorage.getItem('token')); // Bisa sudah di-refresh oleh interceptor
               setUser(userData);
               localStorage.setItem('user', JSON.stringify(userData));
             }
@@ -91,6 +93,9 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
         
         setToken(token);
         localStorage.setItem('token', token);
+        if (response.refresh_token) {
+          localStorage.setItem('refresh_token', response.refresh_token);
+        }
 
         // Ambil data user dari response login jika ada
         let userData: User;
@@ -130,6 +135,9 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
         const token = response.token;
         setToken(token);
         localStorage.setItem('token', token);
+        if (response.refresh_token) {
+          localStorage.setItem('refresh_token', response.refresh_token);
+        }
         
         if (response.user) {
             setUser(response.user);
@@ -148,9 +156,15 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
   };
 
   const logout = () => {
+    // Cabut sesi di server (best effort) supaya refresh token tidak bisa dipakai lagi
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      authAPI.logout(refreshToken).catch(() => {});
+    }
     setUser(null);
     setToken(null);
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('user');
   };
 
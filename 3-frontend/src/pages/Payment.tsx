@@ -80,7 +80,7 @@ export const Payment: React.FC = () => {
         order_id: parseInt(orderId),
         payment_id: parseInt(paymentId),
         payment_method: paymentMethod,
-      });
+      }, `payment-${orderId}-${paymentMethod}`); // Klik ulang setelah timeout tidak membayar dua kali
 
       if (response.status === 'success') {
         // Redirect to invoice/receipt page
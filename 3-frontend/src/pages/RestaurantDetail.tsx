@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import { restaurantAPI, orderAPI, userAPI, paymentAPI } from '../services/api';
@@ -39,6 +39,12 @@ export const RestaurantDetail: React.FC = () => {
   const [isOrdering, setIsOrdering] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
+  // Satu Idempotency-Key per isi checkout: retry setelah timeout tidak membuat order dobel
+  const checkoutKey = useRef<string | null>(null);
+
+  useEffect(() => {
+    checkoutKey.current = null;
+  }, [cart, selectedAddress]);
 
   useEffect(() => {
     if (!isAuthenticated) {
@@ -170,6 +176,10 @@ export const RestaurantDetail: React.FC = () => {
     setError('');
     setSuccess('');
 
+    if (!checkoutKey.current) {
+      checkoutKey.current = `order-${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+
     try {
       const response = await orderAPI.createOrder({
         restaurant_id: parseInt(id!),
@@ -178,7 +188,7 @@ export const RestaurantDetail: React.FC = () => {
           menu_item_id: item.menu_item_id,
           quantity: item.quantity,
         })),
-      });
+      }, checkoutKey.current);
 
       if (response.status === 'success') {
         const orderId = response.data.order_id;
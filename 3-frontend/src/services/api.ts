@@ -25,10 +25,51 @@ api.interceptors.request.use(
   }
 );
 
+// Access token expired -> tukar refresh token sekali (single flight untuk request paralel), lalu ulangi request
+let refreshPromise: Promise<string | null> | null = null;
+
+export const refreshAccessToken = (): Promise<string | null> => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) return Promise.resolve(null);
+  if (!refreshPromise) {
+    refreshPromise = axios
+      .post(`${API_BASE_URL}/users/auth/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        localStorage.setItem('token', response.data.token);
+        localStorage.setItem('refresh_token', response.data.refresh_token);
+        return response.data.token as string;
+      })
+      .catch(() => {
+        // Tab lain mungkin sudah merotasi token: pakai token terbarunya kalau ada
+        const latest = localStorage.getItem('refresh_token');
+        return latest && latest !== refreshToken ? localStorage.getItem('token') : null;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Response interceptor to handle errors
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const original = error.config;
+    if (
+      error.response?.status === 401 &&
+      original &&
+      !original._retried &&
+      !original.url?.includes('/users/auth/')
+    ) {
+      original._retried = true;
+      const newToken = await refreshAccessToken();
+      if (newToken) {
+        original.headers.Authorization = `Bearer ${newToken}`;
+        return api(original);
+      }
+    }
+
     // Handle network errors (no response from server)
     if (!error.response) {
       if (error.code === 'ECONNABORTED' || error.message.includes('timeout')) {
@@ -45,6 +86,7 @@ api.interceptors.response.use(
       // Token expired or invalid - only redirect if not already on login/register page
       if (!window.location.pathname.includes('/register')) {
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
         window.location.href = '/';
       }
@@ -86,6 +128,10 @@ export const authAPI = {
       throw error;
     }
   },
+  logout: async (refreshToken: string) => {
+    const response = await api.post('/users/auth/logout', { refresh_token: refreshToken });
+    return response.data;
+  },
 };
 
 // User API
@@ -119,8 +165,9 @@ export const userAPI = {
 
 // Restaurant API
 export const restaurantAPI = {
-  getRestaurants: async (cuisineType?: string) => {
-    const params = cuisineType ? { cuisine_type: cuisineType } : {};
+  getRestaurants: async (cuisineType?: string, near?: { lat: number; lng: number; radius_km?: number }) => {
+    // `near` -> diurutkan dari yang terdekat (restoran di luar radius / tanpa koordinat tidak ikut)
+    const params = { ...(cuisineType ? { cuisine_type: cuisineType } : {}), ...(near || {}) };
     const response = await api.get('/restaurants', { params });
     return response.data;
   },
@@ -128,12 +175,17 @@ export const restaurantAPI = {
     const response = await api.get(`/restaurants/${restaurantId}/menu`);
     return response.data;
   },
+  search: async (params: { q?: string; type?: 'restaurant' | 'menu_item'; cuisine?: string; category?: string; price_band?: string; restaurant_id?: number; page?: number; size?: number }) => {
+    const response = await api.get('/restaurants/search', { params });
+    return response.data;
+  },
 };
 
 // Order API
 export const orderAPI = {
-  createOrder: async (data: { restaurant_id: number; address_id: number; items: Array<{ menu_item_id: number; quantity: number }> }) => {
-    const response = await api.post('/orders', data);
+  // idempotencyKey: sama untuk retry aksi yang sama -> server tidak membuat order dobel
+  createOrder: async (data: { restaurant_id: number; address_id: number; items: Array<{ menu_item_id: number; quantity: number }> }, idempotencyKey?: string) => {
+    const response = await api.post('/orders', data, idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined);
     return response.data;
   },
   getOrders: async () => {
@@ -157,16 +209,16 @@ export const orderAPI = {
     const response = await api.get('/orders/admin/sales/restaurants');
     return response.data;
   },
-  getAllOrders: async () => {
-    const response = await api.get('/orders/admin/all');
+  getAllOrders: async (params?: { limit?: number; cursor?: string; status?: string; restaurant_id?: number; driver_id?: number; date_from?: string; date_to?: string }) => {
+    const response = await api.get('/orders/admin/all', { params });
     return response.data;
   },
 };
 
 // Payment API
 export const paymentAPI = {
-  simulatePayment: async (data: { order_id: number; payment_id: number; payment_method?: string }) => {
-    const response = await api.post('/payments/simulate', data);
+  simulatePayment: async (data: { order_id: number; payment_id: number; payment_method?: string }, idempotencyKey?: string) => {
+    const response = await api.post('/payments/simulate', data, idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined);
     return response.data;
   },
 };
@@ -221,8 +273,8 @@ export const adminAPI = {
 
 // Driver API
 export const driverAPI = {
-  getAvailableOrders: async () => {
-    const response = await api.get('/orders/available');
+  getAvailableOrders: async (near?: { lat: number; lng: number; radius_km?: number }) => {
+    const response = await api.get('/orders/available', { params: near });
     return response.data;
   },
   getMyOrders: async () => {
@@ -241,9 +293,15 @@ export const driverAPI = {
     const response = await api.get('/orders/driver/history');
     return response.data;
   },
+  // Kirim beberapa titik GPS sekaligus (ts = epoch detik dari device)
+  sendLocationPings: async (points: { lat: number; lng: number; ts?: number; heading?: number; speed?: number }[]) => {
+    const response = await api.post('/drivers/location/pings', { points });
+    return response.data;
+  },
   // Admin endpoints for driver management
-  getAllDrivers: async () => {
-    const response = await api.get('/drivers/admin/all');
+  // Tanpa params -> semua driver; dengan limit -> satu halaman + next_after_id
+  getAllDrivers: async (params?: { after_id?: number; limit?: number }) => {
+    const response = await api.get('/drivers/admin/all', { params });
     return response.data;
   },
   getDriverSalaries: async () => {
@@ -0,0 +1,151 @@
+import { Request, Response, NextFunction, RequestHandler } from 'express';
+
+// Shared HTTP cache kecil di gateway untuk GET publik (restoran & menu).
+// Mengikuti Cache-Control dari service (max-age + stale-while-revalidate) dan
+// revalidasi ke upstream dengan If-None-Match, jadi repeat browsing cukup dapat 304 / HIT.
+
+interface CacheEntry {
+    status: number;
+    body: Buffer;
+    headers: Record<string, string>;
+    etag?: string;
+    storedAt: number;
+    maxAge: number;
+    staleWhileRevalidate: number;
+}
+
+interface HttpCacheOptions {
+    target: string;
+    rewrite: (url: string) => string;
+    match: RegExp; // Hanya GET dengan URL yang cocok yang di-cache, sisanya langsung ke proxy
+    maxEntries?: number;
+}
+
+const FORWARDED_HEADERS = ['content-type', 'etag', 'last-modified', 'cache-control'];
+
+const parseCacheControl = (value: string | null) => {
+    const directives: Record<string, string | true> = {};
+    (value || '').split(',').forEach(part => {
+        const [key, val] = part.trim().split('=');
+        if (key) directives[key.toLowerCase()] = val === undefined ? true : val;
+    });
+    const seconds = (key: string) => {
+        const n = parseInt(String(directives[key] ?? ''), 10);
+        return Number.isFinite(n) ? n : 0;
+    };
+    return {
+        cacheable: !directives['no-store'] && !directives['private'] && seconds('max-age') > 0,
+        maxAge: seconds('max-age'),
+        staleWhileRevalidate: seconds('stale-while-revalidate')
+    };
+};
+
+export const httpCache = (options: HttpCacheOptions): RequestHandler => {
+    const maxEntries = options.maxEntries || 500;
+    const entries = new Map<string, CacheEntry>();
+    const inFlight = new Map<string, Promise<CacheEntry>>();
+
+    const store = (key: string, entry: CacheEntry) => {
+        entries.delete(key);
+        entries.set(key, entry);
+        while (entries.size > maxEntries) {
+            const oldest = entries.keys().next().value as string;
+            entries.delete(oldest);
+        }
+    };
+
+    const fetchEntry = async (key: string, cached?: CacheEntry): Promise<CacheEntry> => {
+        const headers: Record<string, string> = {};
+        if (cached?.etag) headers['If-None-Match'] = cached.etag;
+        const upstream = await fetch(options.target + options.rewrite(key), { headers });
+        const cacheControl = parseCacheControl(upstream.headers.get('cache-control'));
+
+        if (upstream.status === 304 && cached) {
+            const refreshed = { ...cached, storedAt: Date.now(), maxAge: cacheControl.maxAge, staleWhileRevalidate: cacheControl.staleWhileRevalidate };
+            store(key, refreshed);
+            return refreshed;
+        }
+
+        const entry: CacheEntry = {
+            status: upstream.status,
+            body: Buffer.from(await upstream.arrayBuffer()),
+            headers: {},
+            etag: upstream.headers.get('etag') || undefined,
+            storedAt: Date.now(),
+            maxAge: cacheControl.maxAge,
+            staleWhileRevalidate: cacheControl.staleWhileRevalidate
+        };
+        FORWARDED_HEADERS.forEach(name => {
+            const value = upstream.headers.get(name);
+            if (value) entry.headers[name] = value;
+        });
+
+        if (upstream.status === 200 && cacheControl.cacheable) {
+            store(key, entry);
+        } else {
+            entries.delete(key);
+        }
+        return entry;
+    };
+
+    // Return entry terbaru (yang tidak boleh di-cache tetap dikembalikan, tapi tidak disimpan)
+    const revalidate = (key: string, cached?: CacheEntry): Promise<CacheEntry> => {
+        const running = inFlight.get(key);
+        if (running) return running;
+
+        const task = (async () => {
+            try {
+                return await fetchEntry(key, cached);
+            } finally {
+                inFlight.delete(key);
+            }
+        })();
+
+        inFlight.set(key, task);
+        return task;
+    };
+
+    const send = (req: Request, res: Response, entry: CacheEntry, cacheStatus: string) => {
+        res.set(entry.headers);
+        res.set('X-Cache', cacheStatus);
+        const clientTags = (req.headers['if-none-match'] || '').split(',').map(t => t.trim());
+        if (entry.status === 200 && entry.etag && clientTags.includes(entry.etag)) {
+            res.status(304).end();
+            return;
+        }
+        res.status(entry.status).send(entry.body);
+    };
+
+    return async (req: Request, res: Response, next: NextFunction) => {
+        const key = req.originalUrl;
+        if (req.method !== 'GET') {
+            // Mutasi lewat gateway -> buang semua cache prefix ini, biarkan proxy meneruskan request
+            entries.clear();
+            return next();
+        }
+
+        if (!options.match.test(key)) {
+            return next();
+        }
+
+        const cached = entries.get(key);
+        const age = cached ? (Date.now() - cached.storedAt) / 1000 : Infinity;
+
+        if (cached && age < cached.maxAge) {
+            return send(req, res, cached, 'HIT');
+        }
+        if (cached && age < cached.maxAge + cached.staleWhileRevalidate) {
+            revalidate(key, cached).catch(err => console.error(`Background revalidation failed for ${key}:`, err.message));
+            return send(req, res, cached, 'STALE');
+        }
+
+        try {
+            const entry = await revalidate(key, cached);
+            return send(req, res, entry, cached ? 'REVALIDATED' : 'MISS');
+        } catch (err: any) {
+            console.error(`Cache fetch failed for ${key}:`, err.message);
+            if (cached) return send(req, res, cached, 'STALE');
+            return next(); // Biarkan proxy yang menangani (error upstream seperti biasa)
+        }
+    };
+};
@@ -1,6 +1,7 @@
 import express from 'express';
 import cors from 'cors';
 import { createProxyMiddleware } from 'http-proxy-middleware';
+import { httpCache } from './httpCache';
 
 const app = express();
 const PORT = process.env.PORT || 3000;
@@ -28,7 +29,12 @@ app.use('/api/users', createProxyMiddleware({
 
 // 2. Restaurant Service
 // Frontend sends /api/restaurants -> Python service needs /restaurants
-app.use('/api/restaurants', createProxyMiddleware({
+// Daftar restoran, detail & menu (GET publik) dilayani dari cache gateway + revalidasi ETag
+app.use('/api/restaurants', httpCache({
+    target: 'http://restaurant-service:8000',
+    rewrite: url => url.replace(/^\/api/, ''),
+    match: /^\/api\/restaurants(\/\d+(\/menu)?)?\/?(\?.*)?$/
+}), createProxyMiddleware({
     target: 'http://restaurant-service:8000',
     changeOrigin: true,
     pathRewrite: {
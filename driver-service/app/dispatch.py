@@ -0,0 +1,258 @@
+"""
+Dispatcher otomatis: order PAID dicocokkan ke driver bebas terdekat secara batch.
+
+Setiap DISPATCH_INTERVAL_SECONDS:
+1. Ambil antrian order PAID tanpa driver dari Order Service (sekali request)
+2. Kandidat per order = k driver terdekat dari titik jemput (store posisi in-memory),
+   disaring: punya profil, sedang online (is_available), tidak sedang on job
+3. Biaya tiap pasangan (order, driver) = jarak + beban terakhir - bonus waktu menganggur
+4. Assignment dipilih global dari biaya termurah (greedy), tiap driver / order maksimal sekali
+5. Driver di-claim dengan conditional UPDATE (is_on_job = false), lalu order di-assign di
+   Order Service dengan conditional UPDATE juga; yang kalah (diambil manual) dikembalikan bebas
+6. Hasil assign tidak diketahui (timeout / 5xx, bisa saja Order Service sudah commit) -> driver TIDAK
+   dilepas. Pasangan disimpan dan dikirim ulang di putaran berikutnya (endpoint idempotent per
+   (order, driver)) sampai hasilnya jelas, baru task dibuat atau driver dilepas.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import requests
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models import Driver, DeliveryTask
+from . import http_client
+from . import locations
+
+ORDER_SERVICE_URL = "http://order-service:8000"
+
+DISPATCH_ENABLED = os.getenv("DISPATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+DISPATCH_INTERVAL_SECONDS = float(os.getenv("DISPATCH_INTERVAL_SECONDS", "5"))
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "200"))
+DISPATCH_CANDIDATES_PER_ORDER = int(os.getenv("DISPATCH_CANDIDATES_PER_ORDER", "8"))
+DISPATCH_RADIUS_KM = float(os.getenv("DISPATCH_RADIUS_KM", "5"))
+DISPATCH_LOAD_WINDOW_MINUTES = int(os.getenv("DISPATCH_LOAD_WINDOW_MINUTES", "60"))
+
+# Bobot biaya: 1 km = 1 poin, 1 delivery dalam window = 0.5 poin, menganggur 20 menit = -1 poin (maks -1)
+WEIGHT_DISTANCE = float(os.getenv("DISPATCH_WEIGHT_DISTANCE", "1.0"))
+WEIGHT_LOAD = float(os.getenv("DISPATCH_WEIGHT_LOAD", "0.5"))
+WEIGHT_IDLE_PER_MINUTE = float(os.getenv("DISPATCH_WEIGHT_IDLE_PER_MINUTE", "0.05"))
+MAX_IDLE_BONUS = float(os.getenv("DISPATCH_MAX_IDLE_BONUS", "1.0"))
+
+_stats = {"runs": 0, "assigned": 0, "lost_races": 0, "unmatched": 0, "errors": 0, "last_run_ms": 0.0}
+
+# Assignment yang hasilnya belum diketahui: order_id -> user_id driver (driver tetap di-claim).
+# In-memory: service dijalankan 1 worker; kalau proses restart, driver yang tersangkut bisa dibebaskan
+# lewat complete / cancel order seperti biasa.
+_unresolved = {}
+_unresolved_lock = threading.Lock()
+
+def score(distance_km: float, recent_load: int, idle_seconds: float) -> float:
+    """Biaya pasangan order-driver (lebih kecil lebih baik)."""
+    idle_bonus = min(idle_seconds / 60.0 * WEIGHT_IDLE_PER_MINUTE, MAX_IDLE_BONUS)
+    return distance_km * WEIGHT_DISTANCE + recent_load * WEIGHT_LOAD - idle_bonus
+
+def solve(edges) -> list:
+    """
+    `edges`: [(cost, order_id, driver_user_id)]. Return pasangan terpilih [(order_id, driver_user_id, cost)].
+    Greedy global dari biaya termurah: O(E log E), cukup dekat ke optimal untuk graf k-nearest yang jarang.
+    """
+    taken_orders, taken_drivers, result = set(), set(), []
+    for cost, order_id, driver_id in sorted(edges):
+        if order_id in taken_orders or driver_id in taken_drivers:
+            continue
+        taken_orders.add(order_id)
+        taken_drivers.add(driver_id)
+        result.append((order_id, driver_id, cost))
+    return result
+
+def _fetch_queue() -> list:
+    res = http_client.get(f"{ORDER_SERVICE_URL}/internal/orders/dispatch-queue", params={"limit": DISPATCH_BATCH_SIZE})
+    res.raise_for_status()
+    return res.json()['data']
+
+def _driver_profiles(db: Session, user_ids) -> dict:
+    """Driver bebas + beban & waktu assignment terakhir, masing-masing satu query grouped."""
+    if not user_ids:
+        return {}
+    drivers = {
+        d.user_id: d for d in db.query(Driver).filter(
+            Driver.user_id.in_(list(user_ids)), Driver.is_on_job == False, Driver.is_available == True
+        ).all()
+    }
+    if not drivers:
+        return {}
+    driver_ids = {d.id: d.user_id for d in drivers.values()}
+    since = datetime.utcnow() - timedelta(minutes=DISPATCH_LOAD_WINDOW_MINUTES)
+    load = dict(
+        db.query(DeliveryTask.driver_id, func.count(DeliveryTask.id))
+        .filter(DeliveryTask.driver_id.in_(list(driver_ids)), DeliveryTask.created_at >= since)
+        .group_by(DeliveryTask.driver_id).all()
+    )
+    last_task = dict(
+        db.query(DeliveryTask.driver_id, func.max(DeliveryTask.updated_at))
+        .filter(DeliveryTask.driver_id.in_(list(driver_ids)))
+        .group_by(DeliveryTask.driver_id).all()
+    )
+    now = datetime.utcnow()
+    profiles = {}
+    for driver_id, user_id in driver_ids.items():
+        last = last_task.get(driver_id)
+        if last is not None and last.tzinfo is not None:
+            last = last.replace(tzinfo=None)
+        profiles[user_id] = {
+            "driver": drivers[user_id],
+            "recent_load": load.get(driver_id, 0),
+            # Belum pernah dapat task -> dianggap menganggur maksimal
+            "idle_seconds": (now - last).total_seconds() if last else float("inf")
+        }
+    return profiles
+
+def _claim_driver(db: Session, driver: Driver) -> bool:
+    claimed = db.query(Driver).filter(Driver.id == driver.id, Driver.is_on_job == False).update(
+        {Driver.is_on_job: True, Driver.is_available: False}, synchronize_session=False
+    )
+    db.commit()
+    return claimed == 1
+
+def _release_driver(db: Session, driver: Driver):
+    db.query(Driver).filter(Driver.id == driver.id).update(
+        {Driver.is_on_job: False, Driver.is_available: True}, synchronize_session=False
+    )
+    db.commit()
+
+def defer(order_id: int, user_id: int):
+    """Tandai assignment yang hasilnya tidak diketahui, diselesaikan oleh reconcile()."""
+    with _unresolved_lock:
+        _unresolved[order_id] = user_id
+
+def _post_assignments(pairs):
+    """
+    Assign [(order_id, user_id)] di Order Service. Return {order_id: assigned}, atau None kalau
+    hasilnya tidak diketahui (timeout / koneksi putus / 5xx). Endpoint idempotent -> aman di-retry.
+    """
+    try:
+        res = http_client.post(
+            f"{ORDER_SERVICE_URL}/internal/orders/assignments",
+            json={"assignments": [{"order_id": o, "driver_id": d} for o, d in pairs]},
+            retry=True
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Dispatch assignment outcome unknown for {len(pairs)} orders: {e}")
+        return None
+    if res.status_code >= 500:
+        print(f"Dispatch assignment outcome unknown for {len(pairs)} orders: {res.status_code}")
+        return None
+    res.raise_for_status() # 4xx -> request ditolak utuh, tidak ada yang di-assign
+    return {r['order_id']: r['assigned'] for r in res.json()['data']}
+
+def _settle(db: Session, pairs, results: dict, summary: dict):
+    """Buat task untuk pasangan yang berhasil, lepas driver yang kalah. Commit."""
+    drivers = {
+        d.user_id: d for d in db.query(Driver).filter(Driver.user_id.in_([u for _, u in pairs])).all()
+    }
+    for order_id, user_id in pairs:
+        driver = drivers.get(user_id)
+        if driver is None:
+            continue
+        if results.get(order_id):
+            db.add(DeliveryTask(order_id=order_id, driver_id=driver.id, status="ASSIGNED"))
+            summary["assigned"] += 1
+        else:
+            _release_driver(db, driver) # Order keburu diambil manual / dibatalkan
+            summary["lost_races"] += 1
+    db.commit()
+
+def reconcile(db: Session, summary: dict = None) -> dict:
+    """Kirim ulang assignment yang hasilnya belum diketahui sampai hasilnya jelas."""
+    summary = summary if summary is not None else {"assigned": 0, "lost_races": 0}
+    with _unresolved_lock:
+        pairs = list(_unresolved.items())
+    if not pairs:
+        return summary
+    results = _post_assignments(pairs)
+    if results is None:
+        return summary # Masih belum bisa dipastikan, coba lagi putaran berikutnya
+    with _unresolved_lock:
+        for order_id, user_id in pairs:
+            if _unresolved.get(order_id) == user_id:
+                del _unresolved[order_id]
+    _settle(db, pairs, results, summary)
+    return summary
+
+def run_once(db: Session) -> dict:
+    started = time.perf_counter()
+    summary = {"orders": 0, "assigned": 0, "lost_races": 0, "unmatched": 0}
+
+    reconcile(db, summary)
+    orders = _fetch_queue()
+    with _unresolved_lock:
+        # Order yang assignment-nya belum jelas jangan dicocokkan ke driver lain
+        orders = [o for o in orders if o['id'] not in _unresolved]
+    summary["orders"] = len(orders)
+    if not orders:
+        return summary
+
+    # Kandidat dari index grid (tanpa scan tabel drivers)
+    nearby = {}
+    for o in orders:
+        nearby[o['id']] = locations.nearest(
+            o['pickup_latitude'], o['pickup_longitude'], DISPATCH_CANDIDATES_PER_ORDER, DISPATCH_RADIUS_KM
+        )
+    profiles = _driver_profiles(db, {user_id for pairs in nearby.values() for _, user_id in pairs})
+
+    edges = [
+        (score(distance, profiles[user_id]["recent_load"], profiles[user_id]["idle_seconds"]), order_id, user_id)
+        for order_id, pairs in nearby.items()
+        for distance, user_id in pairs if user_id in profiles
+    ]
+    matches = solve(edges)
+    summary["unmatched"] = len(orders) - len(matches)
+
+    # Claim driver dulu (DB lokal), baru assign order di Order Service dalam satu request bulk
+    claimed = []
+    for order_id, user_id, _ in matches:
+        if _claim_driver(db, profiles[user_id]["driver"]):
+            claimed.append((order_id, user_id))
+        else:
+            summary["lost_races"] += 1
+
+    if claimed:
+        try:
+            results = _post_assignments(claimed)
+        except Exception:
+            # Ditolak Order Service (4xx / response rusak) -> pasti tidak ada yang di-assign
+            for _, user_id in claimed:
+                _release_driver(db, profiles[user_id]["driver"])
+            raise
+        if results is None:
+            for order_id, user_id in claimed:
+                defer(order_id, user_id)
+        else:
+            _settle(db, claimed, results, summary)
+
+    _stats["runs"] += 1
+    _stats["assigned"] += summary["assigned"]
+    _stats["lost_races"] += summary["lost_races"]
+    _stats["unmatched"] += summary["unmatched"]
+    _stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
+
+def dispatch_loop(session_factory):
+    while True:
+        time.sleep(DISPATCH_INTERVAL_SECONDS)
+        db = session_factory()
+        try:
+            summary = run_once(db) if DISPATCH_ENABLED else reconcile(db)
+            if summary["assigned"] or summary["lost_races"]:
+                print(f"Dispatch: {summary}")
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"Dispatch run failed: {e}")
+        finally:
+            db.close()
+
+def stats() -> dict:
+    with _unresolved_lock:
+        unresolved = len(_unresolved)
+    return dict(_stats, enabled=DISPATCH_ENABLED, unresolved=unresolved)
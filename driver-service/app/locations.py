@@ -0,0 +1,274 @@
+"""
+Pipeline lokasi driver.
+
+    POST /drivers/location/pings (batch titik dari device)
+        -> PositionStore  : posisi terakhir per driver di array paralel (in-memory, tanpa DB per ping)
+        -> TrackBuffer    : titik jejak yang sudah di-downsample (jarak / interval minimum)
+    flush_loop (thread)   : tiap DRIVER_TRACK_FLUSH_SECONDS -> buang posisi basi, bulk INSERT jejak
+                            + bulk UPDATE posisi terakhir di tabel drivers (untuk rebuild saat restart)
+
+Key semua struktur = user id driver (sama dengan Order.driver_id).
+Store hanya hidup di satu proses (service dijalankan 1 worker uvicorn).
+"""
+import math
+import os
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import insert, update, bindparam
+from sqlalchemy.orm import Session
+from .models import Driver, DriverLocationTrack
+from .geo import GeoIndex, haversine_km, valid_coordinates
+
+STALE_AFTER_SECONDS = float(os.getenv("DRIVER_LOCATION_STALE_SECONDS", "120"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("DRIVER_TRACK_FLUSH_SECONDS", "10"))
+TRACK_MIN_INTERVAL_SECONDS = float(os.getenv("DRIVER_TRACK_MIN_INTERVAL_SECONDS", "15"))
+TRACK_MIN_DISTANCE_KM = float(os.getenv("DRIVER_TRACK_MIN_DISTANCE_M", "50")) / 1000
+MAX_PENDING_TRACK_POINTS = int(os.getenv("DRIVER_TRACK_MAX_PENDING", "50000"))
+MAX_PINGS_PER_REQUEST = 100
+MAX_CLOCK_SKEW_SECONDS = 30
+
+_NAN = float("nan")
+
+# Satu titik dari device; ts = epoch detik (None -> waktu server)
+Ping = namedtuple("Ping", "lat lng ts heading speed", defaults=(None, None, None))
+
+def _optional(value: float):
+    return None if math.isnan(value) else value
+
+class PositionStore:
+    """
+    Posisi terakhir per driver. Data disimpan di array paralel (satu slot per driver) supaya
+    ribuan driver tidak menjadi ribuan objek dict; slot yang dibebaskan dipakai ulang.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._slots = {} # driver_id -> index slot
+        self._free = []
+        self._ids = array("q", [0]) * capacity
+        self._lat = array("d", [0.0]) * capacity
+        self._lng = array("d", [0.0]) * capacity
+        self._ts = array("d", [0.0]) * capacity # epoch detik posisi (waktu device)
+        self._heading = array("f", [_NAN]) * capacity
+        self._speed = array("f", [_NAN]) * capacity
+        self._used = 0 # slot tertinggi yang pernah dipakai
+        self.geo = GeoIndex() # Untuk query driver terdekat
+        self.updates = 0
+        self.evictions = 0
+
+    def _allocate(self, driver_id: int) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._used == len(self._ids):
+                grow = len(self._ids) # Kapasitas x2
+                for arr, fill in ((self._ids, 0), (self._lat, 0.0), (self._lng, 0.0), (self._ts, 0.0),
+                                  (self._heading, _NAN), (self._speed, _NAN)):
+                    arr.extend(array(arr.typecode, [fill]) * grow)
+            slot = self._used
+            self._used += 1
+        self._slots[driver_id] = slot
+        self._ids[slot] = driver_id
+        return slot
+
+    def update(self, driver_id: int, lat: float, lng: float, ts: float, heading: float = None, speed: float = None) -> bool:
+        """Simpan posisi kalau lebih baru dari yang tersimpan (ping bisa datang tidak berurutan)."""
+        with self._lock:
+            slot = self._slots.get(driver_id)
+            if slot is None:
+                slot = self._allocate(driver_id)
+            elif ts <= self._ts[slot]:
+                return False
+            self._lat[slot] = lat
+            self._lng[slot] = lng
+            self._ts[slot] = ts
+            self._heading[slot] = _NAN if heading is None else heading
+            self._speed[slot] = _NAN if speed is None else speed
+            self.updates += 1
+        self.geo.upsert(driver_id, lat, lng)
+        return True
+
+    def get(self, driver_id: int, max_age: float = STALE_AFTER_SECONDS):
+        with self._lock:
+            slot = self._slots.get(driver_id)
+            if slot is None:
+                return None
+            age = time.time() - self._ts[slot]
+            if age > max_age:
+                return None
+            return {
+                "latitude": self._lat[slot],
+                "longitude": self._lng[slot],
+                "heading": _optional(self._heading[slot]),
+                "speed": _optional(self._speed[slot]),
+                "updated_at": datetime.utcfromtimestamp(self._ts[slot]),
+                "age_seconds": round(max(age, 0.0), 1)
+            }
+
+    def evict_stale(self, max_age: float = STALE_AFTER_SECONDS) -> int:
+        cutoff = time.time() - max_age
+        with self._lock:
+            stale = [(self._ids[slot], slot) for slot in self._slots.values() if self._ts[slot] < cutoff]
+            for driver_id, slot in stale:
+                del self._slots[driver_id]
+                self._free.append(slot)
+            self.evictions += len(stale)
+        for driver_id, _ in stale:
+            self.geo.remove(driver_id)
+        return len(stale)
+
+    def snapshot(self, driver_ids) -> list:
+        """[(driver_id, lat, lng, ts)] untuk driver yang masih ada di store."""
+        with self._lock:
+            return [
+                (driver_id, self._lat[slot], self._lng[slot], self._ts[slot])
+                for driver_id, slot in ((d, self._slots.get(d)) for d in driver_ids) if slot is not None
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "drivers": len(self._slots),
+                "capacity": len(self._ids),
+                "updates": self.updates,
+                "evictions": self.evictions
+            }
+
+class TrackBuffer:
+    """Titik jejak yang menunggu di-flush. Titik baru hanya disimpan kalau cukup jauh / cukup lama dari titik sebelumnya."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_kept = {} # driver_id -> (ts, lat, lng)
+        self._dirty = set() # driver yang posisi terakhirnya belum ditulis ke tabel drivers
+        self.dropped = 0
+
+    def add(self, driver_id: int, lat: float, lng: float, ts: float, heading: float = None, speed: float = None) -> bool:
+        with self._lock:
+            self._dirty.add(driver_id)
+            last = self._last_kept.get(driver_id)
+            if last is not None:
+                if ts <= last[0]:
+                    return False # Titik lama / duplikat
+                if ts - last[0] < TRACK_MIN_INTERVAL_SECONDS and haversine_km(last[1], last[2], lat, lng) < TRACK_MIN_DISTANCE_KM:
+                    return False
+            self._last_kept[driver_id] = (ts, lat, lng)
+            self._pending.append({
+                "driver_user_id": driver_id,
+                "latitude": lat,
+                "longitude": lng,
+                "heading": heading,
+                "speed": speed,
+                "recorded_at": datetime.utcfromtimestamp(ts)
+            })
+            return True
+
+    def drain(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+            dirty, self._dirty = self._dirty, set()
+            return rows, dirty
+
+    def requeue(self, rows: list, dirty: set):
+        """Kembalikan data yang gagal di-flush (yang paling lama dibuang kalau melebihi batas)."""
+        with self._lock:
+            self._pending = rows + self._pending
+            overflow = len(self._pending) - MAX_PENDING_TRACK_POINTS
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+            self._dirty |= dirty
+
+    def forget(self, max_age: float):
+        cutoff = time.time() - max_age
+        with self._lock:
+            for driver_id in [d for d, last in self._last_kept.items() if last[0] < cutoff]:
+                del self._last_kept[driver_id]
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+store = PositionStore()
+tracks = TrackBuffer()
+
+def ingest(driver_id: int, points) -> dict:
+    """
+    `points`: objek dengan atribut lat, lng, ts (epoch detik, opsional), heading, speed.
+    Return ringkasan: jumlah titik diterima, disimpan sebagai jejak, dan apakah posisi terakhir berubah.
+    """
+    now = time.time()
+    kept = 0
+    latest = None
+    for p in sorted(points, key=lambda p: p.ts or now):
+        ts = min(p.ts or now, now + MAX_CLOCK_SKEW_SECONDS) # Jam device terlalu maju -> pakai jam server
+        if tracks.add(driver_id, p.lat, p.lng, ts, p.heading, p.speed):
+            kept += 1
+        latest = (p, ts)
+    moved = False
+    if latest is not None:
+        p, ts = latest
+        moved = store.update(driver_id, p.lat, p.lng, ts, p.heading, p.speed)
+    return {"received": len(points), "track_points": kept, "position_updated": moved}
+
+def flush(db: Session) -> dict:
+    """Bulk INSERT jejak + bulk UPDATE posisi terakhir. Data dikembalikan ke buffer kalau gagal."""
+    rows, dirty = tracks.drain()
+    positions = store.snapshot(dirty)
+    if not rows and not positions:
+        return {"track_points": 0, "positions": 0}
+    try:
+        if rows:
+            db.execute(insert(DriverLocationTrack), rows)
+        if positions:
+            drivers = Driver.__table__
+            db.execute(
+                update(drivers).where(drivers.c.user_id == bindparam("b_user_id")).values(
+                    latitude=bindparam("b_lat"), longitude=bindparam("b_lng"), location_updated_at=bindparam("b_at")
+                ),
+                [
+                    {"b_user_id": d, "b_lat": lat, "b_lng": lng, "b_at": datetime.utcfromtimestamp(ts)}
+                    for d, lat, lng, ts in positions
+                ]
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        tracks.requeue(rows, dirty)
+        raise
+    return {"track_points": len(rows), "positions": len(positions)}
+
+def flush_loop(session_factory):
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        store.evict_stale()
+        tracks.forget(STALE_AFTER_SECONDS)
+        db = session_factory()
+        try:
+            flush(db)
+        except Exception as e:
+            print(f"Driver location flush failed: {e}")
+        finally:
+            db.close()
+
+def build_from_db(db: Session) -> int:
+    """Isi store dari posisi terakhir yang sudah di-flush (hanya yang belum basi)."""
+    rows = db.query(Driver.user_id, Driver.latitude, Driver.longitude, Driver.location_updated_at).filter(
+        Driver.latitude.isnot(None), Driver.longitude.isnot(None), Driver.location_updated_at.isnot(None)
+    ).all()
+    loaded = 0
+    for user_id, lat, lng, updated_at in rows:
+        ts = (updated_at - datetime(1970, 1, 1)).total_seconds()
+        if valid_coordinates(lat, lng) and time.time() - ts <= STALE_AFTER_SECONDS:
+            loaded += store.update(user_id, lat, lng, ts)
+    return loaded
+
+def nearest(lat: float, lng: float, k: int, radius_km: float) -> list:
+    return store.geo.nearest(lat, lng, k, max_radius_km=radius_km)
+
+def stats() -> dict:
+    return dict(store.stats(), pending_track_points=tracks.pending(), dropped_track_points=tracks.dropped)
@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from strawberry.fastapi import GraphQLRouter
 from .database import engine, Base
 from .schema import schema
+from . import http_client
 
 Base.metadata.create_all(bind=engine)
 
@@ -19,64 +20,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Header
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
+from sqlalchemy.exc import IntegrityError
 from .database import get_db
 from . import models
-from pydantic import BaseModel
+from . import locations
+from . import dispatch
+from .database import SessionLocal
+from .geo import valid_coordinates
+from .schema import token_verifier
+from .auth import AuthError
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import datetime
+import threading
+import os
 
-@app.get("/drivers/admin/all")
-def get_all_drivers_admin(db: Session = Depends(get_db)):
-    drivers = db.query(models.Driver).all()
-    
-    # Fetch User Service for Names
+USER_SERVICE_URL = "http://user-service:8000"
+USER_BATCH_SIZE = 200
+
+def _fetch_user_map(user_ids) -> dict:
+    # Ambil hanya user yang dibutuhkan lewat endpoint batch (bukan /users/admin/all)
     user_map = {}
-    try:
-        # Assuming User Service is internal safe
-        # In Docker: http://user-service:8000
-        USER_SERVICE_URL = "http://user-service:8000"
-        # Ideally, we call a bulk endpoint or get_all_users
-        import requests
-        res = requests.get(f"{USER_SERVICE_URL}/users/admin/all") # Returns all users
-        if res.status_code == 200:
-            users_data = res.json().get('data', []) # Correctly access 'data' list
-            for u in users_data:
-                user_map[u['id']] = u
-    except Exception as e:
-        print(f"Failed to fetch users: {e}")
+    id_list = sorted(set(user_ids))
+    for n in range(0, len(id_list), USER_BATCH_SIZE):
+        chunk = id_list[n:n + USER_BATCH_SIZE]
+        try:
+            res = http_client.get(
+                f"{USER_SERVICE_URL}/internal/users/batch",
+                params={"ids": ",".join(str(i) for i in chunk)}
+            )
+            if res.status_code == 200:
+                for u in res.json().get('data', []):
+                    user_map[u['id']] = u
+        except Exception as e:
+            print(f"Failed to fetch users: {e}")
+    return user_map
 
-    results = []
-    
-    # Pre-fetch Order Data to avoid N+1 if possible, but for MVP loop is okay
-    # Need to be careful about performance, but robust logic is priority now.
-    
-    ORDER_SERVICE_URL = "http://order-service:8000"
+ORDER_SERVICE_URL = "http://order-service:8000"
+ADMIN_DRIVERS_CHUNK = 200 # <= batas ids endpoint batch user & active-counts
+ADMIN_DRIVERS_MAX_LIMIT = 500
+
+def _fetch_active_order_counts(user_ids):
+    """{user_id: jumlah order aktif} lewat satu panggilan per chunk (GROUP BY di Order Service).
+    None kalau Order Service gagal -> status on-job dari DB lokal yang dipakai."""
+    counts = {}
+    id_list = sorted(set(user_ids))
+    for n in range(0, len(id_list), ADMIN_DRIVERS_CHUNK):
+        chunk = id_list[n:n + ADMIN_DRIVERS_CHUNK]
+        try:
+            res = http_client.get(
+                f"{ORDER_SERVICE_URL}/internal/orders/drivers/active-counts",
+                params={"ids": ",".join(str(i) for i in chunk)}
+            )
+            if res.status_code != 200:
+                return None
+            for row in res.json().get('data', []):
+                counts[row['driver_id']] = row['active_orders']
+        except Exception as e:
+            print(f"Failed to fetch active order counts: {e}")
+            return None
+    return counts
+
+def _driver_admin_rows(db: Session, drivers) -> list:
+    # Satu query SUM gaji (GROUP BY) + satu batch user + satu batch order aktif untuk semua driver di chunk
+    user_ids = [d.user_id for d in drivers]
+    user_map = _fetch_user_map(user_ids)
+    active_counts = _fetch_active_order_counts(user_ids)
+    paid_map = dict(
+        db.query(models.DriverSalary.driver_id, func.sum(models.DriverSalary.total_earnings))
+        .filter(models.DriverSalary.driver_id.in_([d.id for d in drivers]))
+        .group_by(models.DriverSalary.driver_id)
+        .all()
+    )
 
+    results = []
     for d in drivers:
         u_data = user_map.get(d.user_id, {})
         
-        # Check Active Orders from Order Service (Legacy Logic)
+        # Order Service memakai User ID sebagai driver_id.
+        # Sync status: If active orders > 0, they are ON JOB (fallback ke DB lokal kalau Order Service gagal)
         active_orders_count = 0
         real_time_on_job = d.is_on_job
-        
-        try:
-            # We assume Order Service uses User ID as driver_id
-            order_res = requests.get(f"{ORDER_SERVICE_URL}/internal/orders/driver/{d.user_id}")
-            if order_res.status_code == 200:
-                orders_data = order_res.json().get('data', [])
-                active_orders_count = len(orders_data)
-                # Sync status: If active orders > 0, they are ON JOB.
-                if active_orders_count > 0:
-                    real_time_on_job = True
-                else:
-                    real_time_on_job = False # Free if no orders
-        except Exception as e:
-            print(f"Failed to fetch orders for driver {d.user_id}: {e}")
+        if active_counts is not None:
+            active_orders_count = active_counts.get(d.user_id, 0)
+            real_time_on_job = active_orders_count > 0
 
         # Calculate Lifetime Earnings
-        paid_earnings = float(db.query(func.sum(models.DriverSalary.total_earnings)).filter(models.DriverSalary.driver_id == d.id).scalar() or 0)
+        paid_earnings = float(paid_map.get(d.id) or 0)
         current_wallet = float(d.total_earnings or 0) # Wallet (Unpaid)
         
         # User requested "Total Paid" (excluding unpaid/wallet) in Track Drivers
@@ -98,7 +131,32 @@ def get_all_drivers_admin(db: Session = Depends(get_db)):
             "email": u_data.get('email', '-'),
             "active_orders": active_orders_count 
         })
-    return {"status": "success", "data": results}
+    return results
+
+@app.get("/drivers/admin/all")
+def get_all_drivers_admin(after_id: int = 0, limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Keyset pagination (?after_id=&limit=), sama seperti /users/admin/all.
+    Tanpa limit -> semua driver (kompatibel dengan frontend lama), tetap diproses per chunk
+    sehingga jumlah round trip per chunk konstan, bukan per driver.
+    """
+    if limit is not None and not (1 <= limit <= ADMIN_DRIVERS_MAX_LIMIT):
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {ADMIN_DRIVERS_MAX_LIMIT}")
+
+    results = []
+    last_id = after_id
+    while True:
+        size = ADMIN_DRIVERS_CHUNK if limit is None else min(ADMIN_DRIVERS_CHUNK, limit - len(results))
+        drivers = db.query(models.Driver).filter(models.Driver.id > last_id).order_by(models.Driver.id).limit(size).all()
+        if not drivers:
+            break
+        results.extend(_driver_admin_rows(db, drivers))
+        last_id = drivers[-1].id
+        if len(drivers) < size or (limit is not None and len(results) >= limit):
+            break
+
+    next_after_id = last_id if limit is not None and len(results) == limit else None
+    return {"status": "success", "data": results, "next_after_id": next_after_id}
 
 @app.get("/drivers/admin/salaries")
 def get_driver_salaries(db: Session = Depends(get_db)):
@@ -111,9 +169,32 @@ class EarningRequest(BaseModel):
     amount: float
     order_id: int
 
+def _complete_task(db: Session, driver: models.Driver, order_id: int):
+    db.query(models.DeliveryTask).filter(
+        models.DeliveryTask.driver_id == driver.id,
+        models.DeliveryTask.order_id == order_id,
+        models.DeliveryTask.status == "ASSIGNED"
+    ).update({models.DeliveryTask.status: "COMPLETED"}, synchronize_session=False)
+    still_active = db.query(models.DeliveryTask.id).filter(
+        models.DeliveryTask.driver_id == driver.id, models.DeliveryTask.status == "ASSIGNED"
+    ).first()
+    if not still_active:
+        driver.is_on_job = False
+        driver.is_available = True
+
 @app.post("/internal/drivers/earnings")
-def add_driver_earning(req: EarningRequest, db: Session = Depends(get_db)):
+def add_driver_earning(
+    req: EarningRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db)
+):
     print(f"DEBUG: Received Earning Request for User {req.user_id}, Amount {req.amount}")
+
+    # Dikirim oleh outbox Order Service (at-least-once) -> kiriman ulang tidak boleh menambah saldo lagi
+    if idempotency_key and db.get(models.ProcessedEvent, idempotency_key):
+        driver = db.query(models.Driver).filter(models.Driver.user_id == req.user_id).first()
+        balance = float(driver.total_earnings or 0) if driver else 0.0
+        return {"status": "success", "message": "Earning already recorded", "new_balance": balance}
     
     # 1. Update Earnings in Driver Table
     driver = db.query(models.Driver).filter(models.Driver.user_id == req.user_id).first()
@@ -129,11 +210,21 @@ def add_driver_earning(req: EarningRequest, db: Session = Depends(get_db)):
         db.add(driver)
         db.commit()
     
+    # Order selesai -> task selesai & driver bebas lagi untuk dispatcher
+    _complete_task(db, driver, req.order_id)
+
     # Update Wallet (total_earnings is the UNPAID wallet in Legacy match)
     old_earnings = float(driver.total_earnings or 0)
     driver.total_earnings = float(driver.total_earnings or 0) + req.amount
+    if idempotency_key:
+        db.add(models.ProcessedEvent(idempotency_key=idempotency_key)) # Satu transaksi dengan saldo
     
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Kiriman ulang yang balapan dengan kiriman pertama: sudah tercatat di sana
+        db.rollback()
+        return {"status": "success", "message": "Earning already recorded", "new_balance": float(driver.total_earnings or 0)}
     db.refresh(driver)
     
     print(f"DEBUG: Updated Driver {driver.id} (User {req.user_id}). Earnings: {old_earnings} -> {driver.total_earnings}")
@@ -197,7 +288,182 @@ def reset_driver_data(db: Session = Depends(get_db)):
     db.commit()
     return {"status": "success", "message": "Driver data reset"}
 
+# --- LOKASI DRIVER ---
+
+def get_current_user(authorization: str = Header(None)) -> dict:
+    try:
+        principal = token_verifier.principal(authorization)
+    except AuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return dict(principal.claims, id=principal.id)
+
+class LocationPing(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
+    ts: Optional[float] = None # Epoch detik dari device
+    heading: Optional[float] = None
+    speed: Optional[float] = None
+
+class LocationPingBatch(BaseModel):
+    points: List[LocationPing]
+
+@app.on_event("startup")
+def start_location_pipeline():
+    db = SessionLocal()
+    try:
+        print(f"Driver position store loaded: {locations.build_from_db(db)} drivers")
+    except Exception as e:
+        print(f"Failed to load driver positions: {e}")
+    finally:
+        db.close()
+    threading.Thread(target=locations.flush_loop, args=(SessionLocal,), daemon=True).start()
+
+# Ping lokasi dari app driver (boleh beberapa titik sekaligus). Tidak menyentuh DB,
+# posisi & jejak di-flush berkala oleh locations.flush_loop
+@app.post("/drivers/location/pings")
+def ingest_location_pings(batch: LocationPingBatch, user: dict = Depends(get_current_user)):
+    if user.get("role") != "DRIVER":
+        raise HTTPException(status_code=403, detail="Only drivers can send location")
+    if not batch.points or len(batch.points) > locations.MAX_PINGS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {locations.MAX_PINGS_PER_REQUEST} points")
+    result = locations.ingest(user["id"], batch.points)
+    return {"status": "success", "data": result}
+
+# Posisi terakhir driver (user id), dibaca dari memori
+@app.get("/internal/drivers/{user_id}/location")
+def get_driver_location_internal(user_id: int):
+    # data null kalau driver belum mengirim ping / posisinya sudah basi
+    return {"status": "success", "data": locations.store.get(user_id)}
+
+@app.get("/internal/drivers/locations/stats")
+def get_location_stats():
+    return {"status": "success", "data": locations.stats()}
+
+# Driver terdekat dari suatu titik (mis. restoran), dari index grid in-memory
+@app.get("/internal/drivers/nearest")
+def get_nearest_drivers(lat: float, lng: float, k: int = 5, radius_km: float = 10, available_only: bool = True, db: Session = Depends(get_db)):
+    if not valid_coordinates(lat, lng) or not (1 <= k <= 100) or radius_km <= 0:
+        raise HTTPException(status_code=400, detail="Invalid lat/lng, k (1-100) or radius_km")
+
+    # Ambil kandidat lebih banyak kalau perlu disaring status available-nya
+    candidates = locations.nearest(lat, lng, k * 4 if available_only else k, radius_km)
+    drivers = {}
+    if candidates:
+        query = db.query(models.Driver).filter(models.Driver.user_id.in_([user_id for _, user_id in candidates]))
+        if available_only:
+            query = query.filter(models.Driver.is_available == True, models.Driver.is_on_job == False)
+        drivers = {d.user_id: d for d in query.all()}
+
+    results = []
+    for distance, user_id in candidates:
+        driver = drivers.get(user_id)
+        position = locations.store.get(user_id)
+        if driver is None or position is None:
+            continue
+        results.append({
+            "driver_id": driver.id,
+            "user_id": driver.user_id,
+            "latitude": position["latitude"],
+            "longitude": position["longitude"],
+            "location_updated_at": position["updated_at"],
+            "distance_km": round(distance, 3)
+        })
+        if len(results) == k:
+            break
+    return {"status": "success", "data": results}
+
+# --- DISPATCH ---
+
+class TaskRequest(BaseModel):
+    user_id: int
+    order_id: int
+
+# Tetap jalan walau DISPATCH_ENABLED=false: menyelesaikan assignment yang hasilnya belum diketahui
+@app.on_event("startup")
+def start_dispatcher():
+    threading.Thread(target=dispatch.dispatch_loop, args=(SessionLocal,), daemon=True).start()
+
+# Order diambil manual lewat Order Service (/orders/{id}/accept) -> catat task & tandai on job
+@app.post("/internal/drivers/tasks")
+def register_delivery_task(req: TaskRequest, db: Session = Depends(get_db)):
+    driver = db.query(models.Driver).filter(models.Driver.user_id == req.user_id).first()
+    if not driver:
+        raise HTTPException(status_code=404, detail="Driver profile not found")
+    task = db.query(models.DeliveryTask).filter(
+        models.DeliveryTask.order_id == req.order_id, models.DeliveryTask.driver_id == driver.id
+    ).first()
+    if not task: # Idempotent kalau request di-retry
+        task = models.DeliveryTask(order_id=req.order_id, driver_id=driver.id, status="ASSIGNED")
+        db.add(task)
+    if task.status == "ASSIGNED": # Kiriman ulang yang datang setelah order selesai tidak mengunci driver lagi
+        driver.is_on_job = True
+        driver.is_available = False
+    db.commit()
+    return {"status": "success", "data": {"task_id": task.id, "driver_id": driver.id}}
+
+# Jalankan satu putaran dispatch sekarang (admin / testing)
+@app.post("/internal/dispatch/run")
+def run_dispatch_now(db: Session = Depends(get_db)):
+    try:
+        return {"status": "success", "data": dispatch.run_once(db)}
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Dispatch failed: {e}")
+
+@app.get("/internal/dispatch/stats")
+def get_dispatch_stats():
+    return {"status": "success", "data": dispatch.stats()}
+
+# Statistik client HTTP internal (latency/error per upstream)
+@app.get("/internal/upstream-stats")
+def get_upstream_stats():
+    return {"status": "success", "data": http_client.stats()}
+
+DRIVER_DISPLAY_TTL_SECONDS = float(os.getenv("DRIVER_DISPLAY_TTL_SECONDS", "3600"))
+
+def _save_driver_display(db: Session, user_id: int, name: str, phone: Optional[str]):
+    row = db.get(models.DriverDisplayCache, user_id)
+    if row is None:
+        row = models.DriverDisplayCache(user_id=user_id)
+        db.add(row)
+    row.name = name
+    row.phone = phone
+    row.synced_at = datetime.datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback() # Request lain baru saja mengisi cache untuk driver yang sama
+
+def _driver_display(db: Session, user_id: int):
+    """(name, phone) dari cache lokal; miss / lewat TTL -> satu lookup by id ke User Service."""
+    row = db.get(models.DriverDisplayCache, user_id)
+    now = datetime.datetime.utcnow()
+    if row is not None and row.synced_at > now - datetime.timedelta(seconds=DRIVER_DISPLAY_TTL_SECONDS):
+        return row.name, row.phone
+
+    try:
+        res = http_client.get(f"{USER_SERVICE_URL}/internal/users/{user_id}")
+        if res.status_code == 200:
+            user_info = res.json()['data']
+            _save_driver_display(db, user_id, user_info['name'], user_info.get('phone'))
+            return user_info['name'], user_info.get('phone')
+    except Exception as e:
+        print(f"Failed to fetch user {user_id}: {e}")
+    if row is not None:
+        return row.name, row.phone # Data basi lebih baik daripada default
+    return None
+
+class DriverDisplayUpdate(BaseModel):
+    name: str
+    phone: Optional[str] = None
+
+# Dipanggil User Service saat profil (nama / telepon) driver berubah
+@app.put("/internal/drivers/{user_id}/display")
+def update_driver_display_internal(user_id: int, req: DriverDisplayUpdate, db: Session = Depends(get_db)):
+    _save_driver_display(db, user_id, req.name, req.phone)
+    return {"status": "success"}
+
 # Internal Endpoint for Order Service to fetch Driver Details
+# Nama & telepon dari driver_display_cache (tanpa panggil User Service selama cache masih segar)
 @app.get("/internal/drivers/details/{user_id}")
 def get_driver_details_internal(user_id: int, db: Session = Depends(get_db)):
     driver = db.query(models.Driver).filter(models.Driver.user_id == user_id).first()
@@ -214,20 +480,13 @@ def get_driver_details_internal(user_id: int, db: Session = Depends(get_db)):
         data["vehicle"] = f"{driver.vehicle_type} ({driver.vehicle_number})"
         data["vehicle_number"] = driver.vehicle_number
         data["vehicle_type"] = driver.vehicle_type
+
+    # Posisi terakhir dari store in-memory (None kalau belum ada ping / sudah basi)
+    data["location"] = locations.store.get(user_id)
     
-    # Fetch Name/Phone from User Service
-    try:
-        USER_SERVICE_URL = "http://user-service:8000"
-        import requests
-        res = requests.get(f"{USER_SERVICE_URL}/users/admin/all") # Fallback to admin/all if no direct internal detail
-        # Ideally we'd have a lighter endpoint, but this works for MVP cache
-        if res.status_code == 200:
-            users = res.json()['data']
-            user_info = next((u for u in users if u['id'] == user_id), None)
-            if user_info:
-                data["name"] = user_info['name']
-                data["phone"] = user_info.get('phone', '-')
-    except Exception as e:
-        print(f"Failed to fetch user details for driver: {e}")
+    display = _driver_display(db, user_id)
+    if display:
+        data["name"] = display[0]
+        data["phone"] = display[1] or '-'
         
     return data
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DECIMAL, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DECIMAL, ForeignKey, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -19,6 +19,11 @@ class Driver(Base):
     # LEGACY COMPATIBILITY: total_earnings IS THE WALLET (UNPAID AMOUNT).
     # It gets reset to 0 after salary payment.
     total_earnings = Column(DECIMAL(10, 2), default=0.00) 
+
+    # Posisi terakhir driver, di-flush berkala dari store in-memory (lihat locations.py)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    location_updated_at = Column(DateTime, nullable=True) # UTC
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -52,4 +57,36 @@ class DriverSalary(Base):
     status = Column(String(50), default="PENDING")
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+class DriverLocationTrack(Base):
+    # Jejak perjalanan driver (sudah di-downsample), ditulis bulk oleh locations.flush()
+    __tablename__ = "driver_location_tracks"
+    __table_args__ = (
+        Index("idx_driver_tracks_user_recorded", "driver_user_id", "recorded_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    driver_user_id = Column(Integer, nullable=False) # Sama dengan Order.driver_id (user id driver)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    heading = Column(Float, nullable=True)
+    speed = Column(Float, nullable=True) # km/jam
+    recorded_at = Column(DateTime, nullable=False) # UTC, waktu dari device
+
+class ProcessedEvent(Base):
+    # Idempotency-Key event dari outbox service lain yang sudah diproses (kiriman ulang dibuang)
+    __tablename__ = "processed_events"
+
+    idempotency_key = Column(String(150), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class DriverDisplayCache(Base):
+    # Salinan nama & telepon driver dari User Service untuk detail order (vehicle dibaca dari drivers).
+    # Diperbarui push dari User Service saat profil berubah; synced_at lewat TTL -> diambil ulang
+    __tablename__ = "driver_display_cache"
+
+    user_id = Column(Integer, primary_key=True) # Sama dengan Driver.user_id
+    name = Column(String(255), nullable=False)
+    phone = Column(String(20), nullable=True)
+    synced_at = Column(DateTime, nullable=False) # UTC
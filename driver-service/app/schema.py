@@ -4,26 +4,31 @@ from strawberry.types import Info
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .models import Driver, DeliveryTask, DriverSalary
-from jose import jwt
+from .auth import TokenVerifier, AuthError
 import os
 import requests
+from . import http_client
+from . import locations
+from . import dispatch
+from .geo import valid_coordinates
 
 # --- CONFIG ---
 SECRET_KEY = os.getenv("SECRET_KEY", "kunci_rahasia_project_ini_harus_sama_semua")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ORDER_SERVICE_URL = "http://order-service:8000"
 
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM) # Dipakai juga oleh main.py
+
 def get_current_user(info: Info) -> dict:
     request = info.context.get("request")
     auth_header = request.headers.get("Authorization")
     if not auth_header:
         raise Exception("Authorization header missing")
     try:
-        scheme, token = auth_header.split()
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except Exception:
-        raise Exception("Invalid or expired token")
+        principal = token_verifier.principal(auth_header)
+    except AuthError as e:
+        raise Exception(e.detail)
+    return dict(principal.claims, id=principal.id) # "id" selalu int, juga untuk token lama (sub)
 
 # --- TYPES ---
 @strawberry.type
@@ -36,6 +41,13 @@ class DriverType:
     is_on_job: bool
     total_earnings: float
 
+@strawberry.type
+class DriverLocationType:
+    user_id: int
+    latitude: float
+    longitude: float
+    updated_at: str
+
 @strawberry.type
 class AvailableOrderType:
     id: int
@@ -77,7 +89,7 @@ class Query:
 
         # Nembak Order Service: Cari yang statusnya PAID
         try:
-            res = requests.get(f"{ORDER_SERVICE_URL}/internal/orders/status/PAID")
+            res = http_client.get(f"{ORDER_SERVICE_URL}/internal/orders/status/PAID")
             if res.status_code == 200:
                 data = res.json()
                 return [
@@ -115,6 +127,21 @@ class Mutation:
         finally:
             db.close()
 
+    @strawberry.mutation
+    def update_location(self, info: Info, latitude: float, longitude: float) -> DriverLocationType:
+        # Satu ping lewat pipeline yang sama dengan POST /drivers/location/pings (tanpa query DB)
+        user = get_current_user(info)
+        if user.get("role") != "DRIVER":
+            raise Exception("Unauthorized: Only Drivers can update location")
+        if not valid_coordinates(latitude, longitude):
+            raise Exception("Invalid coordinates")
+        locations.ingest(user['id'], [locations.Ping(lat=latitude, lng=longitude)])
+        position = locations.store.get(user['id'])
+        return DriverLocationType(
+            user_id=user['id'], latitude=position["latitude"], longitude=position["longitude"],
+            updated_at=position["updated_at"].isoformat()
+        )
+
     @strawberry.mutation
     def accept_order(self, info: Info, order_id: int) -> DeliveryTaskType:
         user = get_current_user(info)
@@ -123,27 +150,44 @@ class Mutation:
             driver = db.query(Driver).filter(Driver.user_id == user['id']).first()
             if not driver:
                 raise Exception("Driver profile not found")
-            
-            if driver.is_on_job:
+
+            # 1. Claim driver secara atomik (tidak bisa ambil 2 job sekaligus)
+            claimed = db.query(Driver).filter(Driver.id == driver.id, Driver.is_on_job == False).update(
+                {Driver.is_on_job: True, Driver.is_available: False}, synchronize_session=False
+            )
+            db.commit()
+            if claimed != 1:
                 raise Exception("You are currently on a job!")
 
-            # 1. Update status Driver
-            driver.is_on_job = True
-            driver.is_available = False
-            
-            # 2. Buat Task Lokal
+            # 2. Assign di Order Service (conditional update, 409 kalau sudah diambil driver lain)
+            # Order.driver_id berisi user id driver. Endpoint idempotent per (order, driver), jadi
+            # retry PUT setelah percobaan pertama timeout tetap 200, bukan 409.
+            try:
+                res = http_client.put(
+                    f"{ORDER_SERVICE_URL}/internal/orders/{order_id}/assign-driver",
+                    json={"driver_id": user['id']}
+                )
+                unknown = res.status_code >= 500
+                assigned = res.status_code == 200
+            except requests.exceptions.RequestException:
+                unknown, assigned = True, False
+            if unknown:
+                # Bisa saja sudah ter-assign: driver tetap di-claim, dispatcher yang memastikan
+                # (task dibuat kalau berhasil, driver dilepas kalau tidak)
+                dispatch.defer(order_id, user['id'])
+                raise Exception("Order assignment is being confirmed, please check your active order shortly")
+            if not assigned:
+                db.query(Driver).filter(Driver.id == driver.id).update(
+                    {Driver.is_on_job: False, Driver.is_available: True}, synchronize_session=False
+                )
+                db.commit()
+                raise Exception("Order is no longer available")
+
+            # 3. Buat Task Lokal
             task = DeliveryTask(order_id=order_id, driver_id=driver.id, status="ASSIGNED")
             db.add(task)
             db.commit()
 
-            # 3. Update Order Service (Assign Driver & Status ON_DELIVERY)
-            res = requests.put(
-                f"{ORDER_SERVICE_URL}/internal/orders/{order_id}/assign-driver",
-                json={"driver_id": driver.id}
-            )
-            if res.status_code != 200:
-                raise Exception("Failed to assign driver in Order Service")
-
             return DeliveryTaskType(
                 id=task.id, order_id=task.order_id, driver_id=task.driver_id, status=task.status
             )
@@ -179,7 +223,7 @@ class Mutation:
             db.commit()
 
             # 4. Update Order Service (Status COMPLETED)
-            requests.put(
+            http_client.put(
                 f"{ORDER_SERVICE_URL}/internal/orders/{task.order_id}/status",
                 json={"status": "COMPLETED"}
             )
@@ -50,6 +50,9 @@ CREATE TABLE `drivers` (
   `is_available` tinyint(1) DEFAULT 1,
   `is_on_job` tinyint(1) DEFAULT 0,
   `total_earnings` decimal(10,2) DEFAULT 0.00,
+  `latitude` double DEFAULT NULL,
+  `longitude` double DEFAULT NULL,
+  `location_updated_at` datetime DEFAULT NULL,
   `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
   `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,88 @@
+"""
+Verifikasi JWT bersama (semua service memakai salinan file yang sama).
+
+Token dari User Service (create_access_token) sudah membawa claim id, role, dan name, jadi service
+lain cukup membaca Principal dari token tanpa memanggil /users/profile/me.
+
+Hasil verifikasi di-cache per hash SHA-256 token (LRU, jumlah entry dibatasi). Entry berlaku sampai
+`exp` token, maksimal AUTH_TOKEN_CACHE_MAX_TTL_SECONDS. Client yang polling tidak membayar verifikasi
+signature di setiap request, dan token mentah tidak pernah disimpan sebagai key.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from jose import jwt, JWTError
+
+CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+CACHE_MAX_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_MAX_TTL_SECONDS", "300"))
+
+# name / email bisa None untuk token lama yang belum membawa claim tersebut
+Principal = namedtuple("Principal", "id role name email claims")
+
+class AuthError(Exception):
+    """Dibawa ke HTTPException 401 (REST) atau Exception (GraphQL)."""
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.status_code = 401
+        self.detail = detail
+
+class TokenVerifier:
+    def __init__(self, secret_key: str, algorithm: str, max_size: int = CACHE_SIZE, max_ttl: float = CACHE_MAX_TTL_SECONDS):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._cache = OrderedDict() # sha256(token) -> (berlaku_sampai, claims)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> dict:
+        """Claims token yang valid (salinan, aman diubah pemanggil). AuthError kalau invalid / expired."""
+        key = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._cache[key]
+            self.misses += 1
+
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            raise AuthError("Invalid or expired token")
+
+        valid_until = now + self.max_ttl
+        if claims.get("exp") is not None:
+            valid_until = min(valid_until, float(claims["exp"]))
+        with self._lock:
+            self._cache[key] = (valid_until, claims)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return dict(claims)
+
+    def principal(self, authorization: str) -> Principal:
+        """Dari header `Authorization: Bearer <token>`."""
+        if not authorization:
+            raise AuthError("Missing Token")
+        parts = authorization.split()
+        if len(parts) != 2 or parts[0].lower() != "bearer":
+            raise AuthError("Invalid authentication scheme")
+        claims = self.verify(parts[1])
+        try:
+            user_id = int(claims.get("id", claims.get("sub")))
+        except (TypeError, ValueError):
+            raise AuthError("Invalid Token")
+        return Principal(user_id, claims.get("role"), claims.get("name"), claims.get("email"), claims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
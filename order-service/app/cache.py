@@ -0,0 +1,131 @@
+"""
+Cache read-through in-process dengan TTL, batas ukuran (LRU) dan stale-while-revalidate.
+
+- Entry segar (< ttl)            -> langsung dari memori
+- Entry basi (< ttl + stale_ttl) -> dikembalikan apa adanya, refresh jalan di thread background
+- Entry kedaluwarsa / belum ada  -> loader dipanggil (satu loader per key, request lain menunggu)
+- Loader gagal tapi masih ada data lama -> data lama dipakai (upstream down tidak memutus fitur)
+- invalidate() untuk dibuang paksa (hook dari service lain / admin)
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class _Entry:
+    __slots__ = ("value", "loaded_at")
+
+    def __init__(self, value, loaded_at: float):
+        self.value = value
+        self.loaded_at = loaded_at
+
+class TTLCache:
+    def __init__(self, loader, ttl: float, stale_ttl: float = 0, max_size: int = 128, name: str = "cache"):
+        self.loader = loader # loader(key) -> value, boleh raise
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+        self._generation = 0 # Naik setiap invalidate, hasil load lama tidak boleh menimpa
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.load_errors = 0
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return # Ada invalidate saat loader berjalan, jangan simpan data lama
+            self._entries[key] = _Entry(value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _load(self, key, stale: _Entry = None):
+        with self._lock:
+            generation = self._generation
+        try:
+            value = self.loader(key)
+        except Exception as e:
+            with self._lock:
+                self.load_errors += 1
+            if stale is not None:
+                print(f"[{self.name}] refresh failed for {key!r}, serving stale value: {e}")
+                return stale.value
+            raise
+        self._store(key, value, generation)
+        return value
+
+    def _refresh_in_background(self, key, entry: _Entry):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._load(key, stale=entry)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, key):
+        entry = self._lookup(key)
+        if entry is not None:
+            age = time.monotonic() - entry.loaded_at
+            if age < self.ttl:
+                self.hits += 1
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(key, entry)
+                return entry.value
+
+        # Miss / kedaluwarsa: hanya satu thread yang memanggil loader untuk key ini
+        with self._key_lock(key):
+            fresh = self._lookup(key)
+            if fresh is not None and fresh is not entry and time.monotonic() - fresh.loaded_at < self.ttl:
+                self.hits += 1
+                return fresh.value
+            self.misses += 1
+            return self._load(key, stale=entry)
+
+    def invalidate(self, key=None):
+        """Buang satu key, atau semua key kalau `key` None."""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "load_errors": self.load_errors
+            }
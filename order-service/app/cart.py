@@ -0,0 +1,171 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy.orm import Session
+from . import http_client
+from . import outbox
+from .geo import encode as geo_encode, valid_coordinates
+from .models import Order
+from .state import STATUS_PENDING, STATUS_PAID, STATUS_PREPARING, STATUS_CANCELLED, transition, TransitionError
+
+RESTAURANT_SERVICE_URL = "http://restaurant-service:8000"
+PICKUP_GEOHASH_PRECISION = 8 # ~19 m, cukup untuk semua prefix radius di geo.covering_cells
+
+# Order yang belum dibayar dibatalkan SEBELUM reservasi stoknya kedaluwarsa di Restaurant Service
+# (STOCK_RESERVATION_TTL_SECONDS, default 1800), jadi pembayaran tidak bisa masuk untuk stok yang sudah dilepas.
+PAYMENT_TIMEOUT_SECONDS = int(os.getenv("ORDER_PAYMENT_TIMEOUT_SECONDS", "1500"))
+PAYMENT_TIMEOUT_INTERVAL_SECONDS = int(os.getenv("ORDER_PAYMENT_TIMEOUT_INTERVAL_SECONDS", "60"))
+
+class CartValidationError(Exception):
+    """Error validasi keranjang, dibawa ke HTTPException (REST) atau Exception (GraphQL)."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def reserve_cart(restaurant_id: int, items):
+    """
+    Reservasi stok + ambil harga seluruh keranjang ke Restaurant Service dalam SATU request.
+    Restaurant Service mengurangi stok secara atomik dan mengembalikan harga dari DB
+    (bukan input user -> Anti Cheat).
+
+    `items` adalah list objek dengan atribut `menu_item_id` dan `quantity`.
+    Return: (validated_items, total_amount, reservation_id, pickup)
+    `pickup` = {"latitude", "longitude"} restoran, atau None kalau koordinat belum diisi.
+    """
+    payload = {
+        "restaurant_id": restaurant_id,
+        "items": [{"menu_item_id": i.menu_item_id, "quantity": i.quantity} for i in items]
+    }
+    try:
+        res = http_client.post(f"{RESTAURANT_SERVICE_URL}/internal/stock/reservations", json=payload)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        raise CartValidationError(503, "Failed to connect to Restaurant Service")
+    if res.status_code != 200:
+        try:
+            detail = res.json().get('detail', res.text)
+        except ValueError:
+            detail = res.text
+        raise CartValidationError(400, detail)
+
+    reservation = res.json()['data']
+    menu_map = {m['id']: m for m in reservation['items']}
+
+    validated_items = []
+    total_amount = 0
+    for item_input in items:
+        menu_data = menu_map[item_input.menu_item_id]
+        total_amount += menu_data['price'] * item_input.quantity
+        validated_items.append({
+            "id": menu_data['id'],
+            "name": menu_data['name'],
+            "price": menu_data['price'],
+            "qty": item_input.quantity
+        })
+
+    return validated_items, total_amount, reservation['reservation_id'], reservation.get('pickup')
+
+def pickup_fields(pickup) -> dict:
+    """Kolom Order untuk titik jemput (kosong kalau restoran belum punya koordinat)."""
+    if not pickup or not valid_coordinates(pickup.get('latitude'), pickup.get('longitude')):
+        return {}
+    return {
+        "pickup_latitude": pickup['latitude'],
+        "pickup_longitude": pickup['longitude'],
+        "pickup_geohash": geo_encode(pickup['latitude'], pickup['longitude'], PICKUP_GEOHASH_PRECISION)
+    }
+
+def _reservation_action(reservation_id: str, action: str) -> bool:
+    if not reservation_id:
+        return False
+    try:
+        # confirm/release idempotent di sisi Restaurant Service -> aman di-retry
+        res = http_client.post(f"{RESTAURANT_SERVICE_URL}/internal/stock/reservations/{reservation_id}/{action}", retry=True)
+        if res.status_code != 200:
+            print(f"Failed to {action} stock reservation {reservation_id}: {res.status_code} {res.text}")
+            return False
+        return True
+    except Exception as e:
+        print(f"Failed to {action} stock reservation {reservation_id}: {e}")
+        return False
+
+def release_reservation(reservation_id: str) -> bool:
+    """Kembalikan stok (order gagal disimpan / dibatalkan). Best-effort, TTL jadi pengaman."""
+    return _reservation_action(reservation_id, "release")
+
+def confirm_reservation(reservation_id: str) -> bool:
+    """Tandai stok terpakai permanen (order sudah dibayar)."""
+    return _reservation_action(reservation_id, "confirm")
+
+def queue_reservation_action(db: Session, reservation_id: str, action: str):
+    """Confirm / release lewat outbox, ikut transaksi perubahan status order (tidak hilang kalau Restaurant Service down)."""
+    if not reservation_id:
+        return
+    outbox.enqueue(
+        db, f"stock.reservation.{action}", "POST",
+        f"{RESTAURANT_SERVICE_URL}/internal/stock/reservations/{reservation_id}/{action}",
+        idempotency_key=f"reservation-{action}:{reservation_id}"
+    )
+
+def queue_reservation_cancel(db: Session, reservation_id: str, previous_status: str):
+    """
+    Stok kembali saat order dibatalkan: masih PENDING_PAYMENT -> release reservasi,
+    sudah dibayar (reservasi CONFIRMED) -> return.
+    """
+    action = "release" if previous_status == STATUS_PENDING else "return"
+    queue_reservation_action(db, reservation_id, action)
+
+def expire_unpaid_orders(db: Session, limit: int = 100) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=PAYMENT_TIMEOUT_SECONDS)
+    stale = db.query(Order.id).filter(
+        Order.status == STATUS_PENDING, Order.created_at < cutoff
+    ).order_by(Order.id).limit(limit).all()
+
+    expired = 0
+    for row in stale:
+        try:
+            transition(
+                db, row.id, STATUS_CANCELLED, expected_from={STATUS_PENDING},
+                before_commit=lambda o, previous: queue_reservation_cancel(db, o.reservation_id, previous)
+            )
+            expired += 1
+        except TransitionError:
+            db.rollback() # Kalah balapan dengan pembayaran / cancel user -> biarkan
+    if expired:
+        outbox.notify()
+    return expired
+
+def payment_timeout_loop(session_factory):
+    while True:
+        time.sleep(PAYMENT_TIMEOUT_INTERVAL_SECONDS)
+        db = session_factory()
+        try:
+            expired = expire_unpaid_orders(db)
+            if expired:
+                print(f"Cancelled {expired} unpaid orders past payment timeout")
+        except Exception as e:
+            db.rollback()
+            print(f"Payment timeout reaper failed: {e}")
+        finally:
+            db.close()
+
+def _on_confirm_failed(db: Session, event):
+    """
+    Confirm ditolak permanen (reservasi sudah kedaluwarsa dan stok habis dipakai order lain):
+    order yang sudah dibayar tidak bisa dipenuhi -> batalkan, pembayaran perlu di-refund.
+    """
+    reservation_id = event.url.rstrip("/").split("/")[-2]
+    order = db.query(Order).filter(Order.reservation_id == reservation_id).first()
+    if order is None:
+        return
+    try:
+        transition(db, order.id, STATUS_CANCELLED, expected_from={STATUS_PAID, STATUS_PREPARING})
+    except TransitionError as e:
+        db.rollback()
+        print(f"Stock confirm failed for order {order.id} (reservation {reservation_id}), needs manual review: {e.detail}")
+        return
+    print(f"Order {order.id} cancelled: stock reservation {reservation_id} could not be confirmed, needs refund")
+
+outbox.on_failed("stock.reservation.confirm", _on_confirm_failed)
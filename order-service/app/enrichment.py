@@ -0,0 +1,85 @@
+"""
+Fan-out async ke service lain untuk melengkapi data order (customer, alamat, driver).
+
+Semua upstream dipanggil paralel dengan satu deadline total, jadi latency = max() bukan sum().
+Upstream yang gagal / lewat deadline menghasilkan None, dan handler memakai placeholder lama
+("Restaurant {id}", "Customer", dst).
+"""
+import asyncio
+import os
+
+import httpx
+
+ENRICHMENT_DEADLINE = float(os.getenv("ENRICHMENT_DEADLINE_SECONDS", "2"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", "200"))
+
+_client = None
+_client_loop = None
+
+def _get_client() -> httpx.AsyncClient:
+    # AsyncClient terikat ke event loop, buat ulang kalau loop berganti
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_keepalive_connections=POOL_SIZE, max_connections=POOL_SIZE * 5)
+        )
+        _client_loop = loop
+    return _client
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def _get_json(name: str, url: str, headers: dict = None):
+    try:
+        res = await _get_client().get(url, headers=headers)
+        if res.status_code == 200:
+            return res.json()
+        print(f"Failed to fetch {name}: {res.status_code}")
+    except Exception as e:
+        print(f"Failed to fetch {name}: {e}")
+    return None
+
+async def fetch_json(calls: dict, deadline: float = ENRICHMENT_DEADLINE) -> dict:
+    """
+    `calls`: {nama: url} atau {nama: (url, headers)}.
+    Return {nama: json | None}. Semua GET jalan paralel; yang belum selesai saat deadline dibatalkan.
+    """
+    tasks = {}
+    for name, call in calls.items():
+        url, headers = call if isinstance(call, tuple) else (call, None)
+        tasks[name] = asyncio.create_task(_get_json(name, url, headers))
+
+    if not tasks:
+        return {}
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f"Enrichment deadline exceeded for: {[n for n, t in tasks.items() if t in pending]}")
+
+    return {name: (task.result() if task in done else None) for name, task in tasks.items()}
+
+def add_batch_calls(calls: dict, name: str, url: str, ids, batch_size: int = BATCH_SIZE):
+    """Tambahkan GET {url}?ids=... ke `calls`, dipecah per `batch_size` id agar URL tidak kepanjangan."""
+    id_list = sorted({i for i in ids if i is not None})
+    for n in range(0, len(id_list), batch_size):
+        chunk = id_list[n:n + batch_size]
+        calls[f"{name}:{n}"] = f"{url}?ids={','.join(str(i) for i in chunk)}"
+
+def collect_batch(upstream: dict, name: str) -> dict:
+    """Gabungkan hasil add_batch_calls menjadi {id: row}."""
+    rows = {}
+    for key, result in upstream.items():
+        if key.split(":")[0] == name and result:
+            for row in result['data']:
+                rows[row['id']] = row
+    return rows
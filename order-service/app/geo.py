@@ -0,0 +1,196 @@
+"""
+Utilitas geospasial (restaurant, order, driver memakai salinan file yang sama).
+
+- haversine_km(): jarak dua koordinat
+- GeoIndex: index grid in-memory (sel lat/lon berukuran tetap) untuk query radius & k-nearest
+  tanpa menghitung jarak ke semua titik
+- geohash encode() / covering_cells(): untuk query radius di SQL lewat kolom geohash ber-index
+  (WHERE geohash LIKE 'prefix%' untuk sel pusat + 8 tetangga)
+"""
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def valid_coordinates(lat, lon) -> bool:
+    return lat is not None and lon is not None and -90 <= lat <= 90 and -180 <= lon <= 180
+
+# --- GEOHASH ---
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {c: i for i, c in enumerate(_BASE32)}
+
+# Sisi terpendek sel geohash (km) per presisi, di ekuator
+_CELL_MIN_KM = {1: 4992.6, 2: 624.1, 3: 156.0, 4: 19.5, 5: 4.89, 6: 0.61, 7: 0.153, 8: 0.019}
+
+def encode(lat: float, lon: float, precision: int = 8) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+def _bounds(geohash: str):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _BASE32_INDEX[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range, lon_range
+
+def neighbors(geohash: str) -> list:
+    """8 sel tetangga dengan presisi yang sama."""
+    (lat_lo, lat_hi), (lon_lo, lon_hi) = _bounds(geohash)
+    lat_c, lon_c = (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+    dlat, dlon = lat_hi - lat_lo, lon_hi - lon_lo
+    result = []
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            if i == 0 and j == 0:
+                continue
+            lat = lat_c + i * dlat
+            if not -90 <= lat <= 90:
+                continue
+            lon = (lon_c + j * dlon + 180) % 360 - 180
+            result.append(encode(lat, lon, len(geohash)))
+    return result
+
+def precision_for_radius(radius_km: float) -> int:
+    """Presisi terbesar yang selnya tidak lebih kecil dari radius (sel pusat + tetangga menutup lingkaran)."""
+    for precision in range(8, 0, -1):
+        if _CELL_MIN_KM[precision] >= radius_km:
+            return precision
+    return 1
+
+def covering_cells(lat: float, lon: float, radius_km: float) -> list:
+    """Prefix geohash yang menutup lingkaran (lat, lon, radius). Hasil tetap harus difilter dengan haversine."""
+    center = encode(lat, lon, precision_for_radius(radius_km))
+    return sorted(set([center] + neighbors(center)))
+
+# --- GRID INDEX IN-MEMORY ---
+
+class GeoIndex:
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg # 0.01 derajat ~ 1.1 km
+        self._cells = {} # (i, j) -> {id: (lat, lon)}
+        self._points = {} # id -> (lat, lon, (i, j))
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def upsert(self, item_id, lat: float, lon: float):
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._points.get(item_id)
+            if old is not None and old[2] != cell:
+                self._discard(item_id, old[2])
+            self._cells.setdefault(cell, {})[item_id] = (lat, lon)
+            self._points[item_id] = (lat, lon, cell)
+
+    def _discard(self, item_id, cell):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(item_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def remove(self, item_id):
+        with self._lock:
+            old = self._points.pop(item_id, None)
+            if old is not None:
+                self._discard(item_id, old[2])
+
+    def get(self, item_id):
+        point = self._points.get(item_id)
+        return (point[0], point[1]) if point else None
+
+    def __len__(self):
+        return len(self._points)
+
+    def _collect(self, lat, lon, i_range, j_range, out: list):
+        for i in i_range:
+            for j in j_range:
+                bucket = self._cells.get((i, j))
+                if bucket:
+                    for item_id, (p_lat, p_lon) in bucket.items():
+                        out.append((haversine_km(lat, lon, p_lat, p_lon), item_id))
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list:
+        """[(jarak_km, id)] di dalam radius, terurut dari yang terdekat."""
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        ci_lo, cj_lo = self._cell(lat - dlat, lon - dlon)
+        ci_hi, cj_hi = self._cell(lat + dlat, lon + dlon)
+        found = []
+        with self._lock:
+            if (ci_hi - ci_lo + 1) * (cj_hi - cj_lo + 1) > len(self._cells):
+                # Radius sangat besar dibanding data: lebih murah cek semua sel yang terisi
+                for (i, j), bucket in self._cells.items():
+                    if ci_lo <= i <= ci_hi and cj_lo <= j <= cj_hi:
+                        self._collect(lat, lon, [i], [j], found)
+            else:
+                self._collect(lat, lon, range(ci_lo, ci_hi + 1), range(cj_lo, cj_hi + 1), found)
+        return sorted(r for r in found if r[0] <= radius_km)
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius_km: float = 50.0, predicate=None) -> list:
+        """
+        k titik terdekat [(jarak_km, id)] dalam max_radius_km. Cincin sel diperluas dari pusat
+        sampai k titik ditemukan dan tidak mungkin ada titik lebih dekat di cincin berikutnya.
+        `predicate(id)` opsional untuk menyaring (mis. hanya driver yang available).
+        """
+        ci, cj = self._cell(lat, lon)
+        cell_km = self.cell_deg * KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(math.ceil(max_radius_km / cell_km)) + 1
+        found = []
+        with self._lock:
+            for ring in range(0, max_ring + 1):
+                if ring == 0:
+                    cells = [(ci, cj)]
+                else:
+                    cells = [(ci + d, cj - ring) for d in range(-ring, ring + 1)]
+                    cells += [(ci + d, cj + ring) for d in range(-ring, ring + 1)]
+                    cells += [(ci - ring, cj + d) for d in range(-ring + 1, ring)]
+                    cells += [(ci + ring, cj + d) for d in range(-ring + 1, ring)]
+                for cell in cells:
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        for item_id, (p_lat, p_lon) in bucket.items():
+                            if predicate is None or predicate(item_id):
+                                found.append((haversine_km(lat, lon, p_lat, p_lon), item_id))
+                # Semua titik di luar cincin ini berjarak minimal ring * cell_km dari pusat
+                if len(found) >= k:
+                    found.sort()
+                    if found[k - 1][0] <= ring * cell_km:
+                        break
+                if len(self._points) == len(found):
+                    break
+        found.sort()
+        return [r for r in found if r[0] <= max_radius_km][:k]
@@ -0,0 +1,132 @@
+"""
+Client HTTP internal antar-service (order, driver, payment, user memakai salinan file yang sama).
+
+- Satu requests.Session (keep-alive connection pool) per upstream
+- Timeout connect/read default, bisa diatur lewat ENV
+- Retry terbatas dengan exponential backoff + jitter (hanya method idempotent)
+- Counter latency/error per upstream, lihat stats()
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.1"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUS_CODES = {502, 503, 504}
+
+class UpstreamStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 2) if self.requests else 0,
+            "max_latency_ms": round(self.max_latency * 1000, 2)
+        }
+
+class InternalClient:
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES,
+                 backoff=RETRY_BACKOFF, pool_size=POOL_SIZE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _upstream(self, url: str) -> str:
+        return urlsplit(url).netloc
+
+    def _session(self, upstream: str) -> requests.Session:
+        session = self._sessions.get(upstream)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(upstream)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[upstream] = session
+                    self._stats[upstream] = UpstreamStats()
+        return session
+
+    def _record(self, upstream: str, latency: float, error: bool, retried: bool):
+        with self._lock:
+            stats = self._stats[upstream]
+            stats.requests += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if error:
+                stats.errors += 1
+            if retried:
+                stats.retries += 1
+
+    def request(self, method: str, url: str, retry: bool = None, **kwargs) -> requests.Response:
+        method = method.upper()
+        upstream = self._upstream(url)
+        session = self._session(upstream)
+        kwargs.setdefault("timeout", self.timeout)
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.max_retries if retry else 0)
+
+        for attempt in range(attempts):
+            is_last = attempt == attempts - 1
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(upstream, time.perf_counter() - start, error=True, retried=not is_last)
+                if is_last:
+                    raise
+            else:
+                failed = response.status_code >= 500
+                will_retry = response.status_code in RETRY_STATUS_CODES and not is_last
+                self._record(upstream, time.perf_counter() - start, error=failed, retried=will_retry)
+                if not will_retry:
+                    return response
+            # Full jitter: tidur acak antara 0 dan backoff * 2^attempt
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {upstream: s.to_dict() for upstream, s in self._stats.items()}
+
+# Instance bersama per proses
+client = InternalClient()
+get = client.get
+post = client.post
+put = client.put
+delete = client.delete
+stats = client.stats
@@ -0,0 +1,130 @@
+"""
+Header Idempotency-Key untuk request yang membuat data (order & payment memakai salinan file yang sama).
+
+Client mengirim key unik per aksi user dan memakai key yang sama saat retry:
+- key baru                -> record IN_PROGRESS dibuat, request diproses, response disimpan
+                             (di transaksi yang sama dengan data yang dibuat)
+- key sudah selesai       -> response tersimpan dikembalikan lagi, tidak ada order / stok / payment dobel
+- key masih diproses      -> 409, client retry sebentar lagi
+- key sama, request beda  -> 422
+- request gagal           -> record dihapus, retry dengan key yang sama diproses ulang
+Key di-scope per user (user_id, key) dan kedaluwarsa setelah IDEMPOTENCY_TTL_HOURS (dihapus reaper_loop).
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import IdempotencyKey
+
+TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# Record IN_PROGRESS lebih tua dari ini dianggap yatim (proses mati di tengah jalan) dan boleh diambil alih
+IN_PROGRESS_TIMEOUT_SECONDS = float(os.getenv("IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS", "60"))
+REAPER_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_REAPER_INTERVAL_SECONDS", "600"))
+MAX_KEY_LENGTH = 150
+
+class IdempotencyError(Exception):
+    """Dibawa ke HTTPException (REST) atau Exception (GraphQL), sama seperti CartValidationError."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def fingerprint(payload) -> str:
+    """Hash isi request, untuk mendeteksi key yang dipakai ulang dengan request berbeda."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _take_over(db: Session, existing: IdempotencyKey, request_hash: str, now: datetime):
+    # Conditional UPDATE: dua retry yang sama-sama menemukan record basi -> hanya satu yang menang
+    taken = db.query(IdempotencyKey).filter(
+        IdempotencyKey.id == existing.id, IdempotencyKey.locked_at == existing.locked_at
+    ).update({
+        IdempotencyKey.request_hash: request_hash,
+        IdempotencyKey.status: "IN_PROGRESS",
+        IdempotencyKey.response_code: None,
+        IdempotencyKey.response_body: None,
+        IdempotencyKey.locked_at: now,
+        IdempotencyKey.expires_at: now + timedelta(hours=TTL_HOURS)
+    }, synchronize_session=False)
+    db.commit()
+    if taken != 1:
+        raise IdempotencyError(409, "A request with this Idempotency-Key is already in progress")
+    db.refresh(existing)
+    return existing
+
+def begin(db: Session, user_id: int, key: str, request_hash: str):
+    """
+    Return (record, None) -> proses request lalu complete() / release(),
+    atau (None, (status_code, body)) -> kirim ulang response yang tersimpan.
+    Tanpa key: (None, None), request diproses seperti biasa.
+    """
+    if not key:
+        return None, None
+    if len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+    now = datetime.utcnow()
+    record = IdempotencyKey(
+        user_id=user_id, idempotency_key=key, request_hash=request_hash, status="IN_PROGRESS",
+        locked_at=now, expires_at=now + timedelta(hours=TTL_HOURS)
+    )
+    db.add(record)
+    try:
+        db.commit()
+        return record, None
+    except IntegrityError:
+        db.rollback()
+
+    existing = db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.idempotency_key == key
+    ).first()
+    if existing is None: # Baru saja dihapus (release / reaper) -> client cukup retry
+        raise IdempotencyError(409, "A request with this Idempotency-Key is already in progress")
+
+    orphaned = existing.status == "IN_PROGRESS" and existing.locked_at < now - timedelta(seconds=IN_PROGRESS_TIMEOUT_SECONDS)
+    if existing.expires_at <= now or orphaned:
+        return _take_over(db, existing, request_hash, now), None
+    if existing.request_hash != request_hash:
+        raise IdempotencyError(422, "Idempotency-Key was already used with a different request")
+    if existing.status == "IN_PROGRESS":
+        raise IdempotencyError(409, "A request with this Idempotency-Key is already in progress")
+    return None, (existing.response_code, json.loads(existing.response_body))
+
+def complete(db: Session, record: IdempotencyKey, status_code: int, body):
+    """Simpan response di session pemanggil (TIDAK commit): ikut commit bersama data yang dibuat."""
+    if record is None:
+        return
+    record.status = "COMPLETED"
+    record.response_code = status_code
+    record.response_body = json.dumps(body, default=str)
+
+def release(db: Session, record: IdempotencyKey):
+    """Request gagal -> hapus record supaya retry dengan key yang sama diproses ulang."""
+    if record is None:
+        return
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.id == record.id, IdempotencyKey.status == "IN_PROGRESS"
+    ).delete(synchronize_session=False)
+    db.commit()
+
+def reap(db: Session) -> int:
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def reaper_loop(session_factory):
+    while True:
+        time.sleep(REAPER_INTERVAL_SECONDS)
+        db = session_factory()
+        try:
+            reap(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Idempotency key reaper failed: {e}")
+        finally:
+            db.close()
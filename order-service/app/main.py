@@ -1,14 +1,26 @@
 from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from strawberry.fastapi import GraphQLRouter
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.sql import func
+from sqlalchemy import text, or_, and_
 from pydantic import BaseModel
-from jose import jwt # Add this
 import os # Add this
-from .database import engine, Base, get_db
+import asyncio
+import json
+import threading
+import time
+from .database import engine, Base, get_db, SessionLocal
 from .models import Order
-from .schema import schema
+from .schema import schema, get_context, token_verifier
+from .auth import Principal, AuthError
+from . import http_client
+from . import enrichment
+from . import geo
+from .cache import TTLCache
+from starlette.concurrency import run_in_threadpool
 
 # Buat tabel
 Base.metadata.create_all(bind=engine)
@@ -24,28 +36,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Valid Statuses
-STATUS_PENDING = "PENDING_PAYMENT"
-STATUS_PAID = "PAID"
-STATUS_PREPARING = "PREPARING"
-STATUS_ON_DELIVERY = "ON_THE_WAY"
-STATUS_DELIVERED = "DELIVERED"
-STATUS_COMPLETED = "COMPLETED"
-STATUS_CANCELLED = "CANCELLED"
-
-SECRET_KEY = os.getenv("SECRET_KEY", "kunci_rahasia_project_ini_harus_sama_semua")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+# Valid Statuses (definisi + aturan transisi di state.py)
+from .state import (
+    STATUS_PENDING, STATUS_PAID, STATUS_PREPARING, STATUS_ON_DELIVERY,
+    STATUS_DELIVERED, STATUS_COMPLETED, STATUS_CANCELLED, normalize, transition, TransitionError
+)
 
 # --- HELPER: GET CURRENT USER ---
-def get_current_user_id(authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Token")
+# Verifikasi token di-cache (auth.py); claim id / role / name sudah ada di token
+def get_current_principal(authorization: str = Header(None)) -> Principal:
     try:
-        token = authorization.split(" ")[1]
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return int(payload.get("sub"))
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid Token")
+        return token_verifier.principal(authorization)
+    except AuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def get_current_user_id(principal: Principal = Depends(get_current_principal)) -> int:
+    return principal.id
 
 # --- TAMBAHAN UNTUK INTEGRASI (Internal API) ---
 # ... (internal APIs remain)
@@ -65,15 +71,8 @@ def get_my_orders(
         Order.user_id == user_id
     ).order_by(Order.created_at.desc()).all()
     
-    # Fetch Restaurants for name mapping
-    restaurant_map = {}
-    try:
-        res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
-        if res.status_code == 200:
-            for r in res.json()['data']:
-                restaurant_map[r['id']] = r['name']
-    except Exception as e:
-        print(f"Failed to fetch restaurants map: {e}")
+    # Restaurant names for mapping (cached)
+    restaurant_map = restaurant_name_map()
 
     data = []
     for o in orders:
@@ -89,12 +88,114 @@ def get_my_orders(
     
     return {"status": "success", "data": data}
 
-import requests # Add this
-from datetime import datetime, timedelta # Add this
+from datetime import datetime, timedelta, date # Add this
+import base64
 from typing import List, Optional # Add this
-from .models import OrderItem # Add this
+from .models import OrderItem, OrderDailyStat # Add this
+from .cart import (
+    reserve_cart, pickup_fields, release_reservation, queue_reservation_action, queue_reservation_cancel,
+    payment_timeout_loop, CartValidationError
+)
+from . import outbox
+from . import idempotency
+from . import payment_events
+from .stats import record_order_created
 
 RESTAURANT_SERVICE_URL = "http://restaurant-service:8000"
+USER_SERVICE_URL = "http://user-service:8000"
+
+# --- CACHE DATA RESTORAN (nama/alamat) ---
+# Nama restoran jarang berubah tapi dibaca di hampir semua endpoint -> read-through cache
+# TTL cukup panjang karena perubahan sudah di-invalidate lewat change event Restaurant Service
+RESTAURANT_CACHE_TTL = float(os.getenv("RESTAURANT_CACHE_TTL_SECONDS", "600"))
+RESTAURANT_CACHE_STALE = float(os.getenv("RESTAURANT_CACHE_STALE_SECONDS", "300"))
+RESTAURANT_EVENTS_POLL_SECONDS = float(os.getenv("RESTAURANT_EVENTS_POLL_SECONDS", "5"))
+RESTAURANT_DIRECTORY_KEY = "all"
+
+def _load_restaurant_directory(_key):
+    res = http_client.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
+    if res.status_code != 200:
+        raise RuntimeError(f"Restaurant Service returned {res.status_code}")
+    return {r['id']: {"name": r['name'], "address": r.get('address')} for r in res.json()['data']}
+
+restaurant_cache = TTLCache(
+    _load_restaurant_directory,
+    ttl=RESTAURANT_CACHE_TTL,
+    stale_ttl=RESTAURANT_CACHE_STALE,
+    max_size=16,
+    name="restaurants"
+)
+
+def restaurant_directory():
+    """{restaurant_id: {"name", "address"}} atau None kalau Restaurant Service tidak bisa dihubungi."""
+    try:
+        return restaurant_cache.get(RESTAURANT_DIRECTORY_KEY)
+    except Exception as e:
+        print(f"Failed to fetch restaurants map: {e}")
+        return None
+
+def restaurant_name_map() -> dict:
+    return {r_id: r['name'] for r_id, r in (restaurant_directory() or {}).items()}
+
+# Hook invalidasi: dipanggil Restaurant Service / admin setelah data restoran berubah
+@app.post("/internal/cache/restaurants/invalidate")
+def invalidate_restaurant_cache():
+    restaurant_cache.invalidate()
+    return {"status": "success", "message": "Restaurant cache invalidated"}
+
+def poll_restaurant_events(after_seq):
+    """
+    Satu putaran baca change event Restaurant Service. Return seq terakhir yang sudah diproses.
+    Event restoran -> cache direktori di-invalidate. Kalau posisi tidak bisa dilanjutkan
+    (service restart / event sudah terbuang) cache di-invalidate penuh lalu mulai dari seq terbaru.
+    """
+    res = http_client.get(f"{RESTAURANT_SERVICE_URL}/internal/events", params={"after": after_seq or 0, "limit": 500})
+    if res.status_code != 200:
+        raise RuntimeError(f"Restaurant Service returned {res.status_code}")
+    body = res.json()
+    if after_seq is None:
+        return body['last_seq'] # Start pertama: cache masih kosong, tidak perlu replay histori
+
+    received = body['data']
+    if body['last_seq'] < after_seq or (received and received[0]['seq'] > after_seq + 1):
+        restaurant_cache.invalidate()
+        return body['last_seq']
+
+    if any(e['entity'] == "restaurant" for e in received):
+        restaurant_cache.invalidate()
+    return received[-1]['seq'] if received else after_seq
+
+def _restaurant_events_loop():
+    after_seq = None
+    while True:
+        try:
+            after_seq = poll_restaurant_events(after_seq)
+        except Exception as e:
+            print(f"Failed to poll restaurant events: {e}")
+        time.sleep(RESTAURANT_EVENTS_POLL_SECONDS)
+
+@app.on_event("startup")
+def start_restaurant_events_consumer():
+    threading.Thread(target=_restaurant_events_loop, daemon=True).start()
+
+# Hapus Idempotency-Key yang sudah kedaluwarsa
+@app.on_event("startup")
+def start_idempotency_reaper():
+    threading.Thread(target=idempotency.reaper_loop, args=(SessionLocal,), daemon=True).start()
+
+# Relay outbox: kirim side effect (gaji driver, task, reservasi stok) di background dengan retry
+@app.on_event("startup")
+def start_outbox_relay():
+    threading.Thread(target=outbox.relay_loop, args=(SessionLocal,), daemon=True).start()
+
+# Batalkan order yang tidak dibayar sebelum reservasi stoknya kedaluwarsa
+@app.on_event("startup")
+def start_payment_timeout_reaper():
+    threading.Thread(target=payment_timeout_loop, args=(SessionLocal,), daemon=True).start()
+
+@app.on_event("shutdown")
+async def close_enrichment_client():
+    await enrichment.close()
 
 class OrderItemRequest(BaseModel):
     menu_item_id: int
@@ -109,59 +210,27 @@ class CreateOrderRequest(BaseModel):
 def create_order(
     req: CreateOrderRequest,
     user_id: int = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
+    # Retry client dengan key yang sama -> response order pertama, tanpa order & reservasi stok dobel
     try:
-        # --- LANGKAH 1: Validasi Stok & Harga ke Restaurant Service ---
-        validated_items = []
-        total_amount = 0
-        stock_update_payload = []
-
-        for item_input in req.items:
-            # Nembak API Internal Restaurant
-            try:
-                res = requests.get(f"{RESTAURANT_SERVICE_URL}/internal/menu-items/{item_input.menu_item_id}")
-                if res.status_code != 200:
-                    raise HTTPException(status_code=400, detail=f"Menu Item ID {item_input.menu_item_id} not found")
-                
-                menu_data = res.json()
-                
-                # Cek Restoran (Pastikan item milik restoran yang benar)
-                if menu_data['restaurant_id'] != req.restaurant_id:
-                        raise HTTPException(status_code=400, detail=f"Menu {menu_data['name']} does not belong to this restaurant")
-
-                # Cek Stok
-                if menu_data['stock'] < item_input.quantity:
-                    raise HTTPException(status_code=400, detail=f"Stock habis untuk {menu_data['name']}. Sisa: {menu_data['stock']}")
-
-                # Hitung Total (Pakai harga dari DB, bukan input user -> Anti Cheat)
-                item_total = menu_data['price'] * item_input.quantity
-                total_amount += item_total
-                
-                validated_items.append({
-                    "id": menu_data['id'],
-                    "name": menu_data['name'],
-                    "price": menu_data['price'],
-                    "qty": item_input.quantity
-                })
-                
-                stock_update_payload.append({
-                    "menu_item_id": menu_data['id'],
-                    "quantity": item_input.quantity
-                })
-                
-            except requests.exceptions.ConnectionError:
-                raise HTTPException(status_code=503, detail="Failed to connect to Restaurant Service")
-
-        # --- LANGKAH 2: Kurangi Stok (Reservasi Stok) ---
-        res_stock = requests.post(
-            f"{RESTAURANT_SERVICE_URL}/internal/menu-items/reduce-stock",
-            json=stock_update_payload
-        )
-        if res_stock.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Failed to reduce stock: {res_stock.text}")
+        record, replay = idempotency.begin(db, user_id, idempotency_key, idempotency.fingerprint(jsonable_encoder(req)))
+    except idempotency.IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if replay:
+        status_code, body = replay
+        return JSONResponse(status_code=status_code, content=body, headers={"Idempotency-Replayed": "true"})
+
+    reservation_id = None
+    try:
+        # --- LANGKAH 1: Reservasi Stok & Harga ke Restaurant Service (1x request, atomik) ---
+        try:
+            validated_items, total_amount, reservation_id, pickup = reserve_cart(req.restaurant_id, req.items)
+        except CartValidationError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-        # --- LANGKAH 3: Simpan Order ke DB ---
+        # --- LANGKAH 2: Simpan Order ke DB ---
         estimasi = datetime.now() + timedelta(minutes=45)
 
         new_order = Order(
@@ -170,11 +239,12 @@ def create_order(
             address_id=req.address_id,
             total_price=total_amount,
             status=STATUS_PENDING,
-            estimated_delivery_time=estimasi 
+            reservation_id=reservation_id,
+            estimated_delivery_time=estimasi,
+            **pickup_fields(pickup)
         )
         db.add(new_order)
-        db.commit()
-        db.refresh(new_order)
+        db.flush() # Dapatkan new_order.id, commit sekali bersama item
         
         for v_item in validated_items:
             order_item = OrderItem(
@@ -185,9 +255,10 @@ def create_order(
                 price=v_item['price']
             )
             db.add(order_item)
-        db.commit()
-        
-        return {
+        db.refresh(new_order) # created_at dari server default, dipakai rollup
+        record_order_created(db, new_order)
+
+        response = {
             "status": "success", 
             "data": {
                 "id": new_order.id, 
@@ -201,46 +272,90 @@ def create_order(
                 "estimated_delivery_time": new_order.estimated_delivery_time
             }
         }
+        idempotency.complete(db, record, 200, jsonable_encoder(response)) # Satu commit dengan order
+        db.commit()
+        return response
         
     except Exception as e:
         db.rollback()
-        # If stock was reduced but DB failed, typically we should try to rollback stock too, 
-        # but for this MVP scope we skip distributed transaction complexity.
+        idempotency.release(db, record)
+        # Stok sudah direservasi tapi order gagal disimpan -> kembalikan stok (kompensasi)
+        release_reservation(reservation_id)
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- DRIVER ENDPOINTS (Moved Up to Avoid Conflict with /orders/{order_id}) ---
 
+def _orders_with_items(query):
+    # Item semua order diambil dengan satu query IN (selectinload), bukan satu query per order
+    orders = query.options(selectinload(Order.items)).all()
+    return [(o, o.items) for o in orders]
+
+async def _fetch_enrichment_maps(orders, with_addresses: bool = True):
+    """
+    Restaurant & User Service dipanggil paralel (deadline total, placeholder kalau gagal).
+    Hanya user/alamat yang dipakai order ini yang diminta (bukan /users/admin/all).
+    Return: (restaurant_map, user_map, address_map)
+    """
+    calls = {}
+    user_ids = [o.user_id for o in orders] + [o.driver_id for o in orders]
+    enrichment.add_batch_calls(calls, "users", f"{USER_SERVICE_URL}/internal/users/batch", user_ids)
+    if with_addresses:
+        enrichment.add_batch_calls(
+            calls, "addresses", f"{USER_SERVICE_URL}/internal/addresses/batch", [o.address_id for o in orders]
+        )
+
+    # Nama restoran dari cache (di threadpool: saat cache miss loader melakukan HTTP call blocking)
+    upstream, restaurant_map = await asyncio.gather(
+        enrichment.fetch_json(calls), run_in_threadpool(restaurant_name_map)
+    )
+    return (
+        restaurant_map,
+        enrichment.collect_batch(upstream, "users"),
+        enrichment.collect_batch(upstream, "addresses")
+    )
+
+AVAILABLE_ORDERS_RADIUS_KM = float(os.getenv("AVAILABLE_ORDERS_RADIUS_KM", "10"))
+
 @app.get("/orders/available")
-def get_available_orders(
+async def get_available_orders(
     request: Request, # Need request for Token
+    lat: float = None, # Posisi driver (opsional): hanya order dengan titik jemput dalam radius
+    lng: float = None,
+    radius_km: float = None,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    orders = db.query(Order).filter(Order.status.in_([STATUS_PAID, STATUS_PREPARING]), Order.driver_id == None).all()
-    
-    restaurant_map = {}
-    user_map = {} # Map for User Info
+    nearby = lat is not None or lng is not None
+    if nearby:
+        radius_km = radius_km or AVAILABLE_ORDERS_RADIUS_KM
+        if not geo.valid_coordinates(lat, lng) or radius_km <= 0:
+            raise HTTPException(status_code=400, detail="lat and lng are required together and radius_km must be positive")
+
+    def load():
+        query = db.query(Order).filter(Order.status.in_([STATUS_PAID, STATUS_PREPARING]), Order.driver_id == None)
+        if nearby:
+            # Kandidat dari index geohash (sel pusat + tetangga), jarak pastinya dicek di bawah
+            query = query.filter(or_(*[Order.pickup_geohash.like(cell + "%") for cell in geo.covering_cells(lat, lng, radius_km)]))
+        return _orders_with_items(query)
+
+    rows = await run_in_threadpool(load)
+
+    distances = {}
+    if nearby:
+        for o, _ in rows:
+            distances[o.id] = geo.haversine_km(lat, lng, o.pickup_latitude, o.pickup_longitude)
+        rows = sorted(
+            [(o, items) for o, items in rows if distances[o.id] <= radius_km],
+            key=lambda row: distances[row[0].id]
+        )
 
-    try:
-        res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
-        if res.status_code == 200:
-            for r in res.json()['data']:
-                restaurant_map[r['id']] = r['name']
-
-        # Fetch Users for Real Names & Addresses
-        USER_SERVICE_URL = "http://user-service:8000"
-        u_res = requests.get(f"{USER_SERVICE_URL}/users/admin/all")
-        if u_res.status_code == 200:
-            for u in u_res.json()['data']:
-                 user_map[u['id']] = u
-    except:
-        pass
+    # Fetch Restaurants & Users for Real Names & Addresses
+    restaurant_map, user_map, address_map = await _fetch_enrichment_maps([o for o, _ in rows])
 
     data = []
-    for o in orders:
-        items = db.query(OrderItem).filter(OrderItem.order_id == o.id).all()
+    for o, items in rows:
         items_data = [
             {"menu_item_name": i.menu_item_name, "quantity": i.quantity, "price": float(i.price)} for i in items
         ]
@@ -252,11 +367,11 @@ def get_available_orders(
         user_info = user_map.get(o.user_id)
         if user_info:
             c_name = user_info['name']
-            # Find address
-            for addr in user_info.get('addresses', []):
-                if addr['id'] == o.address_id:
-                    c_addr = addr['full_address']
-                    break
+
+        # Find address (pastikan alamat milik customer order ini)
+        addr = address_map.get(o.address_id)
+        if addr and addr['user_id'] == o.user_id:
+            c_addr = addr['full_address']
 
         data.append({
             "order_id": o.id, 
@@ -269,42 +384,35 @@ def get_available_orders(
             "total_price": float(o.total_price),
             "status": o.status,
             "created_at": o.created_at,
+            "pickup_latitude": o.pickup_latitude,
+            "pickup_longitude": o.pickup_longitude,
             "items": items_data
         })
+        if nearby:
+            data[-1]["distance_km"] = round(distances[o.id], 2)
     return {"status": "success", "data": data}
 
 @app.get("/orders/driver/my-orders")
-def get_my_driver_orders(
+async def get_my_driver_orders(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    # Filter OUT completed orders (ACTIVE ONLY)
-    orders = db.query(Order).filter(
-        Order.driver_id == user_id,
-        Order.status.notin_([STATUS_DELIVERED, STATUS_COMPLETED, STATUS_CANCELLED])
-    ).order_by(Order.created_at.desc()).all()
-    
-    restaurant_map = {}
-    user_map = {} # Map for User Info
+    def load():
+        # Filter OUT completed orders (ACTIVE ONLY)
+        return _orders_with_items(
+            db.query(Order).filter(
+                Order.driver_id == user_id,
+                Order.status.notin_([STATUS_DELIVERED, STATUS_COMPLETED, STATUS_CANCELLED])
+            ).order_by(Order.created_at.desc())
+        )
 
-    try:
-        res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
-        if res.status_code == 200:
-            for r in res.json()['data']:
-                restaurant_map[r['id']] = r['name']
-        
-        # Fetch Users
-        USER_SERVICE_URL = "http://user-service:8000"
-        u_res = requests.get(f"{USER_SERVICE_URL}/users/admin/all")
-        if u_res.status_code == 200:
-            for u in u_res.json()['data']:
-                 user_map[u['id']] = u
-    except:
-        pass
+    rows = await run_in_threadpool(load)
+
+    # Fetch Restaurants & Users
+    restaurant_map, user_map, address_map = await _fetch_enrichment_maps([o for o, _ in rows])
 
     data = []
-    for o in orders:
-        items = db.query(OrderItem).filter(OrderItem.order_id == o.id).all()
+    for o, items in rows:
         items_data = [
             {"menu_item_name": i.menu_item_name, "quantity": i.quantity, "price": float(i.price)} for i in items
         ]
@@ -321,11 +429,11 @@ def get_my_driver_orders(
         user_info = user_map.get(o.user_id)
         if user_info:
             customer_name = user_info['name']
-            # Find address
-            for addr in user_info.get('addresses', []):
-                if addr['id'] == o.address_id:
-                    customer_address = addr['full_address']
-                    break
+
+        # Find address (pastikan alamat milik customer order ini)
+        addr = address_map.get(o.address_id)
+        if addr and addr['user_id'] == o.user_id:
+            customer_address = addr['full_address']
 
         data.append({
             "order_id": o.id,
@@ -342,22 +450,48 @@ def get_my_driver_orders(
         })
     return {"status": "success", "data": data}
 
+def assign_driver(db: Session, order_id: int, driver_user_id: int, before_commit=None):
+    """
+    Assign driver secara atomik: transisi PAID/PREPARING -> ON_THE_WAY yang hanya berhasil kalau
+    order belum punya driver dan version-nya belum berubah. Dua driver (atau dispatcher + driver)
+    yang berebut order yang sama -> hanya satu yang menang. Return order, atau None kalau kalah.
+
+    Idempotent per (order_id, driver): order yang SUDAH di-assign ke driver yang sama dianggap berhasil,
+    jadi pemanggil aman mengulang request yang response pertamanya timeout.
+    """
+    try:
+        return transition(
+            db, order_id, STATUS_ON_DELIVERY,
+            expected_from={STATUS_PAID, STATUS_PREPARING},
+            values={"driver_id": driver_user_id},
+            guards=[Order.driver_id == None],
+            before_commit=before_commit
+        )
+    except TransitionError:
+        order = db.query(Order).filter(Order.id == order_id).first()
+        if order is not None and order.driver_id == driver_user_id and normalize(order.status) == STATUS_ON_DELIVERY:
+            return order
+        return None
+
 @app.post("/orders/{order_id}/accept")
 def accept_order_driver(
     order_id: int,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
+    if not db.query(Order.id).filter(Order.id == order_id).first():
         raise HTTPException(status_code=404, detail="Order not found")
-        
-    if order.driver_id is not None:
-        raise HTTPException(status_code=400, detail="Order already taken")
-        
-    order.driver_id = user_id
-    order.status = STATUS_ON_DELIVERY
-    db.commit()
+
+    # Catat task di Driver Service (beban driver untuk dispatcher) lewat outbox, satu transaksi dengan assign
+    def register_task(order, previous_status):
+        outbox.enqueue(
+            db, "driver.task.assigned", "POST", f"{DRIVER_SERVICE_URL}/internal/drivers/tasks",
+            {"user_id": user_id, "order_id": order_id}, idempotency_key=f"driver-task:{order_id}:{user_id}"
+        )
+
+    if not assign_driver(db, order_id, user_id, before_commit=register_task):
+        raise HTTPException(status_code=409, detail="Order already taken")
+    outbox.notify()
     return {"status": "success", "message": "Order accepted"}
 
 DRIVER_SERVICE_URL = "http://driver-service:8000"
@@ -374,31 +508,27 @@ def complete_order_driver(
         
     if order.driver_id != user_id:
         raise HTTPException(status_code=403, detail="Not your order")
-        
-    order.status = STATUS_DELIVERED 
-    db.commit()
-    
-    # --- INTEGRASI: Update Gaji Driver ---
-    try:
+
+    # Gaji driver dicatat lewat outbox di transaksi yang sama dengan DELIVERED: tidak hilang kalau
+    # Driver Service lambat / down, dan tidak dobel karena hanya satu request complete yang menang
+    def record_earning(order, previous_status):
         earning = float(order.total_price) * 0.10
-        print(f"DEBUG: Computing Earning for Driver {user_id}. Order {order.id} Price {order.total_price} -> Earning {earning}")
-        
-        res = requests.post(
-            f"{DRIVER_SERVICE_URL}/internal/drivers/earnings",
-            json={
-                "user_id": user_id,
-                "amount": earning,
-                "order_id": order.id
-            }
+        outbox.enqueue(
+            db, "driver.earning.recorded", "POST", f"{DRIVER_SERVICE_URL}/internal/drivers/earnings",
+            {"user_id": user_id, "amount": earning, "order_id": order.id},
+            idempotency_key=f"driver-earning:{order.id}"
         )
-        print(f"DEBUG: Driver Service Response: {res.status_code} {res.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to record earning (Request Error): {e}")
-        if e.response:
-             print(f"Response Body: {e.response.text}")
-    except Exception as e:
-        print(f"Failed to record earning: {e}")
-    
+
+    try:
+        transition(
+            db, order_id, STATUS_DELIVERED,
+            expected_from={STATUS_ON_DELIVERY}, guards=[Order.driver_id == user_id],
+            before_commit=record_earning
+        )
+    except TransitionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    outbox.notify()
+
     return {"status": "success", "message": "Order completed"}
 
 @app.post("/orders/{order_id}/cancel") # Use POST or PUT
@@ -414,92 +544,92 @@ def cancel_order(
     if order.user_id != user_id:
         raise HTTPException(status_code=403, detail="Not your order")
         
-    if order.status not in [STATUS_PENDING]:
-        raise HTTPException(status_code=400, detail="Cannot cancel order in this status")
-        
-    order.status = STATUS_CANCELLED
-    db.commit()
+    # Kembalikan stok yang direservasi saat order dibuat (via outbox, satu transaksi dengan pembatalan)
+    try:
+        transition(
+            db, order_id, STATUS_CANCELLED, expected_from={STATUS_PENDING},
+            before_commit=lambda o, previous: queue_reservation_cancel(db, o.reservation_id, previous)
+        )
+    except TransitionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    outbox.notify()
     return {"status": "success", "message": "Order cancelled"}
 
 @app.get("/orders/{order_id}")
-def get_order_by_id(
+async def get_order_by_id(
     order_id: int,
     request: Request, # Add Request
-    user_id: int = Depends(get_current_user_id),
+    principal: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
-    # Ensure user owns the order OR user is admin
-    order = db.query(Order).filter(Order.id == order_id).first()
+    def load():
+        # Ensure user owns the order OR user is admin
+        order = db.query(Order).filter(Order.id == order_id).first()
+        if not order:
+            return None, []
+        return order, db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+
+    order, items = await run_in_threadpool(load)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-    
     # --- FETCH DETAILS (INTEGRASI) ---
     restaurant_name = f"Restaurant {order.restaurant_id}"
     restaurant_address = "Restaurant Address"
     customer_name = "Customer"
     customer_address = f"Address {order.address_id}"
     driver_details = None # Default null
-    
-    # 1. Fetch Restaurant Info
-    try:
-        r_res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants/{order.restaurant_id}")
-        if r_res.status_code == 200:
-            r_data = r_res.json()['data']
-            restaurant_name = r_data['name']
-            restaurant_address = r_data.get('address', 'Unknown Address')
-    except Exception as e:
-        print(f"Failed to fetch restaurant: {e}")
 
-    # 2. Fetch User Info (Profile & Address)
-    USER_SERVICE_URL = "http://user-service:8000"
+    # 1. Restaurant Info (cache; hanya restoran yang belum ada di cache diminta langsung)
+    directory = await run_in_threadpool(restaurant_directory) or {}
+    cached_restaurant = directory.get(order.restaurant_id)
+
+    # Semua upstream dipanggil paralel: latency = max(), bukan sum()
+    calls = {}
+    if cached_restaurant:
+        restaurant_name = cached_restaurant['name']
+        restaurant_address = cached_restaurant.get('address') or 'Unknown Address'
+    else:
+        calls["restaurant"] = f"{RESTAURANT_SERVICE_URL}/restaurants/{order.restaurant_id}"
+    # 2. User Info (Profile & Address)
+    # Nama sudah ada di claim token; profile hanya diminta untuk token lama tanpa claim name
+    if principal.name:
+        customer_name = principal.name
     token = request.headers.get("Authorization")
     if token:
-        try:
-            headers = {"Authorization": token}
-            
-            # Profile
-            u_res = requests.get(f"{USER_SERVICE_URL}/users/profile/me", headers=headers)
-            if u_res.status_code == 200:
-                customer_name = u_res.json()['name']
-            
-            # Address
-            a_res = requests.get(f"{USER_SERVICE_URL}/users/addresses", headers=headers)
-            if a_res.status_code == 200:
-                addresses = a_res.json()['data']
-                # Find matching address
-                matched = next((a for a in addresses if a['id'] == order.address_id), None)
-                if matched:
-                    customer_address = matched['full_address']
-        except Exception as e:
-            print(f"Failed to fetch user info: {e}")
+        headers = {"Authorization": token}
+        if not principal.name:
+            calls["profile"] = (f"{USER_SERVICE_URL}/users/profile/me", headers)
+        calls["addresses"] = (f"{USER_SERVICE_URL}/users/addresses", headers)
+    # 3. Driver Details (Driver Service Internal Endpoint)
+    if order.driver_id:
+        calls["driver"] = f"{DRIVER_SERVICE_URL}/internal/drivers/details/{order.driver_id}"
+
+    upstream = await enrichment.fetch_json(calls)
+
+    if upstream.get("restaurant"):
+        r_data = upstream["restaurant"]['data']
+        restaurant_name = r_data['name']
+        restaurant_address = r_data.get('address', 'Unknown Address')
+
+    if upstream.get("profile"):
+        customer_name = upstream["profile"]['name']
+
+    if upstream.get("addresses"):
+        # Find matching address
+        matched = next((a for a in upstream["addresses"]['data'] if a['id'] == order.address_id), None)
+        if matched:
+            customer_address = matched['full_address']
 
-     # 3. Driver Details
     if order.driver_id:
-         # Call Driver Service Internal Endpoint
-         DRIVER_SERVICE_URL = "http://driver-service:8000"
-         try:
-             d_res = requests.get(f"{DRIVER_SERVICE_URL}/internal/drivers/details/{order.driver_id}")
-             if d_res.status_code == 200:
-                 driver_details = d_res.json()
-             else:
-                 driver_details = {
-                     "name": f"Driver {order.driver_id}", 
-                     "phone": "-", 
-                     "vehicle": "Unknown",
-                     "vehicle_number": "-",
-                     "vehicle_type": "Unknown"
-                 }
-         except Exception as e:
-             print(f"Failed to fetch driver details: {e}")
-             driver_details = {
-                 "name": "Driver (Error)", 
-                 "phone": "-", 
-                 "vehicle": "Unknown",
-                 "vehicle_number": "-",
-                 "vehicle_type": "Unknown"
-             }
+        driver_details = upstream.get("driver") or {
+            "name": f"Driver {order.driver_id}", 
+            "phone": "-", 
+            "vehicle": "Unknown",
+            "vehicle_number": "-",
+            "vehicle_type": "Unknown",
+            "location": None
+        }
 
     # Normalize Status for Frontend (Legacy fix)
     display_status = order.status
@@ -539,40 +669,68 @@ def get_order_by_id(
     
     return {"status": "success", "data": order_data}
 
+DRIVER_LOCATION_STREAM_INTERVAL = float(os.getenv("DRIVER_LOCATION_STREAM_INTERVAL_SECONDS", "3"))
+DRIVER_LOCATION_STREAM_MAX_SECONDS = float(os.getenv("DRIVER_LOCATION_STREAM_MAX_SECONDS", "600"))
+
+# Posisi driver secara live (Server-Sent Events). Posisi dibaca dari store in-memory Driver Service,
+# event hanya dikirim kalau posisinya berubah; klien reconnect setelah stream selesai.
+@app.get("/orders/{order_id}/driver-location/stream")
+async def stream_driver_location(
+    order_id: int,
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    order = await run_in_threadpool(lambda: db.query(Order).filter(Order.id == order_id).first())
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if user_id not in (order.user_id, order.driver_id):
+        raise HTTPException(status_code=403, detail="Not your order")
+    if not order.driver_id:
+        raise HTTPException(status_code=400, detail="Order has no driver yet")
+
+    url = f"{DRIVER_SERVICE_URL}/internal/drivers/{order.driver_id}/location"
+
+    async def events():
+        last_update = None
+        deadline = time.monotonic() + DRIVER_LOCATION_STREAM_MAX_SECONDS
+        while time.monotonic() < deadline and not await request.is_disconnected():
+            result = (await enrichment.fetch_json({"location": url})).get("location")
+            position = result['data'] if result else None
+            if position and position['updated_at'] != last_update:
+                last_update = position['updated_at']
+                yield f"event: location\ndata: {json.dumps(jsonable_encoder(position))}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(DRIVER_LOCATION_STREAM_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/orders/driver/history")
-def get_driver_order_history(
+async def get_driver_order_history(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    # Fetch Completed Orders
-    orders = db.query(Order).filter(
-        Order.driver_id == user_id,
-        Order.status.in_([STATUS_DELIVERED, STATUS_COMPLETED])
-    ).order_by(Order.created_at.desc()).all()
-    
-    # ... (Same mapping logic as others, simplified for brevity or reuse) ...
-    # Reuse mapping logic ideally, but for now duplicate for safety/speed
-    restaurant_map = {}
-    user_map = {} # Map for User Info
-    
-    try:
-        res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
-        if res.status_code == 200:
-            for r in res.json()['data']:
-                restaurant_map[r['id']] = r['name']
-                
-        # Fetch Users for Real Names & Addresses
-        USER_SERVICE_URL = "http://user-service:8000"
-        u_res = requests.get(f"{USER_SERVICE_URL}/users/admin/all")
-        if u_res.status_code == 200:
-            for u in u_res.json()['data']:
-                 user_map[u['id']] = u
-    except:
-        pass
-        
+    def load():
+        # Fetch Completed Orders
+        return _orders_with_items(
+            db.query(Order).filter(
+                Order.driver_id == user_id,
+                Order.status.in_([STATUS_DELIVERED, STATUS_COMPLETED])
+            ).order_by(Order.created_at.desc())
+        )
+
+    rows = await run_in_threadpool(load)
+
+    # Fetch Restaurants & Users for Real Names & Addresses
+    restaurant_map, user_map, address_map = await _fetch_enrichment_maps([o for o, _ in rows])
+
     data = []
-    for o in orders:
-        items = db.query(OrderItem).filter(OrderItem.order_id == o.id).all()
+    for o, items in rows:
         items_data = [{"menu_item_name": i.menu_item_name, "quantity": i.quantity, "price": float(i.price)} for i in items]
         
         # Resolve Customer Info
@@ -582,11 +740,11 @@ def get_driver_order_history(
         user_info = user_map.get(o.user_id)
         if user_info:
             customer_name = user_info['name']
-            # Find address
-            for addr in user_info.get('addresses', []):
-                if addr['id'] == o.address_id:
-                    customer_address = addr['full_address']
-                    break
+
+        # Find address (pastikan alamat milik customer order ini)
+        addr = address_map.get(o.address_id)
+        if addr and addr['user_id'] == o.user_id:
+            customer_address = addr['full_address']
         
         data.append({
             "order_id": o.id,
@@ -606,6 +764,27 @@ def get_driver_order_history(
 class OrderStatusUpdate(BaseModel):
     status: str
 
+# Antrian dispatcher: order PAID tanpa driver yang punya titik jemput, paling lama dulu
+# (didaftarkan sebelum /internal/orders/{order_id} agar "dispatch-queue" tidak dianggap id)
+@app.get("/internal/orders/dispatch-queue")
+def get_dispatch_queue_internal(limit: int = 200, db: Session = Depends(get_db)):
+    orders = db.query(Order).filter(
+        Order.status == STATUS_PAID, Order.driver_id == None, Order.pickup_latitude != None
+    ).order_by(Order.id).limit(min(max(limit, 1), 1000)).all()
+    return {
+        "status": "success",
+        "data": [
+            {
+                "id": o.id,
+                "restaurant_id": o.restaurant_id,
+                "pickup_latitude": o.pickup_latitude,
+                "pickup_longitude": o.pickup_longitude,
+                "total_price": float(o.total_price),
+                "created_at": o.created_at
+            } for o in orders
+        ]
+    }
+
 # 1. Endpoint untuk Payment Service mengecek Order
 @app.get("/internal/orders/{order_id}")
 def get_order_internal(order_id: int, db: Session = Depends(get_db)):
@@ -626,11 +805,65 @@ def update_order_status_internal(order_id: int, update: OrderStatusUpdate, db: S
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    order.status = update.status
-    db.commit()
+    # Sinkronkan reservasi stok (via outbox, satu transaksi dengan perubahan status):
+    # PAID -> stok terpakai, CANCELLED -> stok kembali (release / return tergantung status sebelumnya)
+    def sync_reservation(o, previous_status):
+        if previous_status == STATUS_PENDING and update.status == STATUS_PAID:
+            queue_reservation_action(db, o.reservation_id, "confirm")
+        elif update.status == STATUS_CANCELLED:
+            queue_reservation_cancel(db, o.reservation_id, previous_status)
+
+    try:
+        order = transition(db, order_id, update.status, before_commit=sync_reservation)
+    except TransitionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    outbox.notify()
     return {"message": "Status updated successfully", "new_status": order.status}
 
-# ... (kode sebelumnya) ...
+class PaymentEvent(BaseModel):
+    event_id: str
+    type: str
+    occurred_at: Optional[str] = None
+    data: dict
+
+# Subscriber event Payment Service (payment.succeeded -> PAID), dikirim relay outbox Payment Service
+@app.post("/internal/events/payment")
+def receive_payment_event(event: PaymentEvent, db: Session = Depends(get_db)):
+    try:
+        result = payment_events.dispatch(db, jsonable_encoder(event))
+    except payment_events.RetryableEventError as e:
+        raise HTTPException(status_code=503, detail=e.args[0]) # Relay mengirim ulang
+    except TransitionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"status": "success", "data": {"event_id": event.event_id, "result": result}}
+
+class DriverAssignment(BaseModel):
+    driver_id: int # User id driver (sama dengan Order.driver_id)
+
+class BulkAssignmentItem(BaseModel):
+    order_id: int
+    driver_id: int
+
+class BulkAssignmentRequest(BaseModel):
+    assignments: List[BulkAssignmentItem]
+
+# Assign satu order (GraphQL accept_order di Driver Service). 409 kalau sudah diambil driver lain,
+# 200 lagi kalau di-retry oleh driver yang sama (lihat assign_driver).
+@app.put("/internal/orders/{order_id}/assign-driver")
+def assign_driver_internal(order_id: int, req: DriverAssignment, db: Session = Depends(get_db)):
+    order = assign_driver(db, order_id, req.driver_id)
+    if not order:
+        raise HTTPException(status_code=409, detail="Order is not available for assignment")
+    return {"status": "success", "data": {"order_id": order.id, "driver_id": order.driver_id, "status": order.status}}
+
+# Hasil satu putaran dispatcher: tiap pasangan di-assign dengan conditional update sendiri
+@app.post("/internal/orders/assignments")
+def assign_drivers_bulk_internal(req: BulkAssignmentRequest, db: Session = Depends(get_db)):
+    results = []
+    for item in req.assignments:
+        order = assign_driver(db, item.order_id, item.driver_id)
+        results.append({"order_id": item.order_id, "driver_id": item.driver_id, "assigned": order is not None})
+    return {"status": "success", "data": results}
 
 # 3. Endpoint Get Order by Status (Untuk Driver cari order PAID)
 @app.get("/internal/orders/status/{status}")
@@ -647,53 +880,57 @@ def get_orders_by_status_internal(status: str, db: Session = Depends(get_db)):
     ]
 
 # 4. Endpoint Sales Statistics (Admin Dashboard)
+# Dibaca dari rollup order_daily_stats (tanggal x restoran x status), bukan scan tabel orders.
 @app.get("/orders/admin/sales/statistics")
 def get_sales_statistics(db: Session = Depends(get_db)):
-    # Total Orders
-    total_orders = db.query(Order).count()
-    
-    # Total Sales (Sum of total_price where status is NOT CANCELLED)
-    # Using coalesce to return 0 if None
-    total_sales = db.query(func.coalesce(func.sum(Order.total_price), 0)).filter(Order.status != STATUS_CANCELLED).scalar()
-    
-    # Completed Orders (DELIVERED or COMPLETED)
-    completed_orders = db.query(Order).filter(Order.status.in_([STATUS_DELIVERED, STATUS_COMPLETED])).count()
-
-    # Pending Orders (PENDING, PAID, PREPARING, ON_THE_WAY)
-    pending_orders = db.query(Order).filter(
-        Order.status.in_([STATUS_PENDING, STATUS_PAID, STATUS_PREPARING, STATUS_ON_DELIVERY])
-    ).count()
+    rows = db.query(
+        OrderDailyStat.stat_date,
+        OrderDailyStat.status,
+        func.sum(OrderDailyStat.order_count).label('count'),
+        func.sum(OrderDailyStat.total_revenue).label('revenue')
+    ).group_by(OrderDailyStat.stat_date, OrderDailyStat.status).all()
+
+    total_orders = 0
+    total_sales = 0.0
+    completed_orders = 0
+    pending_orders = 0
+    daily = {}
+    for r in rows:
+        count = int(r.count or 0)
+        if count == 0:
+            continue
+        total_orders += count
+        if r.status in [STATUS_DELIVERED, STATUS_COMPLETED]:
+            completed_orders += count
+        elif r.status in [STATUS_PENDING, STATUS_PAID, STATUS_PREPARING, STATUS_ON_DELIVERY]:
+            pending_orders += count
+
+        # Revenue & statistik harian tidak menghitung order CANCELLED
+        if r.status == STATUS_CANCELLED:
+            continue
+        total_sales += float(r.revenue or 0)
+        day = daily.setdefault(r.stat_date, {"count": 0, "revenue": 0.0})
+        day["count"] += count
+        day["revenue"] += float(r.revenue or 0)
 
     # Calculate Average Order Value
     avg_order = 0
     if total_orders > 0:
-        avg_order = float(total_sales or 0) / total_orders
+        avg_order = total_sales / total_orders
 
-    # Daily Statistics (Last 7 Days)
-    # MySQL: DATE(created_at)
-    # SQLAlchemy: func.date(...)
-    from datetime import timedelta
-    
-    # Simple Group By Date
-    daily_stats_query = db.query(
-        func.date(Order.created_at).label('date'),
-        func.count(Order.id).label('count'),
-        func.sum(Order.total_price).label('revenue')
-    ).filter(Order.status != STATUS_CANCELLED).group_by(func.date(Order.created_at)).all()
-    
     daily_statistics = [
         {
-            "date": str(s.date),
-            "total_orders": s.count,
-            "total_sales": float(s.revenue or 0)
-        } for s in daily_stats_query
+            "date": str(d),
+            "total_orders": day["count"],
+            "total_sales": day["revenue"]
+        } for d, day in sorted(daily.items())
     ]
 
     return {
         "status": "success", 
         "data": {
             "total_orders": total_orders,
-            "total_revenue": float(total_sales or 0),
+            "total_revenue": total_sales,
             "completed_orders": completed_orders,
             "pending_orders": pending_orders,
             "average_order_value": avg_order,
@@ -703,27 +940,21 @@ def get_sales_statistics(db: Session = Depends(get_db)):
 
 @app.get("/orders/admin/sales/restaurants")
 def get_restaurant_sales(db: Session = Depends(get_db)):
-    # Group orders by restaurant_id and sum total_price
-    # 1. Get Sales Data (Grouped)
+    # 1. Get Sales Data (Grouped) dari rollup
     sales_results = db.query(
-        Order.restaurant_id,
-        func.count(Order.id).label("total_orders"),
-        func.sum(Order.total_price).label("total_sales")
-    ).filter(Order.status != STATUS_CANCELLED).group_by(Order.restaurant_id).all()
-    
-    print(f"DEBUG SALES RESULTS: {sales_results}") # DEBUG LOG
+        OrderDailyStat.restaurant_id,
+        func.sum(OrderDailyStat.order_count).label("total_orders"),
+        func.sum(OrderDailyStat.total_revenue).label("total_sales")
+    ).filter(OrderDailyStat.status != STATUS_CANCELLED).group_by(OrderDailyStat.restaurant_id).all()
     
-    sales_map = {r.restaurant_id: {"orders": r.total_orders, "sales": float(r.total_sales or 0)} for r in sales_results}
-    print(f"DEBUG SALES MAP: {sales_map}") # DEBUG LOG
+    sales_map = {
+        r.restaurant_id: {"orders": int(r.total_orders or 0), "sales": float(r.total_sales or 0)}
+        for r in sales_results if r.total_orders
+    }
 
-    # 2. Fetch All Restaurants
-    all_restaurants = []
-    try:
-        res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
-        if res.status_code == 200:
-            all_restaurants = res.json()['data']
-    except Exception as e:
-        print(f"Failed to fetch restaurants: {e}")
+    # 2. Fetch All Restaurants (cached)
+    directory = restaurant_directory()
+    if directory is None:
         # Fallback: only show those with sales if API fails
         data = []
         for r_id, stats in sales_map.items():
@@ -737,8 +968,7 @@ def get_restaurant_sales(db: Session = Depends(get_db)):
 
     # 3. Merge Data
     data = []
-    for r in all_restaurants:
-        r_id = r['id']
+    for r_id, r in directory.items():
         stats = sales_map.get(r_id, {"orders": 0, "sales": 0})
         data.append({
             "restaurant_id": r_id,
@@ -749,6 +979,20 @@ def get_restaurant_sales(db: Session = Depends(get_db)):
         
     return {"status": "success", "data": data}
 
+# Statistik client HTTP internal (latency/error per upstream)
+@app.get("/internal/upstream-stats")
+def get_upstream_stats():
+    return {"status": "success", "data": http_client.stats(), "caches": {"restaurants": restaurant_cache.stats(), "tokens": token_verifier.stats()}}
+
+@app.get("/internal/outbox/stats")
+def get_outbox_stats(db: Session = Depends(get_db)):
+    return {"status": "success", "data": outbox.stats(db)}
+
+# Jadwalkan ulang event yang gagal permanen (setelah service tujuan diperbaiki)
+@app.post("/internal/outbox/retry-failed")
+def retry_failed_outbox_events(db: Session = Depends(get_db)):
+    return {"status": "success", "data": {"requeued": outbox.retry_failed(db)}}
+
 # --- NEW INTERNAL ENDPOINT FOR DRIVER SERVICE ---
 @app.get("/internal/orders/driver/{driver_id}")
 def get_driver_active_orders_internal(driver_id: int, db: Session = Depends(get_db)):
@@ -771,30 +1015,119 @@ def get_driver_active_orders_internal(driver_id: int, db: Session = Depends(get_
         ]
     }
 
-@app.get("/orders/admin/all")
-def get_all_orders_admin(db: Session = Depends(get_db)):
-    orders = db.query(Order).order_by(Order.created_at.desc()).all()
-    
-    # 1. Fetch Restaurant Map
-    restaurant_map = {}
-    try:
-        r_res = requests.get(f"{RESTAURANT_SERVICE_URL}/restaurants")
-        if r_res.status_code == 200:
-            for r in r_res.json()['data']:
-                restaurant_map[r['id']] = r['name']
-    except:
-        pass
-
-    # 2. Fetch User Map (For Customer and Driver Names)
-    user_map = {}
+MAX_ACTIVE_COUNT_IDS = 500
+
+# Jumlah order aktif per driver (user id) dalam satu query GROUP BY, untuk dashboard admin driver.
+# ?ids=1,2,3 membatasi ke driver tertentu; tanpa ids -> semua driver yang punya order aktif.
+# Driver tanpa order aktif tidak ada di hasil (artinya 0)
+@app.get("/internal/orders/drivers/active-counts")
+def get_driver_active_counts_internal(ids: Optional[str] = None, db: Session = Depends(get_db)):
+    query = db.query(Order.driver_id, func.count(Order.id)).filter(
+        Order.driver_id.isnot(None),
+        Order.status.notin_([STATUS_DELIVERED, STATUS_COMPLETED, STATUS_CANCELLED])
+    )
+    if ids is not None:
+        try:
+            id_list = sorted({int(i) for i in ids.split(",") if i.strip()})
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+        if len(id_list) > MAX_ACTIVE_COUNT_IDS:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_ACTIVE_COUNT_IDS} ids per request")
+        if not id_list:
+            return {"status": "success", "data": []}
+        query = query.filter(Order.driver_id.in_(id_list))
+
+    rows = query.group_by(Order.driver_id).all()
+    return {
+        "status": "success",
+        "data": [{"driver_id": driver_id, "active_orders": count} for driver_id, count in rows]
+    }
+
+ADMIN_ORDERS_MAX_LIMIT = 200
+COUNT_ESTIMATE_CAP = 10000
+
+def _encode_cursor(order: Order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
     try:
-        USER_SERVICE_URL = "http://user-service:8000"
-        u_res = requests.get(f"{USER_SERVICE_URL}/users/admin/all")
-        if u_res.status_code == 200:
-            for u in u_res.json()['data']:
-                user_map[u['id']] = u # Store whole object
-    except Exception as e:
-        print(f"Failed to fetch user map: {e}")
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _estimate_total(db: Session, query, filtered: bool):
+    """
+    Total tanpa full scan: tanpa filter pakai statistik tabel MySQL, dengan filter
+    hitung maksimal COUNT_ESTIMATE_CAP baris. Return (total, exact)
+    """
+    if not filtered and db.bind.dialect.name == "mysql":
+        rows = db.execute(text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'orders'"
+        )).scalar()
+        if rows is not None:
+            return int(rows), False
+
+    capped = query.with_entities(Order.id).limit(COUNT_ESTIMATE_CAP + 1).subquery()
+    count = db.query(func.count()).select_from(capped).scalar()
+    return min(count, COUNT_ESTIMATE_CAP), count <= COUNT_ESTIMATE_CAP
+
+@app.get("/orders/admin/all")
+async def get_all_orders_admin(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    restaurant_id: Optional[int] = None,
+    driver_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    # Tanpa limit -> semua order (kompatibel dengan frontend lama, sama seperti /users/admin/all
+    # dan /drivers/admin/all); dengan limit -> satu halaman + next_cursor
+    if limit is not None and not (1 <= limit <= ADMIN_ORDERS_MAX_LIMIT):
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {ADMIN_ORDERS_MAX_LIMIT}")
+
+    query = db.query(Order)
+    if status:
+        # ON_THE_WAY juga mencakup status legacy ON_DELIVERY
+        statuses = [status, "ON_DELIVERY"] if status == STATUS_ON_DELIVERY else [status]
+        query = query.filter(Order.status.in_(statuses))
+    if restaurant_id is not None:
+        query = query.filter(Order.restaurant_id == restaurant_id)
+    if driver_id is not None:
+        query = query.filter(Order.driver_id == driver_id)
+    if date_from:
+        query = query.filter(Order.created_at >= date_from)
+    if date_to:
+        query = query.filter(Order.created_at < date_to + timedelta(days=1))
+    filtered = query.whereclause is not None
+
+    page_query = query
+    if cursor:
+        c_created_at, c_id = _decode_cursor(cursor)
+        page_query = page_query.filter(or_(
+            Order.created_at < c_created_at,
+            and_(Order.created_at == c_created_at, Order.id < c_id)
+        ))
+
+    def load():
+        ordered = page_query.order_by(Order.created_at.desc(), Order.id.desc())
+        if limit is None:
+            orders = ordered.all()
+            return orders, ((len(orders), True) if not cursor else _estimate_total(db, query, filtered))
+        orders = ordered.limit(limit + 1).all()
+        return orders, _estimate_total(db, query, filtered)
+
+    orders, (total_estimate, total_exact) = await run_in_threadpool(load)
+    has_more = limit is not None and len(orders) > limit
+    if limit is not None:
+        orders = orders[:limit]
+
+    # Fetch Restaurant Map & User Map (For Customer and Driver Names) secara paralel
+    restaurant_map, user_map, _ = await _fetch_enrichment_maps(orders, with_addresses=False)
 
     data = []
     for o in orders:
@@ -826,7 +1159,13 @@ def get_all_orders_admin(db: Session = Depends(get_db)):
             "created_at": o.created_at
         })
         
-    return {"status": "success", "data": data}
+    return {
+        "status": "success",
+        "data": data,
+        "next_cursor": _encode_cursor(orders[-1]) if has_more else None,
+        "total_estimate": total_estimate,
+        "total_exact": total_exact
+    }
 
 
 
@@ -839,6 +1178,8 @@ def reset_order_data(db: Session = Depends(get_db)):
     db.query(OrderItem).delete()
     # Delete all Orders
     db.query(Order).delete()
+    # Rollup statistik ikut dikosongkan
+    db.query(OrderDailyStat).delete()
     
     # Reset Auto Increment (MySQL specific)
     try:
@@ -850,7 +1191,7 @@ def reset_order_data(db: Session = Depends(get_db)):
     db.commit()
     return {"status": "success", "message": "Order data reset and IDs reset to 1"}
 
-graphql_app = GraphQLRouter(schema)
+graphql_app = GraphQLRouter(schema, context_getter=get_context)
 app.include_router(graphql_app, prefix="/graphql")
 
 app.add_middleware(
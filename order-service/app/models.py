@@ -1,10 +1,19 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, DECIMAL
+from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, DateTime, Date, DECIMAL, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Keyset pagination admin: ORDER BY created_at DESC, id DESC
+        Index("idx_orders_created_at_id", "created_at", "id"),
+        Index("idx_driver_id", "driver_id"),
+        # Filter radius order untuk driver: WHERE pickup_geohash LIKE '<prefix>%'
+        Index("idx_orders_pickup_geohash", "pickup_geohash"),
+        # Antrian dispatcher & /orders/available: status = PAID AND driver_id IS NULL
+        Index("idx_orders_status_driver", "status", "driver_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)      # Sesuai SQL
@@ -19,6 +28,15 @@ class Order(Base):
     # Sesuai SQL: INT (Bukan String External ID)
     payment_id = Column(Integer, nullable=True) 
     driver_id = Column(Integer, nullable=True)
+
+    # Reservasi stok di Restaurant Service (confirm saat PAID, release saat batal)
+    reservation_id = Column(String(36), nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1") # Optimistic lock (state.py)
+
+    # Titik jemput (koordinat restoran saat order dibuat)
+    pickup_latitude = Column(Float, nullable=True)
+    pickup_longitude = Column(Float, nullable=True)
+    pickup_geohash = Column(String(12), nullable=True)
     
     estimated_delivery_time = Column(DateTime(timezone=True), onupdate=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -42,4 +60,62 @@ class OrderItem(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    order = relationship("Order", back_populates="items")
\ No newline at end of file
+    order = relationship("Order", back_populates="items")
+
+class OrderDailyStat(Base):
+    """Rollup (tanggal x restoran x status) untuk dashboard admin, di-update bersama perubahan order."""
+    __tablename__ = "order_daily_stats"
+    __table_args__ = (
+        UniqueConstraint("stat_date", "restaurant_id", "status", name="uq_order_daily_stats"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    stat_date = Column(Date, nullable=False)
+    restaurant_id = Column(Integer, nullable=False)
+    status = Column(String(50), nullable=False)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_revenue = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+class OutboxEvent(Base):
+    """
+    Side effect ke service lain, ditulis di transaksi yang sama dengan perubahan data lokal.
+    Dikirim oleh relay (outbox.py) di background; idempotency_key dikirim sebagai header supaya
+    penerima bisa membuang kiriman ulang.
+    """
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Relay: WHERE status = 'PENDING' AND next_attempt_at <= now ORDER BY id
+        Index("idx_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(100), nullable=False)
+    method = Column(String(10), nullable=False, default="POST")
+    url = Column(String(500), nullable=False)
+    payload = Column(Text, nullable=True) # JSON
+    idempotency_key = Column(String(150), nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default="PENDING") # PENDING | SENT | FAILED
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(500), nullable=True)
+    next_attempt_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+class IdempotencyKey(Base):
+    """Response request yang memakai header Idempotency-Key, lihat idempotency.py."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_idempotency_user_key"),
+        Index("idx_idempotency_expires_at", "expires_at"), # Reaper TTL
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    idempotency_key = Column(String(150), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default="IN_PROGRESS") # IN_PROGRESS | COMPLETED
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True) # JSON
+    locked_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
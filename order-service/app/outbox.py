@@ -0,0 +1,179 @@
+"""
+Transactional outbox untuk side effect ke service lain (order & payment memakai salinan file yang sama).
+
+    request:                              relay_loop (thread background):
+      ubah data lokal                       ambil batch PENDING yang sudah jatuh tempo
+      enqueue(db, ...)                      kirim HTTP + header Idempotency-Key
+      db.commit()   (satu transaksi)        2xx        -> SENT
+      notify()      (bangunkan relay)       5xx/timeout-> retry, exponential backoff + jitter
+                                            4xx        -> FAILED (tidak akan berhasil kalau diulang)
+
+Event tidak hilang walau service tujuan lambat / mati: tetap tersimpan dan dikirim ulang.
+Penerima harus idempotent karena event bisa terkirim lebih dari sekali (at-least-once).
+Relay hanya satu per proses (service dijalankan 1 worker uvicorn).
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models import OutboxEvent
+from . import http_client
+
+RELAY_INTERVAL_SECONDS = float(os.getenv("OUTBOX_RELAY_INTERVAL_SECONDS", "2"))
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "12"))
+BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+
+# 4xx yang masih masuk akal di-retry (timeout / rate limit di sisi penerima)
+RETRYABLE_CLIENT_ERRORS = {408, 425, 429}
+
+_wake = threading.Event()
+_stats = {"batches": 0, "sent": 0, "retries": 0, "failed": 0, "last_batch_ms": 0.0}
+_failure_handlers = {}
+
+def on_failed(event_type: str, handler):
+    """
+    Daftarkan handler(db, event) untuk event yang gagal permanen (FAILED), supaya kegagalan yang punya
+    konsekuensi bisnis (mis. confirm stok ditolak) ditindaklanjuti, bukan hanya jadi baris FAILED.
+    Dipanggil setelah status batch di-commit; handler bertanggung jawab atas commit-nya sendiri.
+    """
+    _failure_handlers[event_type] = handler
+
+def enqueue(db: Session, event_type: str, method: str, url: str, payload: dict = None, idempotency_key: str = None) -> OutboxEvent:
+    """
+    Tambahkan event ke session yang sedang dipakai (TIDAK commit): event ikut tersimpan hanya kalau
+    transaksi pemanggil commit. Panggil notify() setelah commit supaya langsung dikirim.
+    """
+    event = OutboxEvent(
+        event_type=event_type,
+        method=method.upper(),
+        url=url,
+        payload=json.dumps(payload, default=str) if payload is not None else None,
+        idempotency_key=idempotency_key or f"{event_type}:{uuid.uuid4()}",
+        status="PENDING",
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(event)
+    return event
+
+def notify():
+    _wake.set()
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), BACKOFF_MAX_SECONDS)
+    return random.uniform(delay / 2, delay) # Jitter supaya retry banyak event tidak serempak
+
+def _deliver(event: OutboxEvent):
+    """Return (berhasil, boleh_retry, pesan_error)."""
+    try:
+        res = http_client.client.request(
+            event.method, event.url, retry=False, data=event.payload,
+            headers={"Content-Type": "application/json", "Idempotency-Key": event.idempotency_key}
+        )
+    except requests.exceptions.RequestException as e:
+        return False, True, str(e)
+    if res.status_code < 300:
+        return True, False, None
+    retryable = res.status_code >= 500 or res.status_code in RETRYABLE_CLIENT_ERRORS
+    return False, retryable, f"{res.status_code} {res.text[:200]}"
+
+def relay_once(db: Session) -> dict:
+    """Kirim satu batch event yang jatuh tempo. Status semua event di batch di-commit sekaligus."""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    events = db.query(OutboxEvent).filter(
+        OutboxEvent.status == "PENDING", OutboxEvent.next_attempt_at <= now
+    ).order_by(OutboxEvent.id).limit(BATCH_SIZE).all()
+    summary = {"events": len(events), "sent": 0, "retries": 0, "failed": 0}
+    if not events:
+        return summary
+
+    failed = []
+    for event in events:
+        ok, retryable, error = _deliver(event)
+        event.attempts += 1
+        if ok:
+            event.status = "SENT"
+            event.sent_at = datetime.utcnow()
+            event.last_error = None
+            summary["sent"] += 1
+        elif retryable and event.attempts < MAX_ATTEMPTS:
+            event.next_attempt_at = datetime.utcnow() + timedelta(seconds=_backoff_seconds(event.attempts))
+            event.last_error = error[:500]
+            summary["retries"] += 1
+        else:
+            event.status = "FAILED"
+            event.last_error = error[:500]
+            summary["failed"] += 1
+            print(f"Outbox event {event.id} ({event.event_type}) failed permanently: {error}")
+            failed.append(event)
+    db.commit()
+
+    for event in failed:
+        handler = _failure_handlers.get(event.event_type)
+        if handler is None:
+            continue
+        try:
+            handler(db, event)
+        except Exception as e:
+            db.rollback()
+            print(f"Outbox failure handler for event {event.id} ({event.event_type}) failed: {e}")
+
+    _stats["batches"] += 1
+    for key in ("sent", "retries", "failed"):
+        _stats[key] += summary[key]
+    _stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary
+
+def purge_sent(db: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=RETENTION_HOURS)
+    deleted = db.query(OutboxEvent).filter(
+        OutboxEvent.status == "SENT", OutboxEvent.sent_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def retry_failed(db: Session) -> int:
+    """Jadwalkan ulang event FAILED (mis. setelah bug di service tujuan diperbaiki)."""
+    updated = db.query(OutboxEvent).filter(OutboxEvent.status == "FAILED").update(
+        {OutboxEvent.status: "PENDING", OutboxEvent.attempts: 0, OutboxEvent.next_attempt_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.commit()
+    notify()
+    return updated
+
+def relay_loop(session_factory):
+    last_purge = 0.0
+    while True:
+        _wake.wait(RELAY_INTERVAL_SECONDS)
+        _wake.clear()
+        db = session_factory()
+        try:
+            # Batch penuh -> kemungkinan masih ada sisa, langsung lanjut
+            while relay_once(db)["events"] == BATCH_SIZE:
+                pass
+            if time.time() - last_purge > 3600:
+                purge_sent(db)
+                last_purge = time.time()
+        except Exception as e:
+            db.rollback()
+            print(f"Outbox relay failed: {e}")
+        finally:
+            db.close()
+
+def stats(db: Session) -> dict:
+    counts = dict(db.query(OutboxEvent.status, func.count(OutboxEvent.id)).group_by(OutboxEvent.status).all())
+    oldest = db.query(func.min(OutboxEvent.created_at)).filter(OutboxEvent.status == "PENDING").scalar()
+    return dict(_stats, pending=counts.get("PENDING", 0), sent_retained=counts.get("SENT", 0),
+                failed_total=counts.get("FAILED", 0), oldest_pending_at=oldest)
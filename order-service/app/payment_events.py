@@ -0,0 +1,52 @@
+"""
+Subscriber event dari Payment Service (lihat payment-service/app/events.py).
+
+payment.succeeded -> order PENDING_PAYMENT jadi PAID + confirm reservasi stok (via outbox) dalam satu
+transaksi. Event dikirim at-least-once, jadi handler idempotent: order yang sudah lewat PENDING_PAYMENT
+tidak diubah lagi.
+"""
+from sqlalchemy.orm import Session
+from .models import Order
+from .state import STATUS_PENDING, STATUS_PAID, STATUS_CANCELLED, normalize, transition, TransitionError
+from .cart import queue_reservation_action
+from . import outbox
+
+PAYMENT_SUCCEEDED = "payment.succeeded"
+
+class RetryableEventError(Exception):
+    """Gagal sementara (mis. kalah balapan update order) -> pengirim harus mengirim ulang."""
+
+def handle_payment_succeeded(db: Session, event: dict) -> str:
+    order_id = event["data"]["order_id"]
+    row = db.query(Order.status).filter(Order.id == order_id).first()
+    if row is None:
+        raise TransitionError(404, "Order not found")
+
+    status = normalize(row.status)
+    if status != STATUS_PENDING:
+        if status == STATUS_CANCELLED:
+            print(f"Payment {event['data'].get('payment_id')} received for cancelled order {order_id}, needs refund")
+        return "ignored"
+
+    try:
+        transition(
+            db, order_id, STATUS_PAID, expected_from={STATUS_PENDING},
+            before_commit=lambda o, previous: queue_reservation_action(db, o.reservation_id, "confirm")
+        )
+    except TransitionError as e:
+        if e.status_code == 409:
+            raise RetryableEventError(e.detail)
+        raise
+    outbox.notify()
+    return "applied"
+
+HANDLERS = {
+    PAYMENT_SUCCEEDED: handle_payment_succeeded
+}
+
+def dispatch(db: Session, event: dict) -> str:
+    """Return "applied" / "ignored". Tipe event yang tidak dikenal diabaikan (bukan error)."""
+    handler = HANDLERS.get(event.get("type"))
+    if handler is None:
+        return "ignored"
+    return handler(db, event)
@@ -1,32 +1,34 @@
 import strawberry
 from typing import List, Optional
 from strawberry.types import Info
+from strawberry.dataloader import DataLoader
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .models import Order, OrderItem
+from .cart import reserve_cart, pickup_fields, release_reservation, CartValidationError
+from .stats import record_order_created
+from . import idempotency
 from datetime import datetime, timedelta
-from jose import jwt, JWTError
+from .auth import TokenVerifier, AuthError
 import os
-import requests # UNTUK NEMBAK RESTAURANT SERVICE
 
 # --- CONFIG ---
 SECRET_KEY = os.getenv("SECRET_KEY", "kunci_rahasia_project_ini_harus_sama_semua")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 RESTAURANT_SERVICE_URL = "http://restaurant-service:8000" # URL Docker
 
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM) # Dipakai juga oleh endpoint REST (main.py)
+
 def get_current_user_id(info: Info) -> int:
     request = info.context.get("request")
     auth_header = request.headers.get("Authorization")
     if not auth_header:
         raise Exception("Authorization header missing")
     try:
-        scheme, token = auth_header.split()
-        if scheme.lower() != "bearer":
-            raise Exception("Invalid authentication scheme")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return int(payload.get("id"))
-    except Exception:
-        raise Exception("Invalid or expired token")
+        return token_verifier.principal(auth_header).id
+    except AuthError as e:
+        raise Exception(e.detail)
 
 # --- INPUT TYPES ---
 @strawberry.input
@@ -53,18 +55,32 @@ class OrderType:
     external_payment_id: Optional[str] = "MOCK-TRX-123" 
 
     @strawberry.field
-    def items(self) -> List[OrderItemType]:
+    async def items(self, info: Info) -> List[OrderItemType]:
+        # DataLoader per request: item semua order di satu response diambil dengan satu query IN
+        return await info.context["order_items_loader"].load(self.id)
+
+# --- DATALOADER ---
+async def load_order_items(order_ids: List[int]) -> List[List[OrderItemType]]:
+    def query():
         db = SessionLocal()
-        items_db = db.query(OrderItem).filter(OrderItem.order_id == self.id).all()
-        db.close()
-        return [
-            OrderItemType(
-                id=i.id,
-                menu_item_name=i.menu_item_name,
-                quantity=i.quantity,
-                price=float(i.price)
-            ) for i in items_db
-        ]
+        try:
+            return db.query(OrderItem).filter(OrderItem.order_id.in_(order_ids)).all()
+        finally:
+            db.close()
+
+    grouped = {order_id: [] for order_id in order_ids}
+    for i in await run_in_threadpool(query):
+        grouped[i.order_id].append(OrderItemType(
+            id=i.id,
+            menu_item_name=i.menu_item_name,
+            quantity=i.quantity,
+            price=float(i.price)
+        ))
+    return [grouped[order_id] for order_id in order_ids]
+
+async def get_context():
+    # Dipanggil sekali per request GraphQL -> cache DataLoader tidak bocor antar request
+    return {"order_items_loader": DataLoader(load_fn=load_order_items)}
 
 # --- RESOLVERS ---
 @strawberry.type
@@ -108,59 +124,32 @@ class Mutation:
         
         user_id = get_current_user_id(info)
         db = SessionLocal()
-        
+
+        # Header Idempotency-Key: retry dengan key yang sama -> order yang sama, bukan order baru
+        request_hash = idempotency.fingerprint({
+            "restaurant_id": restaurant_id, "address_id": address_id,
+            "items": [{"menu_item_id": i.menu_item_id, "quantity": i.quantity} for i in items]
+        })
         try:
-            # --- LANGKAH 1: Validasi Stok & Harga ke Restaurant Service ---
-            validated_items = []
-            total_amount = 0
-            stock_update_payload = []
-
-            for item_input in items:
-                # Nembak API Internal Restaurant
-                try:
-                    res = requests.get(f"{RESTAURANT_SERVICE_URL}/internal/menu-items/{item_input.menu_item_id}")
-                    if res.status_code != 200:
-                        raise Exception(f"Menu Item ID {item_input.menu_item_id} not found")
-                    
-                    menu_data = res.json()
-                    
-                    # Cek Restoran (Pastikan item milik restoran yang benar)
-                    if menu_data['restaurant_id'] != restaurant_id:
-                         raise Exception(f"Menu {menu_data['name']} does not belong to this restaurant")
-
-                    # Cek Stok
-                    if menu_data['stock'] < item_input.quantity:
-                        raise Exception(f"Stock habis untuk {menu_data['name']}. Sisa: {menu_data['stock']}")
-
-                    # Hitung Total (Pakai harga dari DB, bukan input user -> Anti Cheat)
-                    item_total = menu_data['price'] * item_input.quantity
-                    total_amount += item_total
-                    
-                    validated_items.append({
-                        "id": menu_data['id'],
-                        "name": menu_data['name'],
-                        "price": menu_data['price'],
-                        "qty": item_input.quantity
-                    })
-                    
-                    stock_update_payload.append({
-                        "menu_item_id": menu_data['id'],
-                        "quantity": item_input.quantity
-                    })
-                    
-                except requests.exceptions.ConnectionError:
-                    raise Exception("Failed to connect to Restaurant Service")
-
-            # --- LANGKAH 2: Kurangi Stok (Reservasi Stok) ---
-            # Kita kurangi stok SAAT order dibuat agar tidak ada race condition
-            res_stock = requests.post(
-                f"{RESTAURANT_SERVICE_URL}/internal/menu-items/reduce-stock",
-                json=stock_update_payload
+            record, replay = idempotency.begin(
+                db, user_id, info.context["request"].headers.get("Idempotency-Key"), request_hash
             )
-            if res_stock.status_code != 200:
-                raise Exception(f"Failed to reduce stock: {res_stock.text}")
+        except idempotency.IdempotencyError as e:
+            db.close()
+            raise Exception(e.detail)
+        if replay:
+            db.close()
+            return OrderType(**replay[1])
+
+        reservation_id = None
+        try:
+            # --- LANGKAH 1: Reservasi Stok & Harga ke Restaurant Service (1x request, atomik) ---
+            try:
+                validated_items, total_amount, reservation_id, pickup = reserve_cart(restaurant_id, items)
+            except CartValidationError as e:
+                raise Exception(e.detail)
 
-            # --- LANGKAH 3: Simpan Order ke DB ---
+            # --- LANGKAH 2: Simpan Order ke DB ---
             estimasi = datetime.now() + timedelta(minutes=45)
 
             new_order = Order(
@@ -169,11 +158,12 @@ class Mutation:
                 address_id=address_id,
                 total_price=total_amount,
                 status="PENDING_PAYMENT",
-                estimated_delivery_time=estimasi 
+                reservation_id=reservation_id,
+                estimated_delivery_time=estimasi,
+                **pickup_fields(pickup)
             )
             db.add(new_order)
-            db.commit()
-            db.refresh(new_order)
+            db.flush() # Dapatkan new_order.id, commit sekali bersama item
             
             for v_item in validated_items:
                 order_item = OrderItem(
@@ -184,17 +174,24 @@ class Mutation:
                     price=v_item['price']
                 )
                 db.add(order_item)
+            db.refresh(new_order) # created_at dari server default, dipakai rollup
+            record_order_created(db, new_order)
+
+            result = {
+                "id": new_order.id,
+                "user_id": new_order.user_id,
+                "restaurant_id": new_order.restaurant_id,
+                "status": new_order.status,
+                "total_price": float(new_order.total_price)
+            }
+            idempotency.complete(db, record, 200, result) # Satu commit dengan order
             db.commit()
-            
-            return OrderType(
-                id=new_order.id,
-                user_id=new_order.user_id,
-                restaurant_id=new_order.restaurant_id,
-                status=new_order.status,
-                total_price=float(new_order.total_price)
-            )
+            return OrderType(**result)
         except Exception as e:
             db.rollback()
+            idempotency.release(db, record)
+            # Order gagal disimpan -> kembalikan stok yang sudah direservasi
+            release_reservation(reservation_id)
             raise e
         finally:
             db.close()
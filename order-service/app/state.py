@@ -0,0 +1,96 @@
+"""
+State machine status order.
+
+Semua perubahan status lewat transition(): cek transisi yang diizinkan lalu satu conditional
+UPDATE dengan optimistic lock (WHERE version = :version [AND guard lain]). Kalau ada request lain
+yang mengubah order duluan, rowcount = 0 -> TransitionError 409, bukan menimpa diam-diam.
+
+    PENDING_PAYMENT -> PAID | CANCELLED
+    PAID            -> PREPARING | ON_THE_WAY | CANCELLED
+    PREPARING       -> ON_THE_WAY | CANCELLED
+    ON_THE_WAY      -> DELIVERED | COMPLETED      ("ON_DELIVERY" = alias lama ON_THE_WAY)
+    DELIVERED       -> COMPLETED
+"""
+from sqlalchemy.orm import Session
+from .models import Order
+from .stats import record_status_change
+
+STATUS_PENDING = "PENDING_PAYMENT"
+STATUS_PAID = "PAID"
+STATUS_PREPARING = "PREPARING"
+STATUS_ON_DELIVERY = "ON_THE_WAY"
+STATUS_DELIVERED = "DELIVERED"
+STATUS_COMPLETED = "COMPLETED"
+STATUS_CANCELLED = "CANCELLED"
+
+LEGACY_ALIASES = {"ON_DELIVERY": STATUS_ON_DELIVERY}
+
+TRANSITIONS = {
+    STATUS_PENDING: {STATUS_PAID, STATUS_CANCELLED},
+    STATUS_PAID: {STATUS_PREPARING, STATUS_ON_DELIVERY, STATUS_CANCELLED},
+    STATUS_PREPARING: {STATUS_ON_DELIVERY, STATUS_CANCELLED},
+    STATUS_ON_DELIVERY: {STATUS_DELIVERED, STATUS_COMPLETED},
+    STATUS_DELIVERED: {STATUS_COMPLETED},
+    STATUS_COMPLETED: set(),
+    STATUS_CANCELLED: set(),
+}
+
+class TransitionError(Exception):
+    """Dibawa ke HTTPException (REST) atau Exception (GraphQL), sama seperti CartValidationError."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def normalize(status: str) -> str:
+    status = (status or "").upper()
+    return LEGACY_ALIASES.get(status, status)
+
+def can_transition(current: str, new: str) -> bool:
+    return normalize(new) in TRANSITIONS.get(normalize(current), set())
+
+def transition(db: Session, order_id: int, new_status: str, expected_from=None, values: dict = None, guards=(),
+               before_commit=None) -> Order:
+    """
+    Ubah status order secara atomik dan commit. Return order yang sudah di-refresh.
+
+    - expected_from: status asal yang boleh (selain aturan TRANSITIONS), mis. cancel hanya dari PENDING
+    - values: kolom lain yang ikut di-set di UPDATE yang sama (mis. driver_id)
+    - guards: kondisi tambahan di WHERE (mis. Order.driver_id == None)
+    - before_commit(order, previous_status): dipanggil setelah UPDATE berhasil, sebelum commit
+      (mis. menulis event outbox di transaksi yang sama)
+    Status yang sama tanpa `values` (dan lolos expected_from) dianggap no-op: callback yang di-retry tetap 200.
+    """
+    new_status = normalize(new_status)
+    if new_status not in TRANSITIONS:
+        raise TransitionError(400, f"Unknown order status {new_status}")
+
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        raise TransitionError(404, "Order not found")
+
+    current = normalize(order.status)
+    if expected_from is not None and current not in expected_from:
+        raise TransitionError(409, f"Order is {current}, expected {' or '.join(sorted(expected_from))}")
+    if current == new_status and not values:
+        return order
+    if not can_transition(current, new_status):
+        raise TransitionError(409, f"Cannot change order status from {current} to {new_status}")
+
+    stored_status = order.status # Bisa alias lama, dipakai untuk bucket rollup yang dikurangi
+    updates = {Order.status: new_status, Order.version: Order.version + 1}
+    for column, value in (values or {}).items():
+        updates[getattr(Order, column)] = value
+    updated = db.query(Order).filter(
+        Order.id == order_id, Order.version == order.version, *guards
+    ).update(updates, synchronize_session=False)
+    if updated != 1:
+        db.rollback()
+        raise TransitionError(409, "Order was modified by another request, please retry")
+
+    record_status_change(db, order, stored_status, new_status)
+    if before_commit is not None:
+        before_commit(order, stored_status)
+    db.commit()
+    db.refresh(order)
+    return order
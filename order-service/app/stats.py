@@ -0,0 +1,71 @@
+"""
+Maintenance tabel rollup order_daily_stats.
+
+Setiap perubahan order (dibuat / ganti status) memanggil fungsi di sini dalam transaksi yang
+sama dengan perubahan order, jadi dashboard cukup membaca beberapa ratus baris rollup.
+Untuk data lama / setelah seed, jalankan backfill_stats.py (rebuild_daily_stats).
+"""
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+from .models import Order, OrderDailyStat
+
+def _bump(db: Session, stat_date, restaurant_id: int, status: str, count_delta: int, revenue_delta):
+    if db.bind.dialect.name == "mysql":
+        stmt = mysql_insert(OrderDailyStat).values(
+            stat_date=stat_date, restaurant_id=restaurant_id, status=status,
+            order_count=count_delta, total_revenue=revenue_delta
+        )
+        db.execute(stmt.on_duplicate_key_update(
+            order_count=OrderDailyStat.order_count + stmt.inserted.order_count,
+            total_revenue=OrderDailyStat.total_revenue + stmt.inserted.total_revenue
+        ))
+        return
+
+    # Dialect lain (dev lokal): UPDATE dulu, INSERT kalau baris belum ada
+    result = db.execute(
+        update(OrderDailyStat)
+        .where(
+            OrderDailyStat.stat_date == stat_date,
+            OrderDailyStat.restaurant_id == restaurant_id,
+            OrderDailyStat.status == status
+        )
+        .values(
+            order_count=OrderDailyStat.order_count + count_delta,
+            total_revenue=OrderDailyStat.total_revenue + revenue_delta
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.add(OrderDailyStat(
+            stat_date=stat_date, restaurant_id=restaurant_id, status=status,
+            order_count=count_delta, total_revenue=revenue_delta
+        ))
+        db.flush()
+
+def record_order_created(db: Session, order: Order):
+    """Panggil setelah db.flush() order baru (created_at dari server default)."""
+    _bump(db, order.created_at.date(), order.restaurant_id, order.status, 1, order.total_price)
+
+def record_status_change(db: Session, order: Order, old_status: str, new_status: str):
+    if old_status == new_status:
+        return
+    stat_date = order.created_at.date()
+    _bump(db, stat_date, order.restaurant_id, old_status, -1, -order.total_price)
+    _bump(db, stat_date, order.restaurant_id, new_status, 1, order.total_price)
+
+def rebuild_daily_stats(db: Session) -> int:
+    """Backfill: hitung ulang seluruh rollup dari tabel orders (INSERT ... SELECT). Return jumlah baris rollup."""
+    db.query(OrderDailyStat).delete()
+    source = select(
+        func.date(Order.created_at),
+        Order.restaurant_id,
+        Order.status,
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.total_price), 0)
+    ).group_by(func.date(Order.created_at), Order.restaurant_id, Order.status)
+    db.execute(insert(OrderDailyStat).from_select(
+        ["stat_date", "restaurant_id", "status", "order_count", "total_revenue"], source
+    ))
+    db.commit()
+    return db.query(OrderDailyStat).count()
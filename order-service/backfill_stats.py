@@ -0,0 +1,21 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal, Base, engine
+from app.stats import rebuild_daily_stats
+
+# Jalankan: docker-compose exec order-service python /app/backfill_stats.py
+def backfill():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print("Rebuilding order_daily_stats from orders...")
+        count = rebuild_daily_stats(db)
+        print(f"Backfill Completed. {count} rollup rows written.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    backfill()
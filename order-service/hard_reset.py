@@ -19,10 +19,12 @@ def reset_driver_db():
         with engine.connect() as conn:
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
             conn.execute(text("TRUNCATE TABLE driver_salaries"))
+            conn.execute(text("TRUNCATE TABLE driver_location_tracks"))
+            conn.execute(text("TRUNCATE TABLE processed_events")) # Idempotency key memakai id order yang di-reset
             conn.execute(text("UPDATE drivers SET total_earnings = 0")) # Reset Wallet
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
             conn.commit()
-            print("Truncated: driver_salaries, Reset: drivers.total_earnings")
+            print("Truncated: driver_salaries, driver_location_tracks, processed_events, Reset: drivers.total_earnings")
     except Exception as e:
         print(f"❌ Error resetting driver-service: {e}\n")
 
@@ -38,7 +40,10 @@ def reset_database(service_name, db_url):
             if service_name == "order-service":
                 conn.execute(text("TRUNCATE TABLE order_items"))
                 conn.execute(text("TRUNCATE TABLE orders"))
-                print("Truncated: orders, order_items")
+                conn.execute(text("TRUNCATE TABLE order_daily_stats"))
+                conn.execute(text("TRUNCATE TABLE outbox_events"))
+                conn.execute(text("TRUNCATE TABLE idempotency_keys"))
+                print("Truncated: orders, order_items, order_daily_stats, outbox_events, idempotency_keys")
                 
             elif service_name == "driver-service":
                 conn.execute(text("TRUNCATE TABLE driver_salaries"))
@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database import SessionLocal
 from app.models import Order, OrderItem
+from app.stats import rebuild_daily_stats
 
 def seed():
     db = SessionLocal()
@@ -63,6 +64,7 @@ def seed():
         db.add(item)
     
     db.commit()
+    rebuild_daily_stats(db) # Seed menulis langsung ke orders, rollup dihitung ulang
     print("Seeding Orders Completed.")
     db.close()
 
@@ -36,6 +36,11 @@ CREATE TABLE `orders` (
   `total_price` decimal(10,2) NOT NULL,
   `payment_id` int(11) DEFAULT NULL,
   `driver_id` int(11) DEFAULT NULL,
+  `reservation_id` varchar(36) DEFAULT NULL,
+  `version` int(11) NOT NULL DEFAULT 1,
+  `pickup_latitude` double DEFAULT NULL,
+  `pickup_longitude` double DEFAULT NULL,
+  `pickup_geohash` varchar(12) DEFAULT NULL,
   `estimated_delivery_time` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
   `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
   `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
@@ -83,7 +88,11 @@ ALTER TABLE `orders`
   ADD PRIMARY KEY (`id`),
   ADD KEY `idx_user_id` (`user_id`),
   ADD KEY `idx_status` (`status`),
-  ADD KEY `idx_restaurant_id` (`restaurant_id`);
+  ADD KEY `idx_restaurant_id` (`restaurant_id`),
+  ADD KEY `idx_orders_created_at_id` (`created_at`,`id`),
+  ADD KEY `idx_driver_id` (`driver_id`),
+  ADD KEY `idx_orders_pickup_geohash` (`pickup_geohash`),
+  ADD KEY `idx_orders_status_driver` (`status`,`driver_id`);
 
 --
 -- Indeks untuk tabel `order_items`
@@ -0,0 +1,99 @@
+"""
+Domain event Payment Service (mis. payment.succeeded -> Order Service menandai order PAID).
+
+    {"event_id", "type", "occurred_at", "data": {...}}
+
+API payment hanya menulis payment + event di transaksi yang sama lalu langsung return;
+perubahan status di Order Service terjadi di subscriber, bukan di jalur request.
+
+Broker dipilih lewat ENV PAYMENT_EVENT_BROKER:
+- "outbox" (default): event ditulis ke outbox (satu baris per subscriber HTTP), dikirim relay
+  dengan retry + backoff. Tidak hilang walau Order Service sedang down.
+- "local": subscriber in-process dipanggil langsung setelah commit (test / satu proses)
+Implementasi lain (Redis Streams, Kafka, ...) cukup turunan EventBroker lalu set_broker().
+"""
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+from . import outbox
+
+PAYMENT_SUCCEEDED = "payment.succeeded"
+
+# Endpoint subscriber HTTP per tipe event (dipisah koma)
+SUBSCRIBER_URLS = {
+    PAYMENT_SUCCEEDED: [
+        url.strip() for url in os.getenv(
+            "PAYMENT_SUCCEEDED_SUBSCRIBERS", "http://order-service:8000/internal/events/payment"
+        ).split(",") if url.strip()
+    ]
+}
+
+class EventBroker(ABC):
+    """Interface broker. publish() dipanggil di dalam transaksi pemanggil (sebelum commit)."""
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, event_type: str, callback):
+        self._subscribers.setdefault(event_type, []).append(callback)
+
+    @abstractmethod
+    def publish(self, db: Session, event: dict):
+        ...
+
+class OutboxBroker(EventBroker):
+    def __init__(self, subscriber_urls: dict = None):
+        super().__init__()
+        self.subscriber_urls = subscriber_urls if subscriber_urls is not None else SUBSCRIBER_URLS
+
+    def publish(self, db: Session, event: dict):
+        for url in self.subscriber_urls.get(event["type"], []):
+            outbox.enqueue(
+                db, event["type"], "POST", url, event,
+                idempotency_key=f"{event['event_id']}@{urlsplit(url).netloc}"
+            )
+
+class LocalBroker(EventBroker):
+    """Subscriber dipanggil di proses yang sama, hanya kalau transaksi pemanggil commit."""
+
+    def publish(self, db: Session, event: dict):
+        @sa_event.listens_for(db, "after_commit", once=True)
+        def deliver(session):
+            for callback in list(self._subscribers.get(event["type"], [])):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Payment event subscriber failed: {e}")
+
+def _create_broker() -> EventBroker:
+    if os.getenv("PAYMENT_EVENT_BROKER", "outbox").lower() == "local":
+        return LocalBroker()
+    return OutboxBroker()
+
+_broker = _create_broker()
+
+def get_broker() -> EventBroker:
+    return _broker
+
+def set_broker(broker: EventBroker):
+    """Ganti implementasi broker (test / broker eksternal)."""
+    global _broker
+    _broker = broker
+
+def publish(db: Session, event_type: str, data: dict) -> dict:
+    event = {
+        "event_id": str(uuid.uuid4()),
+        "type": event_type,
+        "occurred_at": datetime.utcnow().isoformat(),
+        "data": data
+    }
+    _broker.publish(db, event)
+    return event
+
+def subscribe(event_type: str, callback):
+    _broker.subscribe(event_type, callback)
@@ -1,10 +1,21 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from strawberry.fastapi import GraphQLRouter
 from pydantic import BaseModel
+from typing import Optional
 import requests
-from .database import engine, Base
-from .schema import schema
+import threading
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .database import engine, Base, SessionLocal, get_db
+from .schema import schema, token_verifier
+from .auth import AuthError
+from . import http_client
+from . import outbox
+from . import idempotency
+from . import events
+from .models import Payment
 
 # Create Tables
 Base.metadata.create_all(bind=engine)
@@ -24,28 +35,108 @@ app.add_middleware(
 
 ORDER_SERVICE_URL = "http://order-service:8000"
 
+# Statistik client HTTP internal (latency/error per upstream)
+@app.get("/internal/upstream-stats")
+def get_upstream_stats():
+    return {"status": "success", "data": http_client.stats()}
+
+# Hapus Idempotency-Key yang sudah kedaluwarsa
+@app.on_event("startup")
+def start_idempotency_reaper():
+    threading.Thread(target=idempotency.reaper_loop, args=(SessionLocal,), daemon=True).start()
+
+# Relay outbox: event payment.succeeded ke subscriber (Order Service) di background dengan retry
+@app.on_event("startup")
+def start_outbox_relay():
+    threading.Thread(target=outbox.relay_loop, args=(SessionLocal,), daemon=True).start()
+
+@app.get("/internal/outbox/stats")
+def get_outbox_stats(db: Session = Depends(get_db)):
+    return {"status": "success", "data": outbox.stats(db)}
+
+# Jadwalkan ulang event yang gagal permanen (setelah service tujuan diperbaiki)
+@app.post("/internal/outbox/retry-failed")
+def retry_failed_outbox_events(db: Session = Depends(get_db)):
+    return {"status": "success", "data": {"requeued": outbox.retry_failed(db)}}
+
 class PaymentRequest(BaseModel):
     order_id: int
     payment_id: int
     payment_method: str = "E-Wallet"
 
+def _optional_user_id(authorization: Optional[str]) -> int:
+    """/payments/simulate tidak wajib login: Idempotency-Key di-scope ke user kalau token ada, 0 kalau anonim."""
+    try:
+        return token_verifier.principal(authorization).id
+    except AuthError:
+        return 0
+
 @app.post("/payments/simulate")
-def simulate_payment(req: PaymentRequest):
+def simulate_payment(
+    req: PaymentRequest,
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db)
+):
+    # Retry client dengan key yang sama -> response pertama dikembalikan lagi
+    try:
+        record, replay = idempotency.begin(
+            db, _optional_user_id(authorization), idempotency_key,
+            idempotency.fingerprint({"order_id": req.order_id, "payment_id": req.payment_id, "payment_method": req.payment_method})
+        )
+    except idempotency.IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if replay:
+        status_code, body = replay
+        return JSONResponse(status_code=status_code, content=body, headers={"Idempotency-Replayed": "true"})
+
     # 1. (Optional) Verify payment_id validity if we had a real provider
     
-    # 2. Call Order Service to update status to PAID or PREPARING
-    # Using PREPARING to simulate immediate restaurant acceptance or just PAID
-    new_status = "PAID"
-    
+    # 2. Validasi order ke Order Service (read-only), catat payment lalu publish payment.succeeded.
+    # Status PAID di-set oleh subscriber di Order Service -> API tidak menunggu commit di sana
     try:
-        res = requests.put(
-            f"{ORDER_SERVICE_URL}/internal/orders/{req.order_id}/status",
-            json={"status": new_status}
-        )
+        res = http_client.get(f"{ORDER_SERVICE_URL}/internal/orders/{req.order_id}")
+        if res.status_code == 404:
+            raise HTTPException(status_code=404, detail="Order not found")
         if res.status_code != 200:
-            raise HTTPException(status_code=500, detail="Failed to update order status")
-            
-        return {"status": "success", "message": "Payment successful", "data": {"transaction_id": "TRX-SIMULATED"}}
+            raise HTTPException(status_code=500, detail="Failed to fetch order")
+        order_data = res.json()
+        if order_data['status'] != 'PENDING_PAYMENT':
+            raise HTTPException(status_code=400, detail=f"Payment Failed: Order status is already {order_data['status']}")
+        # Order masih PENDING_PAYMENT tapi event payment sebelumnya belum diproses
+        if db.query(Payment.id).filter(Payment.order_id == req.order_id, Payment.status == "SUCCESS").first():
+            raise HTTPException(status_code=400, detail="Order already paid (Recorded in Payment DB)")
+
+        payment = Payment(
+            order_id=req.order_id, user_id=order_data['user_id'], amount=order_data['total_price'],
+            payment_method=req.payment_method, status="SUCCESS", success_order_id=req.order_id
+        )
+        db.add(payment)
+        try:
+            db.flush()
+        except IntegrityError:
+            # Kalah balapan dengan pembayaran lain untuk order yang sama (unique success_order_id)
+            raise HTTPException(status_code=400, detail="Order already paid (Recorded in Payment DB)")
+        events.publish(db, events.PAYMENT_SUCCEEDED, {
+            "payment_id": payment.id, "order_id": req.order_id, "user_id": order_data['user_id'],
+            "amount": order_data['total_price'], "payment_method": req.payment_method
+        })
+
+        # 202: pembayaran tercatat, status order (PAID) menyusul setelah Order Service memproses event
+        response = {
+            "status": "success", "message": "Payment received, order is being processed",
+            "data": {"transaction_id": "TRX-SIMULATED", "payment_id": payment.id, "order_status": "PROCESSING"}
+        }
+        idempotency.complete(db, record, 202, response) # Satu commit dengan payment & event
+        db.commit()
+        outbox.notify()
+        return JSONResponse(status_code=202, content=response)
         
-    except requests.exceptions.ConnectionError:
-        raise HTTPException(status_code=503, detail="Failed to connect to Order Service")
\ No newline at end of file
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        db.rollback()
+        idempotency.release(db, record)
+        raise HTTPException(status_code=503, detail="Failed to connect to Order Service")
+    except HTTPException:
+        db.rollback()
+        idempotency.release(db, record)
+        raise
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime
+from sqlalchemy import Column, Integer, String, Text, DECIMAL, DateTime, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -14,6 +14,54 @@ class Payment(Base):
     
     status = Column(String(50), default="PENDING")
     payment_method = Column(String(50), nullable=True)
+
+    # = order_id kalau status SUCCESS, NULL selain itu. Unique -> maksimal satu pembayaran sukses per order
+    # walau dua request lolos cek SELECT bersamaan (MySQL tidak punya partial unique index)
+    success_order_id = Column(Integer, nullable=True, unique=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+class OutboxEvent(Base):
+    """
+    Side effect ke service lain, ditulis di transaksi yang sama dengan perubahan data lokal.
+    Dikirim oleh relay (outbox.py) di background; idempotency_key dikirim sebagai header supaya
+    penerima bisa membuang kiriman ulang.
+    """
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Relay: WHERE status = 'PENDING' AND next_attempt_at <= now ORDER BY id
+        Index("idx_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(100), nullable=False)
+    method = Column(String(10), nullable=False, default="POST")
+    url = Column(String(500), nullable=False)
+    payload = Column(Text, nullable=True) # JSON
+    idempotency_key = Column(String(150), nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default="PENDING") # PENDING | SENT | FAILED
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(500), nullable=True)
+    next_attempt_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+class IdempotencyKey(Base):
+    """Response request yang memakai header Idempotency-Key, lihat idempotency.py."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_idempotency_user_key"),
+        Index("idx_idempotency_expires_at", "expires_at"), # Reaper TTL
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    idempotency_key = Column(String(150), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default="IN_PROGRESS") # IN_PROGRESS | COMPLETED
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True) # JSON
+    locked_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
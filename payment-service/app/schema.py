@@ -4,26 +4,31 @@ from strawberry.types import Info
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .models import Payment
-from jose import jwt
+from .auth import TokenVerifier, AuthError
 import os
-import requests # Library untuk nembak API Order Service
+import requests
+from sqlalchemy.exc import IntegrityError
+from . import http_client # Client untuk nembak API Order Service
+from . import outbox
+from . import idempotency
+from . import events
 
 # --- CONFIG ---
 SECRET_KEY = os.getenv("SECRET_KEY", "kunci_rahasia_project_ini_harus_sama_semua")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ORDER_SERVICE_URL = "http://order-service:8000" # URL Docker Internal
 
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM) # Dipakai juga oleh main.py
+
 def get_current_user_id(info: Info) -> int:
     request = info.context.get("request")
     auth_header = request.headers.get("Authorization")
     if not auth_header:
         raise Exception("Authorization header missing")
     try:
-        scheme, token = auth_header.split()
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return int(payload.get("id"))
-    except Exception:
-        raise Exception("Invalid or expired token")
+        return token_verifier.principal(auth_header).id
+    except AuthError as e:
+        raise Exception(e.detail)
 
 # --- TYPES ---
 @strawberry.type
@@ -53,6 +58,69 @@ class Query:
             ) for p in payments
         ]
 
+def _pay(db: Session, record, user_id: int, order_id: int, amount: float, payment_method: str) -> PaymentType:
+    # --- LANGKAH 1: Validasi ke Order Service (INTEGRASI) ---
+    try:
+        # Nembak endpoint internal yang baru kita buat di Order Service
+        response = http_client.get(f"{ORDER_SERVICE_URL}/internal/orders/{order_id}")
+        
+        if response.status_code == 404:
+            raise Exception("Order Not Found in Order Service")
+        
+        order_data = response.json()
+        
+        # Cek Status: Jika bukan PENDING_PAYMENT, tolak!
+        if order_data['status'] != 'PENDING_PAYMENT':
+            raise Exception(f"Payment Failed: Order status is already {order_data['status']}")
+        
+        # Cek User: Pastikan yang bayar adalah pemilik order
+        if order_data['user_id'] != user_id:
+            raise Exception("Unauthorized: This order belongs to another user")
+
+        # Cek Amount: (Opsional) Validasi jumlah bayar
+        # if order_data['total_price'] != amount: ...
+
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        raise Exception("Failed to connect to Order Service")
+    
+    # --- LANGKAH 2: Proses Pembayaran Lokal ---
+    # Cek double payment di lokal juga (Double Protection)
+    existing = db.query(Payment).filter(
+        Payment.order_id == order_id, Payment.status == "SUCCESS"
+    ).first()
+    if existing:
+        raise Exception("Order already paid (Recorded in Payment DB)")
+
+    new_payment = Payment(
+        order_id=order_id, user_id=user_id, amount=amount,
+        payment_method=payment_method, status="SUCCESS", # Anggap sukses
+        success_order_id=order_id # Unique: dua request bersamaan -> hanya satu yang tersimpan
+    )
+    db.add(new_payment)
+    try:
+        db.flush() # Butuh id payment untuk event
+    except IntegrityError:
+        raise Exception("Order already paid (Recorded in Payment DB)")
+    db.refresh(new_payment) # created_at dari server default, ikut disimpan di response idempotency
+
+    # --- LANGKAH 3: Publish payment.succeeded (di transaksi yang sama dengan payment) ---
+    # Order Service (subscriber) yang mengubah status jadi 'PAID'; API ini tidak menunggu
+    events.publish(db, events.PAYMENT_SUCCEEDED, {
+        "payment_id": new_payment.id, "order_id": order_id, "user_id": user_id,
+        "amount": float(new_payment.amount), "payment_method": payment_method
+    })
+
+    result = {
+        "id": new_payment.id, "order_id": new_payment.order_id,
+        "user_id": new_payment.user_id, "amount": float(new_payment.amount),
+        "status": new_payment.status, "payment_method": new_payment.payment_method,
+        "created_at": str(new_payment.created_at)
+    }
+    idempotency.complete(db, record, 200, result) # Satu commit dengan payment
+    db.commit()
+    outbox.notify()
+    return PaymentType(**result)
+
 @strawberry.type
 class Mutation:
     @strawberry.mutation
@@ -61,67 +129,29 @@ class Mutation:
     ) -> PaymentType:
         
         user_id = get_current_user_id(info)
-        
-        # --- LANGKAH 1: Validasi ke Order Service (INTEGRASI) ---
-        try:
-            # Nembak endpoint internal yang baru kita buat di Order Service
-            response = requests.get(f"{ORDER_SERVICE_URL}/internal/orders/{order_id}")
-            
-            if response.status_code == 404:
-                raise Exception("Order Not Found in Order Service")
-            
-            order_data = response.json()
-            
-            # Cek Status: Jika bukan PENDING_PAYMENT, tolak!
-            if order_data['status'] != 'PENDING_PAYMENT':
-                raise Exception(f"Payment Failed: Order status is already {order_data['status']}")
-            
-            # Cek User: Pastikan yang bayar adalah pemilik order
-            if order_data['user_id'] != user_id:
-                raise Exception("Unauthorized: This order belongs to another user")
 
-            # Cek Amount: (Opsional) Validasi jumlah bayar
-            # if order_data['total_price'] != amount: ...
-
-        except requests.exceptions.ConnectionError:
-            raise Exception("Failed to connect to Order Service")
-        
-        # --- LANGKAH 2: Proses Pembayaran Lokal ---
+        # Header Idempotency-Key: retry dengan key yang sama -> payment yang sama (dicek sebelum validasi,
+        # karena setelah payment pertama order sudah bukan PENDING_PAYMENT lagi)
         db = SessionLocal()
+        request_hash = idempotency.fingerprint({"order_id": order_id, "amount": amount, "payment_method": payment_method})
         try:
-            # Cek double payment di lokal juga (Double Protection)
-            existing = db.query(Payment).filter(
-                Payment.order_id == order_id, Payment.status == "SUCCESS"
-            ).first()
-            if existing:
-                raise Exception("Order already paid (Recorded in Payment DB)")
-
-            new_payment = Payment(
-                order_id=order_id, user_id=user_id, amount=amount,
-                payment_method=payment_method, status="SUCCESS" # Anggap sukses
+            record, replay = idempotency.begin(
+                db, user_id, info.context["request"].headers.get("Idempotency-Key"), request_hash
             )
-            db.add(new_payment)
-            db.commit()
-            db.refresh(new_payment)
-            
-            # --- LANGKAH 3: Update Status di Order Service (CALLBACK) ---
-            # Beritahu Order Service bahwa ini sudah lunas -> Ubah status jadi 'PREPARING' atau 'PAID'
-            requests.put(
-                f"{ORDER_SERVICE_URL}/internal/orders/{order_id}/status",
-                json={"status": "PAID"} # Atau 'PREPARING'
-            )
-            
-            return PaymentType(
-                id=new_payment.id, order_id=new_payment.order_id,
-                user_id=new_payment.user_id, amount=float(new_payment.amount),
-                status=new_payment.status, payment_method=new_payment.payment_method,
-                created_at=str(new_payment.created_at)
-            )
-            
+        except idempotency.IdempotencyError as e:
+            db.close()
+            raise Exception(e.detail)
+        if replay:
+            db.close()
+            return PaymentType(**replay[1])
+
+        try:
+            return _pay(db, record, user_id, order_id, amount, payment_method)
         except Exception as e:
             db.rollback()
+            idempotency.release(db, record)
             raise e
         finally:
             db.close()
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+schema = strawberry.Schema(query=Query, mutation=Mutation)
@@ -34,6 +34,7 @@ CREATE TABLE `payments` (
   `amount` decimal(10,2) NOT NULL,
   `status` varchar(50) DEFAULT 'PENDING',
   `payment_method` varchar(50) DEFAULT NULL,
+  `success_order_id` int(11) DEFAULT NULL,
   `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
   `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -42,8 +43,8 @@ CREATE TABLE `payments` (
 -- Dumping data untuk tabel `payments`
 --
 
-INSERT INTO `payments` (`id`, `order_id`, `user_id`, `amount`, `status`, `payment_method`, `created_at`, `updated_at`) VALUES
-(1, 1, 5, 94700.00, 'SUCCESS', NULL, '2025-12-12 06:49:29', '2025-12-12 06:49:53');
+INSERT INTO `payments` (`id`, `order_id`, `user_id`, `amount`, `status`, `payment_method`, `success_order_id`, `created_at`, `updated_at`) VALUES
+(1, 1, 5, 94700.00, 'SUCCESS', NULL, 1, '2025-12-12 06:49:29', '2025-12-12 06:49:53');
 
 --
 -- Indexes for dumped tables
@@ -56,7 +57,8 @@ ALTER TABLE `payments`
   ADD PRIMARY KEY (`id`),
   ADD KEY `idx_order_id` (`order_id`),
   ADD KEY `idx_user_id` (`user_id`),
-  ADD KEY `idx_status` (`status`);
+  ADD KEY `idx_status` (`status`),
+  ADD UNIQUE KEY `success_order_id` (`success_order_id`);
 
 --
 -- AUTO_INCREMENT untuk tabel yang dibuang
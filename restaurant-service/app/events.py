@@ -0,0 +1,167 @@
+"""
+Change event stream Restaurant Service (untuk invalidasi cache di service lain).
+
+Setiap mutasi restoran / menu / stok mem-publish event berversi:
+    {"seq", "entity", "entity_id", "version", "action", "restaurant_id", "occurred_at"}
+
+`seq` naik monoton per broker, konsumen cukup menyimpan seq terakhir lalu polling
+GET /internal/events?after=<seq>. Subscriber in-process (index pencarian, dll) dipanggil
+langsung saat publish.
+
+Broker dipilih lewat ENV CHANGE_EVENT_BROKER:
+- "memory" (default): ring buffer di memori proses
+- "sqlite": file SQLite (CHANGE_EVENT_SQLITE_PATH), bisa dibaca beberapa worker di host yang sama
+Implementasi lain (Redis Streams, Kafka, ...) cukup turunan EventBroker lalu set_broker().
+"""
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+ENTITY_RESTAURANT = "restaurant"
+ENTITY_MENU_ITEM = "menu_item"
+
+ACTION_CREATED = "created"
+ACTION_UPDATED = "updated"
+ACTION_DELETED = "deleted"
+ACTION_STOCK = "stock"
+
+MAX_RETAINED_EVENTS = int(os.getenv("CHANGE_EVENT_RETENTION", "10000"))
+
+class EventBroker(ABC):
+    """Interface broker. publish() mengisi `seq` dan mengembalikan event yang tersimpan."""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _notify(self, event: dict):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Change event subscriber failed: {e}")
+
+    @abstractmethod
+    def publish(self, event: dict) -> dict:
+        ...
+
+    @abstractmethod
+    def read(self, after: int = 0, limit: int = 100) -> list:
+        ...
+
+    @abstractmethod
+    def last_seq(self) -> int:
+        ...
+
+class InMemoryBroker(EventBroker):
+    def __init__(self, retention: int = MAX_RETAINED_EVENTS):
+        super().__init__()
+        self._events = deque(maxlen=retention)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict) -> dict:
+        with self._lock:
+            self._seq += 1
+            stored = dict(event, seq=self._seq)
+            self._events.append(stored)
+        self._notify(stored)
+        return stored
+
+    def read(self, after: int = 0, limit: int = 100) -> list:
+        with self._lock:
+            return [e for e in self._events if e["seq"] > after][:limit]
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+class SQLiteBroker(EventBroker):
+    def __init__(self, path: str, retention: int = MAX_RETAINED_EVENTS):
+        super().__init__()
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS change_events ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " entity TEXT NOT NULL, entity_id INTEGER NOT NULL, version INTEGER NOT NULL,"
+                " action TEXT NOT NULL, restaurant_id INTEGER, occurred_at TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn: # commit / rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def publish(self, event: dict) -> dict:
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO change_events (entity, entity_id, version, action, restaurant_id, occurred_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (event["entity"], event["entity_id"], event["version"], event["action"],
+                 event.get("restaurant_id"), event["occurred_at"])
+            )
+            seq = cursor.lastrowid
+            if seq % 100 == 0:
+                conn.execute("DELETE FROM change_events WHERE seq <= ?", (seq - self.retention,))
+        stored = dict(event, seq=seq)
+        self._notify(stored)
+        return stored
+
+    def read(self, after: int = 0, limit: int = 100) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, entity, entity_id, version, action, restaurant_id, occurred_at"
+                " FROM change_events WHERE seq > ? ORDER BY seq LIMIT ?",
+                (after, limit)
+            ).fetchall()
+        keys = ("seq", "entity", "entity_id", "version", "action", "restaurant_id", "occurred_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def last_seq(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(seq) FROM change_events").fetchone()
+        return row[0] or 0
+
+def _create_broker() -> EventBroker:
+    kind = os.getenv("CHANGE_EVENT_BROKER", "memory").lower()
+    if kind == "sqlite":
+        return SQLiteBroker(os.getenv("CHANGE_EVENT_SQLITE_PATH", "/tmp/restaurant_change_events.db"))
+    return InMemoryBroker()
+
+_broker = _create_broker()
+
+def get_broker() -> EventBroker:
+    return _broker
+
+def set_broker(broker: EventBroker):
+    """Ganti implementasi broker (test / broker eksternal). Subscriber in-process ikut dipindahkan."""
+    global _broker
+    broker._subscribers.extend(_broker._subscribers)
+    _broker = broker
+
+def publish(entity: str, entity_id: int, version: int, action: str, restaurant_id: int = None) -> dict:
+    return _broker.publish({
+        "entity": entity,
+        "entity_id": entity_id,
+        "version": version,
+        "action": action,
+        "restaurant_id": restaurant_id,
+        "occurred_at": datetime.utcnow().isoformat()
+    })
+
+def subscribe(callback):
+    _broker.subscribe(callback)
@@ -1,12 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, Body
+from fastapi import FastAPI, Depends, HTTPException, Body, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from strawberry.fastapi import GraphQLRouter
-from typing import List
+from sqlalchemy import update, func
+from typing import List, Optional
 from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import os
+import threading
+import time
+import uuid
 from .database import engine, Base, get_db, SessionLocal
-from .models import Restaurant, MenuItem
+from .models import Restaurant, MenuItem, StockReservation, StockReservationItem
 from .schema import schema
+from . import events
+from . import search
+from . import geo
 
 Base.metadata.create_all(bind=engine)
 
@@ -25,13 +38,7 @@ app.add_middleware(
 
 # --- INTERNAL API (INTEGRASI) ---
 
-# 1. Endpoint untuk Cek Ketersediaan & Harga Menu (Dipanggil Order Service)
-@app.get("/internal/menu-items/{item_id}")
-def get_menu_item_internal(item_id: int, db: Session = Depends(get_db)):
-    item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Menu item not found")
-    
+def _menu_item_internal(item: MenuItem):
     return {
         "id": item.id,
         "name": item.name,
@@ -41,67 +48,519 @@ def get_menu_item_internal(item_id: int, db: Session = Depends(get_db)):
         "restaurant_id": item.restaurant_id
     }
 
+# --- CHANGE EVENTS (invalidasi cache service lain) ---
+
+def _publish_restaurant(restaurant: Restaurant, action: str):
+    events.publish(events.ENTITY_RESTAURANT, restaurant.id, restaurant.version, action, restaurant_id=restaurant.id)
+
+def _publish_menu_item(item: MenuItem, action: str):
+    events.publish(events.ENTITY_MENU_ITEM, item.id, item.version, action, restaurant_id=item.restaurant_id)
+
+def _publish_stock_changes(db: Session, menu_item_ids):
+    # Dipanggil setelah commit: ambil versi terbaru hasil UPDATE stok
+    ids = sorted(set(menu_item_ids))
+    if not ids:
+        return
+    rows = db.query(MenuItem.id, MenuItem.version, MenuItem.restaurant_id).filter(MenuItem.id.in_(ids)).all()
+    for r in rows:
+        events.publish(events.ENTITY_MENU_ITEM, r.id, r.version, events.ACTION_STOCK, restaurant_id=r.restaurant_id)
+
+# Polling event untuk konsumen lintas service: simpan `seq` terakhir, minta ?after=<seq>
+@app.get("/internal/events")
+def get_change_events(after: int = 0, limit: int = 100):
+    limit = max(1, min(limit, 1000))
+    broker = events.get_broker()
+    return {"status": "success", "data": broker.read(after, limit), "last_seq": broker.last_seq()}
+
+# 1a. Endpoint Batch: ambil banyak menu sekaligus dengan satu query IN (Dipanggil Order Service)
+# Harus didaftarkan sebelum /internal/menu-items/{item_id} agar "batch" tidak dianggap item_id
+@app.get("/internal/menu-items/batch")
+def get_menu_items_batch_internal(ids: str, db: Session = Depends(get_db)):
+    try:
+        id_list = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+
+    items = []
+    if id_list:
+        items = db.query(MenuItem).filter(MenuItem.id.in_(id_list)).all()
+    return {"status": "success", "data": [_menu_item_internal(i) for i in items]}
+
+# 1. Endpoint untuk Cek Ketersediaan & Harga Menu (Dipanggil Order Service)
+@app.get("/internal/menu-items/{item_id}")
+def get_menu_item_internal(item_id: int, db: Session = Depends(get_db)):
+    item = db.query(MenuItem).filter(MenuItem.id == item_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Menu item not found")
+
+    return _menu_item_internal(item)
+
 # Model untuk payload pengurangan stok
 class StockUpdateItem(BaseModel):
     menu_item_id: int
     quantity: int
 
-# 2. Endpoint untuk Kurangi Stok (Dipanggil Order Service saat Create Order)
+def _take_stock(db: Session, menu_item_id: int, quantity: int) -> bool:
+    # Conditional UPDATE: cek & kurangi stok dalam satu statement (tidak bisa oversell)
+    result = db.execute(
+        update(MenuItem)
+        .where(MenuItem.id == menu_item_id, MenuItem.stock >= quantity)
+        .values(stock=MenuItem.stock - quantity, version=MenuItem.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def _return_stock(db: Session, menu_item_id: int, quantity: int):
+    db.execute(
+        update(MenuItem)
+        .where(MenuItem.id == menu_item_id)
+        .values(stock=MenuItem.stock + quantity, version=MenuItem.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+# 2. Endpoint untuk Kurangi Stok (Legacy, reservasi baru pakai /internal/stock/reservations)
 @app.post("/internal/menu-items/reduce-stock")
 def reduce_stock_internal(items: List[StockUpdateItem], db: Session = Depends(get_db)):
-    for item_req in items:
-        menu_item = db.query(MenuItem).filter(MenuItem.id == item_req.menu_item_id).first()
-        
-        if not menu_item:
-            raise HTTPException(status_code=404, detail=f"Menu {item_req.menu_item_id} not found")
-        
-        if menu_item.stock < item_req.quantity:
+    # Urutkan berdasarkan ID agar urutan lock row konsisten (hindari deadlock)
+    for item_req in sorted(items, key=lambda i: i.menu_item_id):
+        if item_req.quantity <= 0:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Quantity must be positive")
+
+        if not _take_stock(db, item_req.menu_item_id, item_req.quantity):
+            db.rollback()
+            menu_item = db.query(MenuItem).filter(MenuItem.id == item_req.menu_item_id).first()
+            if not menu_item:
+                raise HTTPException(status_code=404, detail=f"Menu {item_req.menu_item_id} not found")
             raise HTTPException(status_code=400, detail=f"Stock not enough for {menu_item.name}")
-        
-        # Kurangi Stok
-        menu_item.stock -= item_req.quantity
-    
+
     db.commit()
+    _publish_stock_changes(db, [i.menu_item_id for i in items])
     return {"message": "Stock updated successfully"}
 
+# --- RESERVASI STOK (Reserve -> Confirm / Release) ---
+
+RESERVATION_TTL_SECONDS = int(os.getenv("STOCK_RESERVATION_TTL_SECONDS", "1800"))
+RESERVATION_REAPER_INTERVAL_SECONDS = int(os.getenv("STOCK_RESERVATION_REAPER_INTERVAL_SECONDS", "60"))
+
+class ReservationRequest(BaseModel):
+    restaurant_id: int
+    items: List[StockUpdateItem]
+    ttl_seconds: Optional[int] = None
+
+def _release_reservation(db: Session, reservation: StockReservation) -> bool:
+    # Ubah status RESERVED -> RELEASED secara kondisional, baru kembalikan stok.
+    # Kalau ada request lain (confirm/release) yang menang duluan, rowcount = 0.
+    result = db.execute(
+        update(StockReservation)
+        .where(StockReservation.id == reservation.id, StockReservation.status == "RESERVED")
+        .values(status="RELEASED")
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    for line in sorted(reservation.items, key=lambda i: i.menu_item_id):
+        _return_stock(db, line.menu_item_id, line.quantity)
+    return True
+
+def release_expired_reservations(db: Session, limit: int = 100) -> int:
+    expired = db.query(StockReservation).filter(
+        StockReservation.status == "RESERVED",
+        StockReservation.expires_at < datetime.utcnow()
+    ).limit(limit).all()
+
+    released = 0
+    changed_items = []
+    for reservation in expired:
+        if _release_reservation(db, reservation):
+            released += 1
+            changed_items += [line.menu_item_id for line in reservation.items]
+    db.commit()
+    _publish_stock_changes(db, changed_items)
+    return released
+
+def _reservation_reaper_loop():
+    while True:
+        time.sleep(RESERVATION_REAPER_INTERVAL_SECONDS)
+        db = SessionLocal()
+        try:
+            released = release_expired_reservations(db)
+            if released:
+                print(f"Released {released} expired stock reservations")
+        except Exception as e:
+            db.rollback()
+            print(f"Stock reservation reaper failed: {e}")
+        finally:
+            db.close()
+
+@app.on_event("startup")
+def start_reservation_reaper():
+    threading.Thread(target=_reservation_reaper_loop, daemon=True).start()
+
+# 3. Reservasi stok + harga dalam satu transaksi (Dipanggil Order Service saat Create Order)
+@app.post("/internal/stock/reservations")
+def create_stock_reservation(req: ReservationRequest, db: Session = Depends(get_db)):
+    # Gabungkan baris dengan menu yang sama
+    quantities = {}
+    for item_req in req.items:
+        if item_req.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be positive")
+        quantities[item_req.menu_item_id] = quantities.get(item_req.menu_item_id, 0) + item_req.quantity
+
+    if not quantities:
+        raise HTTPException(status_code=400, detail="No items to reserve")
+
+    menu_map = {
+        m.id: m for m in db.query(MenuItem).filter(MenuItem.id.in_(list(quantities.keys()))).all()
+    }
+    for menu_item_id in quantities:
+        menu_item = menu_map.get(menu_item_id)
+        if not menu_item:
+            raise HTTPException(status_code=404, detail=f"Menu Item ID {menu_item_id} not found")
+        if menu_item.restaurant_id != req.restaurant_id:
+            raise HTTPException(status_code=400, detail=f"Menu {menu_item.name} does not belong to this restaurant")
+
+    ttl = req.ttl_seconds or RESERVATION_TTL_SECONDS
+    reservation = StockReservation(
+        id=str(uuid.uuid4()),
+        restaurant_id=req.restaurant_id,
+        status="RESERVED",
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+    )
+    db.add(reservation)
+
+    # Urutkan berdasarkan ID agar urutan lock row konsisten (hindari deadlock)
+    for menu_item_id in sorted(quantities):
+        menu_item = menu_map[menu_item_id]
+        if not _take_stock(db, menu_item_id, quantities[menu_item_id]):
+            db.rollback()
+            db.refresh(menu_item)
+            raise HTTPException(status_code=400, detail=f"Stock habis untuk {menu_item.name}. Sisa: {menu_item.stock}")
+        reservation.items.append(StockReservationItem(
+            menu_item_id=menu_item_id,
+            quantity=quantities[menu_item_id],
+            price=menu_item.price
+        ))
+
+    db.commit()
+    _publish_stock_changes(db, quantities.keys())
+    pickup = db.query(Restaurant.latitude, Restaurant.longitude).filter(Restaurant.id == req.restaurant_id).first()
+
+    return {
+        "status": "success",
+        "data": {
+            "reservation_id": reservation.id,
+            "expires_at": reservation.expires_at,
+            "restaurant_id": req.restaurant_id,
+            # Titik jemput untuk Order Service (filter order berdasarkan radius driver)
+            "pickup": {"latitude": pickup.latitude, "longitude": pickup.longitude} if pickup else None,
+            "items": [
+                {
+                    "id": m.id,
+                    "name": m.name,
+                    "price": float(m.price),
+                    "quantity": quantities[m.id]
+                } for m in (menu_map[i] for i in sorted(quantities))
+            ]
+        }
+    }
+
+def _get_reservation_or_404(db: Session, reservation_id: str) -> StockReservation:
+    reservation = db.query(StockReservation).filter(StockReservation.id == reservation_id).first()
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return reservation
+
+def _reclaim_reservation(db: Session, reservation: StockReservation) -> bool:
+    # Reservasi sudah dilepas (TTL habis) tapi pembayaran tetap masuk: ambil ulang stoknya.
+    # Semua baris harus kebagian stok, kalau tidak rollback (tidak boleh oversell).
+    result = db.execute(
+        update(StockReservation)
+        .where(StockReservation.id == reservation.id, StockReservation.status == "RELEASED")
+        .values(status="CONFIRMED")
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    for line in sorted(reservation.items, key=lambda i: i.menu_item_id):
+        if not _take_stock(db, line.menu_item_id, line.quantity):
+            db.rollback()
+            return False
+    return True
+
+# 4. Konfirmasi reservasi (Order sudah dibayar, stok tidak akan dikembalikan)
+@app.post("/internal/stock/reservations/{reservation_id}/confirm")
+def confirm_stock_reservation(reservation_id: str, db: Session = Depends(get_db)):
+    reservation = _get_reservation_or_404(db, reservation_id)
+    if reservation.status == "CONFIRMED":
+        return {"status": "success", "data": {"reservation_id": reservation.id, "status": reservation.status}}
+
+    if reservation.status == "RELEASED":
+        if not _reclaim_reservation(db, reservation):
+            raise HTTPException(status_code=409, detail="Reservation expired and stock is no longer available")
+        db.commit()
+        _publish_stock_changes(db, [line.menu_item_id for line in reservation.items])
+        return {"status": "success", "data": {"reservation_id": reservation_id, "status": "CONFIRMED"}}
+
+    result = db.execute(
+        update(StockReservation)
+        .where(StockReservation.id == reservation_id, StockReservation.status == "RESERVED")
+        .values(status="CONFIRMED")
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if result.rowcount != 1:
+        # Kalah balapan dengan reaper / release -> 503 supaya pengirim (outbox) mengulang,
+        # percobaan berikutnya masuk jalur RELEASED di atas
+        raise HTTPException(status_code=503, detail="Reservation changed concurrently, retry")
+    return {"status": "success", "data": {"reservation_id": reservation_id, "status": "CONFIRMED"}}
+
+# 5. Lepas reservasi (Order gagal disimpan / dibatalkan) -> stok dikembalikan
+@app.post("/internal/stock/reservations/{reservation_id}/release")
+def release_stock_reservation(reservation_id: str, db: Session = Depends(get_db)):
+    reservation = _get_reservation_or_404(db, reservation_id)
+    if reservation.status == "RELEASED":
+        return {"status": "success", "data": {"reservation_id": reservation.id, "status": reservation.status}}
+
+    released = _release_reservation(db, reservation)
+    db.commit()
+    if not released:
+        raise HTTPException(status_code=409, detail="Reservation already confirmed")
+    _publish_stock_changes(db, [line.menu_item_id for line in reservation.items])
+    return {"status": "success", "data": {"reservation_id": reservation_id, "status": "RELEASED"}}
+
+# 6. Kembalikan stok reservasi yang sudah dikonfirmasi (Order dibatalkan setelah dibayar)
+@app.post("/internal/stock/reservations/{reservation_id}/return")
+def return_stock_reservation(reservation_id: str, db: Session = Depends(get_db)):
+    reservation = _get_reservation_or_404(db, reservation_id)
+    if reservation.status in ("RETURNED", "RELEASED"):
+        # Stok sudah kembali sebelumnya -> idempotent
+        return {"status": "success", "data": {"reservation_id": reservation.id, "status": reservation.status}}
+
+    if reservation.status == "RESERVED":
+        # Belum sempat dikonfirmasi (mis. outbox confirm belum terkirim) -> cukup dilepas
+        if not _release_reservation(db, reservation):
+            db.rollback()
+            raise HTTPException(status_code=503, detail="Reservation changed concurrently, retry")
+        new_status = "RELEASED"
+    else:
+        result = db.execute(
+            update(StockReservation)
+            .where(StockReservation.id == reservation_id, StockReservation.status == "CONFIRMED")
+            .values(status="RETURNED")
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            raise HTTPException(status_code=503, detail="Reservation changed concurrently, retry")
+        for line in sorted(reservation.items, key=lambda i: i.menu_item_id):
+            _return_stock(db, line.menu_item_id, line.quantity)
+        new_status = "RETURNED"
+
+    db.commit()
+    _publish_stock_changes(db, [line.menu_item_id for line in reservation.items])
+    return {"status": "success", "data": {"reservation_id": reservation_id, "status": new_status}}
+
+# --- HTTP CACHING (ETag / Last-Modified) ---
+# Browser & API Gateway boleh menyimpan response publik sebentar, lalu revalidasi dengan
+# If-None-Match -> 304 tanpa query data lengkap & serialisasi.
+
+PUBLIC_MAX_AGE = int(os.getenv("PUBLIC_CACHE_MAX_AGE_SECONDS", "30"))
+PUBLIC_STALE_WHILE_REVALIDATE = int(os.getenv("PUBLIC_CACHE_STALE_WHILE_REVALIDATE_SECONDS", "300"))
+
+def _as_utc(value: datetime):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc) # MySQL DATETIME tanpa timezone, server UTC
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+def _validators(scope: str, row_count: int, max_updated_at, version_sum):
+    # Strong ETag: jumlah baris + updated_at terakhir + total versi (update dalam detik yang sama tetap terdeteksi)
+    last_modified = _as_utc(max_updated_at)
+    raw = f"{scope}|{row_count}|{last_modified.isoformat() if last_modified else '-'}|{version_sum or 0}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"', last_modified
+
+def _not_modified(request: Request, etag: str, last_modified) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match lebih prioritas dari If-Modified-Since (RFC 9110)
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _cache_headers(etag: str, last_modified) -> dict:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={PUBLIC_MAX_AGE}, stale-while-revalidate={PUBLIC_STALE_WHILE_REVALIDATE}"
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def _conditional_response(request: Request, etag: str, last_modified, load_payload):
+    """304 kalau validator klien masih cocok, selain itu panggil `load_payload()` dan kirim JSON + header cache."""
+    headers = _cache_headers(etag, last_modified)
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(load_payload()), headers=headers)
+
+def _aggregate_validators(scope: str, query):
+    row_count, max_updated_at, version_sum = query.one()
+    return _validators(scope, row_count, max_updated_at, version_sum)
+
+# --- SEARCH INDEX ---
+
+@app.on_event("startup")
+def build_search_index():
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        count = search.index.build_from_db(db)
+        print(f"Search index built: {count} documents in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"Failed to build search index: {e}")
+    finally:
+        db.close()
+
 # --- PUBLIC API ---
 
+RESTAURANT_DEFAULT_RADIUS_KM = float(os.getenv("RESTAURANT_DEFAULT_RADIUS_KM", "25"))
+
+def _restaurant_with_distance(restaurant: Restaurant, distance_km: float) -> dict:
+    data = {c.name: getattr(restaurant, c.name) for c in Restaurant.__table__.columns}
+    data["distance_km"] = round(distance_km, 2)
+    return data
+
 @app.get("/restaurants")
-def get_restaurants(cuisine_type: str = None, db: Session = Depends(get_db)):
-    query = db.query(Restaurant)
-    if cuisine_type:
-        query = query.filter(Restaurant.cuisine_type == cuisine_type)
-    return {"status": "success", "data": query.all()}
+def get_restaurants(
+    request: Request,
+    cuisine_type: str = None,
+    lat: float = None,
+    lng: float = None,
+    radius_km: float = None,
+    db: Session = Depends(get_db)
+):
+    def apply_filter(query):
+        if cuisine_type:
+            query = query.filter(Restaurant.cuisine_type == cuisine_type)
+        return query
+
+    if lat is None and lng is None:
+        etag, last_modified = _aggregate_validators(
+            f"restaurants:{cuisine_type or '*'}",
+            apply_filter(db.query(func.count(Restaurant.id), func.max(Restaurant.updated_at), func.sum(Restaurant.version)))
+        )
+        return _conditional_response(
+            request, etag, last_modified,
+            lambda: {"status": "success", "data": apply_filter(db.query(Restaurant)).all()}
+        )
+
+    # Mode jarak: kandidat diambil dari index grid (bukan scan tabel), urut dari yang terdekat.
+    # Restoran tanpa koordinat tidak ikut di mode ini.
+    radius_km = radius_km or RESTAURANT_DEFAULT_RADIUS_KM
+    if not geo.valid_coordinates(lat, lng) or radius_km <= 0:
+        raise HTTPException(status_code=400, detail="lat and lng are required together and radius_km must be positive")
+    nearby = search.index.locations.within(lat, lng, radius_km)
+    distances = {restaurant_id: distance for distance, restaurant_id in nearby}
+
+    def scoped(query):
+        return apply_filter(query.filter(Restaurant.id.in_(list(distances.keys()))))
+
+    etag, last_modified = _aggregate_validators(
+        f"restaurants:{cuisine_type or '*'}:{lat:.4f},{lng:.4f}:{radius_km}",
+        scoped(db.query(func.count(Restaurant.id), func.max(Restaurant.updated_at), func.sum(Restaurant.version)))
+    )
+
+    def load_nearby():
+        restaurants = scoped(db.query(Restaurant)).all() if distances else []
+        restaurants.sort(key=lambda r: (distances[r.id], r.id))
+        return {"status": "success", "data": [_restaurant_with_distance(r, distances[r.id]) for r in restaurants]}
+
+    return _conditional_response(request, etag, last_modified, load_nearby)
+
+# Harus didaftarkan sebelum /restaurants/{id} agar "search" tidak dianggap id
+@app.get("/restaurants/search")
+def search_restaurants(
+    q: str = "",
+    type: str = None, # restaurant | menu_item
+    cuisine: str = None,
+    category: str = None,
+    price_band: str = None,
+    restaurant_id: int = None,
+    page: int = 1,
+    size: int = 20
+):
+    if type and type not in (search.TYPE_RESTAURANT, search.TYPE_MENU_ITEM):
+        raise HTTPException(status_code=400, detail="type must be 'restaurant' or 'menu_item'")
+    if price_band and price_band not in [label for _, _, label in search.PRICE_BANDS]:
+        raise HTTPException(status_code=400, detail="Unknown price_band")
+    if page < 1 or not (1 <= size <= 50):
+        raise HTTPException(status_code=400, detail="page must be >= 1 and size between 1 and 50")
+
+    started = time.perf_counter()
+    result = search.index.search(
+        q, doc_type=type, cuisine=cuisine, category=category, band=price_band,
+        restaurant_id=restaurant_id, page=page, size=size
+    )
+    result["took_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return {"status": "success", "data": result}
 
 @app.get("/restaurants/{id}")
-def get_restaurant_by_id(id: int, db: Session = Depends(get_db)):
+def get_restaurant_by_id(id: int, request: Request, db: Session = Depends(get_db)):
     restaurant = db.query(Restaurant).filter(Restaurant.id == id).first()
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
-    return {"status": "success", "data": restaurant}
+    etag, last_modified = _validators(f"restaurant:{id}", 1, restaurant.updated_at, restaurant.version)
+    return _conditional_response(request, etag, last_modified, lambda: {"status": "success", "data": restaurant})
 
 @app.get("/restaurants/{restaurant_id}/menu")
-def get_restaurant_menu(restaurant_id: int, db: Session = Depends(get_db)):
+def get_restaurant_menu(restaurant_id: int, request: Request, db: Session = Depends(get_db)):
     # Corrected relation loading or just fetch items
     # The frontend expects "data.menu_items" or just the list? 
     # Frontend: const items: MenuItem[] = response.data.menu_items || [];
     # So we need to wrap it as {"data": {"menu_items": [...]}}
-    menu_items = db.query(MenuItem).filter(MenuItem.restaurant_id == restaurant_id).all()
-    return {"status": "success", "data": {"menu_items": menu_items}}
+    etag, last_modified = _aggregate_validators(
+        f"menu:{restaurant_id}",
+        db.query(func.count(MenuItem.id), func.max(MenuItem.updated_at), func.sum(MenuItem.version))
+        .filter(MenuItem.restaurant_id == restaurant_id)
+    )
+    return _conditional_response(
+        request, etag, last_modified,
+        lambda: {
+            "status": "success",
+            "data": {"menu_items": db.query(MenuItem).filter(MenuItem.restaurant_id == restaurant_id).all()}
+        }
+    )
 
 from fastapi import File, UploadFile, Form
 
 # --- RESTAURANT CRUD ---
 
+def _check_coordinates(latitude, longitude):
+    # Koordinat opsional, tapi kalau dikirim harus berpasangan & valid
+    if (latitude is None) != (longitude is None) or (latitude is not None and not geo.valid_coordinates(latitude, longitude)):
+        raise HTTPException(status_code=400, detail="latitude and longitude must be sent together and be valid coordinates")
+
 @app.post("/restaurants")
 def create_restaurant(
     name: str = Form(...),
     cuisine_type: str = Form(...),
     address: str = Form(...),
     is_open: bool = Form(True),
+    latitude: float = Form(None),
+    longitude: float = Form(None),
     image: UploadFile = File(None),
     db: Session = Depends(get_db)
 ):
+    _check_coordinates(latitude, longitude)
     # For now, we mock the image upload by assigning a placeholder
     image_url = "https://images.unsplash.com/photo-1555939594-58d7cb561ad1?w=800&h=600&fit=crop"
     
@@ -110,11 +569,15 @@ def create_restaurant(
         cuisine_type=cuisine_type,
         address=address,
         is_open=is_open,
-        image_url=image_url
+        image_url=image_url,
+        latitude=latitude,
+        longitude=longitude
     )
     db.add(new_restaurant)
     db.commit()
     db.refresh(new_restaurant)
+    _publish_restaurant(new_restaurant, events.ACTION_CREATED)
+    search.index.upsert_restaurant(new_restaurant)
     return {"status": "success", "data": new_restaurant}
 
 @app.put("/restaurants/{id}")
@@ -124,9 +587,12 @@ def update_restaurant(
     cuisine_type: str = Form(None),
     address: str = Form(None),
     is_open: str = Form(None), # Frontend sends 'true'/'false' string
+    latitude: float = Form(None),
+    longitude: float = Form(None),
     image: UploadFile = File(None),
     db: Session = Depends(get_db)
 ):
+    _check_coordinates(latitude, longitude)
     restaurant = db.query(Restaurant).filter(Restaurant.id == id).first()
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
@@ -136,9 +602,14 @@ def update_restaurant(
     if address: restaurant.address = address
     if is_open is not None:
         restaurant.is_open = (is_open.lower() == 'true')
+    if latitude is not None:
+        restaurant.latitude, restaurant.longitude = latitude, longitude
+    restaurant.version = Restaurant.version + 1 # Atomik di SQL, aman untuk update bersamaan
         
     db.commit()
     db.refresh(restaurant)
+    _publish_restaurant(restaurant, events.ACTION_UPDATED)
+    search.index.upsert_restaurant(restaurant)
     return {"status": "success", "data": restaurant}
 
 @app.delete("/restaurants/{id}")
@@ -148,8 +619,14 @@ def delete_restaurant(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Restaurant not found")
     
     # Cascade delete menu items usually handled by DB FK, ensuring here if manual needed
+    deleted_menus = [(m.id, m.version + 1) for m in restaurant.menus]
+    deleted_version = restaurant.version + 1
     db.delete(restaurant)
     db.commit()
+    for menu_id, menu_version in deleted_menus:
+        events.publish(events.ENTITY_MENU_ITEM, menu_id, menu_version, events.ACTION_DELETED, restaurant_id=id)
+    events.publish(events.ENTITY_RESTAURANT, id, deleted_version, events.ACTION_DELETED, restaurant_id=id)
+    search.index.remove_restaurant(id)
     return {"status": "success", "message": "Restaurant deleted"}
 
 # --- MENU CRUD ---
@@ -184,6 +661,8 @@ def create_menu_item(
     db.add(new_item)
     db.commit()
     db.refresh(new_item)
+    _publish_menu_item(new_item, events.ACTION_CREATED)
+    search.index.upsert_menu_item(new_item)
     return {"status": "success", "data": new_item}
 
 @app.put("/restaurants/menu-items/{item_id}")
@@ -209,9 +688,12 @@ def update_menu_item(
     if category: item.category = category
     if is_available is not None:
         item.is_available = (is_available.lower() == 'true')
+    item.version = MenuItem.version + 1 # Atomik di SQL, aman untuk update bersamaan
         
     db.commit()
     db.refresh(item)
+    _publish_menu_item(item, events.ACTION_UPDATED)
+    search.index.upsert_menu_item(item)
     return {"status": "success", "data": item}
 
 @app.delete("/restaurants/menu-items/{item_id}")
@@ -220,6 +702,9 @@ def delete_menu_item(item_id: int, db: Session = Depends(get_db)):
     if not item:
         raise HTTPException(status_code=404, detail="Menu Item not found")
         
+    deleted_version, restaurant_id = item.version + 1, item.restaurant_id
     db.delete(item)
     db.commit()
+    events.publish(events.ENTITY_MENU_ITEM, item_id, deleted_version, events.ACTION_DELETED, restaurant_id=restaurant_id)
+    search.index.remove_menu_item(item_id)
     return {"status": "success", "message": "Menu Item deleted"}
\ No newline at end of file
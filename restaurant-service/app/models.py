@@ -12,6 +12,9 @@ class Restaurant(Base):
     address = Column(Text, nullable=False)
     is_open = Column(Boolean, default=True)
     image_url = Column(String(500), nullable=True) # DB: image_url
+    latitude = Column(Float, nullable=True) # Koordinat untuk urutan jarak (index grid di geo.py)
+    longitude = Column(Float, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1") # Naik setiap perubahan (change event)
     
     # RATING SUDAH DIHAPUS TOTAL
     
@@ -32,8 +35,33 @@ class MenuItem(Base):
     is_available = Column(Boolean, default=True)
     category = Column(String(50), default="Makanan")
     image_url = Column(String(500), nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1") # Naik setiap perubahan (change event)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
-    restaurant = relationship("Restaurant", back_populates="menus")
\ No newline at end of file
+    restaurant = relationship("Restaurant", back_populates="menus")
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+
+    id = Column(String(36), primary_key=True) # UUID, dikirim ke Order Service
+    restaurant_id = Column(Integer, nullable=False)
+    status = Column(String(20), default="RESERVED", index=True) # RESERVED, CONFIRMED, RELEASED, RETURNED
+    expires_at = Column(DateTime, nullable=False, index=True) # UTC
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    items = relationship("StockReservationItem", back_populates="reservation", cascade="all, delete-orphan")
+
+class StockReservationItem(Base):
+    __tablename__ = "stock_reservation_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    reservation_id = Column(String(36), ForeignKey("stock_reservations.id", ondelete="CASCADE"), nullable=False, index=True)
+    menu_item_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    price = Column(DECIMAL(10, 2), nullable=False) # Harga saat reservasi (authoritative)
+
+    reservation = relationship("StockReservation", back_populates="items")
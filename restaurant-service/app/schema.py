@@ -4,13 +4,17 @@ from strawberry.types import Info
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .models import Restaurant, MenuItem
-from jose import jwt, JWTError
+from . import events
+from . import search
+from .auth import TokenVerifier, AuthError
 import os
 
 # --- KONFIGURASI AUTH ---
 SECRET_KEY = os.getenv("SECRET_KEY", "kunci_rahasia_project_ini_harus_sama_semua")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM)
+
 def get_current_user(info: Info):
     """
     Validasi Token dan return data user (id & role)
@@ -24,15 +28,10 @@ def get_current_user(info: Info):
         raise Exception("Authorization header missing")
 
     try:
-        scheme, token = auth_header.split()
-        if scheme.lower() != "bearer":
-            raise Exception("Invalid authentication scheme")
-        
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload # Berisi {'id': ..., 'role': ..., 'sub': ...}
-        
-    except (ValueError, JWTError):
-        raise Exception("Invalid or expired token")
+        principal = token_verifier.principal(auth_header)
+    except AuthError as e:
+        raise Exception(e.detail)
+    return principal.claims # Berisi {'id': ..., 'role': ..., 'name': ..., 'sub': ...}
 
 # --- TYPES (Sama seperti sebelumnya) ---
 
@@ -55,6 +54,8 @@ class RestaurantType:
     isOpen: bool
     category: Optional[str] 
     imageUrl: Optional[str]
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
     @strawberry.field
     def menus(self) -> List[MenuItemType]:
@@ -91,7 +92,9 @@ class Query:
                 address=r.address, 
                 isOpen=bool(r.is_open),
                 category=r.cuisine_type, 
-                imageUrl=r.image_url
+                imageUrl=r.image_url,
+                latitude=r.latitude,
+                longitude=r.longitude
             ) for r in restaurants_db
         ]
 
@@ -108,7 +111,9 @@ class Query:
                 address=r.address, 
                 isOpen=bool(r.is_open),
                 category=r.cuisine_type,
-                imageUrl=r.image_url
+                imageUrl=r.image_url,
+                latitude=r.latitude,
+                longitude=r.longitude
             )
         return None
 
@@ -123,7 +128,9 @@ class Mutation:
         name: str, 
         address: str, 
         category: str, 
-        image_url: str = None
+        image_url: str = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None
     ) -> RestaurantType:
         
         # 1. CEK AUTH & ROLE
@@ -141,11 +148,15 @@ class Mutation:
                 address=address, 
                 cuisine_type=category, 
                 is_open=True, 
-                image_url=image_url
+                image_url=image_url,
+                latitude=latitude,
+                longitude=longitude
             )
             db.add(new_resto)
             db.commit()
             db.refresh(new_resto)
+            events.publish(events.ENTITY_RESTAURANT, new_resto.id, new_resto.version, events.ACTION_CREATED, restaurant_id=new_resto.id)
+            search.index.upsert_restaurant(new_resto)
             
             return RestaurantType(
                 id=new_resto.id, 
@@ -153,7 +164,9 @@ class Mutation:
                 address=new_resto.address, 
                 isOpen=new_resto.is_open,
                 category=new_resto.cuisine_type,
-                imageUrl=new_resto.image_url
+                imageUrl=new_resto.image_url,
+                latitude=new_resto.latitude,
+                longitude=new_resto.longitude
             )
         finally:
             db.close()
@@ -0,0 +1,390 @@
+"""
+Index pencarian in-process (inverted index) untuk restoran & menu.
+
+- Field yang di-index: nama, deskripsi, kategori, cuisine, kota (bagian terakhir alamat)
+- Match: kata persis > prefix ("sat" -> "sate") > typo 1 huruf ("bkso" -> "bakso")
+- Semua kata query harus cocok (AND), skor = jumlah bobot field terbaik per kata
+- Facet: cuisine, category, price_band (dihitung dari hasil yang lolos filter)
+
+Dibangun sekali saat startup (build_from_db) lalu di-update oleh handler CRUD, jadi
+pencarian tidak menyentuh MySQL sama sekali. Lokasi restoran ikut disimpan di GeoIndex
+(`index.locations`) untuk listing berdasarkan jarak.
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from sqlalchemy.orm import Session
+from .models import Restaurant, MenuItem
+from .geo import GeoIndex, valid_coordinates
+
+TYPE_RESTAURANT = "restaurant"
+TYPE_MENU_ITEM = "menu_item"
+
+# Bobot field (nama paling penting)
+WEIGHT_NAME = 3.0
+WEIGHT_CATEGORY = 2.0
+WEIGHT_CUISINE = 2.0
+WEIGHT_CITY = 1.0
+WEIGHT_DESCRIPTION = 1.0
+WEIGHT_RESTAURANT_NAME = 0.5 # Nama restoran di dokumen menu
+
+# Kualitas match per kata query
+MATCH_EXACT = 1.0
+MATCH_PREFIX = 0.7
+MATCH_TYPO = 0.5
+
+MIN_PREFIX_LENGTH = 2
+MIN_TYPO_LENGTH = 4
+
+# (batas bawah, batas atas, label) dalam Rupiah
+PRICE_BANDS = [
+    (0, 15000, "under_15k"),
+    (15000, 30000, "15k_30k"),
+    (30000, 50000, "30k_50k"),
+    (50000, None, "over_50k"),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text) -> list:
+    if not text:
+        return []
+    normalized = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode().lower()
+    return _TOKEN_RE.findall(normalized)
+
+def city_of(address) -> str:
+    # "Jl. Dago No. 100, Bandung" -> "Bandung"
+    if not address:
+        return ""
+    return address.rsplit(",", 1)[-1].strip()
+
+def price_band(price) -> str:
+    if price is None:
+        return None
+    price = float(price)
+    for low, high, label in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+def _deletes(token: str) -> list:
+    return [token[:i] + token[i + 1:] for i in range(len(token))]
+
+def _within_one_edit(a: str, b: str) -> bool:
+    # Levenshtein <= 1 (+ tukar dua huruf bersebelahan)
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb:
+        a, b = b, a
+    # b lebih panjang satu huruf
+    for i in range(len(b)):
+        if b[:i] + b[i + 1:] == a:
+            return True
+    return False
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {} # (type, id) -> dict dokumen
+        self._doc_terms = {} # (type, id) -> {token: bobot}
+        self._postings = {} # token -> {(type, id): bobot}
+        self._vocab = [] # token terurut, untuk prefix lookup (bisect)
+        self._delete_map = {} # token tanpa satu huruf -> {token}, untuk typo lookup
+        self._restaurants = {} # restaurant_id -> {"name", "cuisine_type", "city"} (untuk dokumen menu)
+        self._sort_keys = {} # (type, id) -> string urutan untuk skor yang sama
+        self._owner = {} # (type, id) -> restaurant_id
+        self._facet_combo = {} # (type, id) -> id kombinasi facet (int, murah dihitung)
+        self._combos = [] # id kombinasi -> (cuisine, category, price_band)
+        self._combo_ids = {}
+        self.locations = GeoIndex() # restaurant_id -> (lat, lon)
+
+    # --- Maintenance ---
+
+    def _add_token(self, token: str):
+        bisect.insort(self._vocab, token)
+        if len(token) >= MIN_TYPO_LENGTH - 1:
+            for key in [token] + _deletes(token):
+                self._delete_map.setdefault(key, set()).add(token)
+
+    def _remove_token(self, token: str):
+        i = bisect.bisect_left(self._vocab, token)
+        if i < len(self._vocab) and self._vocab[i] == token:
+            self._vocab.pop(i)
+        if len(token) >= MIN_TYPO_LENGTH - 1:
+            for key in [token] + _deletes(token):
+                bucket = self._delete_map.get(key)
+                if bucket is not None:
+                    bucket.discard(token)
+                    if not bucket:
+                        del self._delete_map[key]
+
+    def _put(self, key, doc: dict, fields):
+        terms = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                terms[token] = max(terms.get(token, 0), weight)
+
+        self._remove(key)
+        self._docs[key] = doc
+        self._doc_terms[key] = terms
+        available = doc.get("is_available", doc.get("is_open", True))
+        # "0"/"1" di depan: yang tersedia / buka lebih dulu, lalu nama, lalu id
+        self._sort_keys[key] = f"{0 if available else 1}{(doc['name'] or '').lower()}\x00{doc['id']:012d}"
+        self._owner[key] = doc["id"] if doc["type"] == TYPE_RESTAURANT else doc["restaurant_id"]
+        combo = (doc.get("cuisine_type"), doc.get("category"), doc.get("price_band"))
+        if combo not in self._combo_ids:
+            self._combo_ids[combo] = len(self._combos)
+            self._combos.append(combo)
+        self._facet_combo[key] = self._combo_ids[combo]
+        for token, weight in terms.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                self._add_token(token)
+            posting[key] = weight
+
+    def _remove(self, key):
+        self._docs.pop(key, None)
+        self._sort_keys.pop(key, None)
+        self._owner.pop(key, None)
+        self._facet_combo.pop(key, None)
+        for token in self._doc_terms.pop(key, {}):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self._postings[token]
+                self._remove_token(token)
+
+    def _index_menu_doc(self, doc: dict):
+        resto = self._restaurants.get(doc["restaurant_id"], {})
+        doc["restaurant_name"] = resto.get("name")
+        doc["cuisine_type"] = resto.get("cuisine_type")
+        self._put((TYPE_MENU_ITEM, doc["id"]), doc, [
+            (doc["name"], WEIGHT_NAME),
+            (doc["category"], WEIGHT_CATEGORY),
+            (doc["description"], WEIGHT_DESCRIPTION),
+            (resto.get("cuisine_type"), WEIGHT_CUISINE),
+            (resto.get("city"), WEIGHT_CITY),
+            (resto.get("name"), WEIGHT_RESTAURANT_NAME),
+        ])
+
+    def upsert_restaurant(self, restaurant: Restaurant, reindex_menus: bool = True):
+        with self._lock:
+            city = city_of(restaurant.address)
+            self._restaurants[restaurant.id] = {
+                "name": restaurant.name, "cuisine_type": restaurant.cuisine_type, "city": city
+            }
+            self._put((TYPE_RESTAURANT, restaurant.id), {
+                "type": TYPE_RESTAURANT,
+                "id": restaurant.id,
+                "name": restaurant.name,
+                "cuisine_type": restaurant.cuisine_type,
+                "address": restaurant.address,
+                "city": city,
+                "is_open": bool(restaurant.is_open),
+                "image_url": restaurant.image_url
+            }, [
+                (restaurant.name, WEIGHT_NAME),
+                (restaurant.cuisine_type, WEIGHT_CUISINE),
+                (city, WEIGHT_CITY),
+            ])
+            if valid_coordinates(restaurant.latitude, restaurant.longitude):
+                self.locations.upsert(restaurant.id, restaurant.latitude, restaurant.longitude)
+            else:
+                self.locations.remove(restaurant.id)
+            if reindex_menus:
+                # Nama / cuisine / kota restoran ikut di-index di dokumen menunya
+                for key in [k for k, owner in self._owner.items() if k[0] == TYPE_MENU_ITEM and owner == restaurant.id]:
+                    self._index_menu_doc(dict(self._docs[key]))
+
+    def remove_restaurant(self, restaurant_id: int):
+        with self._lock:
+            self._restaurants.pop(restaurant_id, None)
+            self.locations.remove(restaurant_id)
+            self._remove((TYPE_RESTAURANT, restaurant_id))
+            for key in [k for k, owner in self._owner.items() if k[0] == TYPE_MENU_ITEM and owner == restaurant_id]:
+                self._remove(key)
+
+    def upsert_menu_item(self, item: MenuItem):
+        with self._lock:
+            self._index_menu_doc({
+                "type": TYPE_MENU_ITEM,
+                "id": item.id,
+                "restaurant_id": item.restaurant_id,
+                "name": item.name,
+                "description": item.description,
+                "category": item.category,
+                "price": float(item.price) if item.price is not None else None,
+                "price_band": price_band(item.price),
+                "is_available": bool(item.is_available),
+                "image_url": item.image_url
+            })
+
+    def remove_menu_item(self, menu_item_id: int):
+        with self._lock:
+            self._remove((TYPE_MENU_ITEM, menu_item_id))
+
+    def build_from_db(self, db: Session) -> int:
+        """(Re)build penuh dari database. Return jumlah dokumen."""
+        fresh = SearchIndex()
+        for restaurant in db.query(Restaurant).all():
+            fresh.upsert_restaurant(restaurant, reindex_menus=False)
+        for item in db.query(MenuItem).yield_per(1000):
+            fresh.upsert_menu_item(item)
+        with self._lock:
+            self._docs = fresh._docs
+            self._doc_terms = fresh._doc_terms
+            self._postings = fresh._postings
+            self._vocab = fresh._vocab
+            self._delete_map = fresh._delete_map
+            self._restaurants = fresh._restaurants
+            self._sort_keys = fresh._sort_keys
+            self._owner = fresh._owner
+            self._facet_combo = fresh._facet_combo
+            self._combos = fresh._combos
+            self._combo_ids = fresh._combo_ids
+            self.locations = fresh.locations
+            return len(self._docs)
+
+    # --- Query ---
+
+    def _expand(self, term: str) -> dict:
+        """Token index yang cocok dengan satu kata query -> kualitas match."""
+        matches = {}
+        if term in self._postings:
+            matches[term] = MATCH_EXACT
+        if len(term) >= MIN_PREFIX_LENGTH:
+            i = bisect.bisect_left(self._vocab, term)
+            while i < len(self._vocab) and self._vocab[i].startswith(term):
+                matches.setdefault(self._vocab[i], MATCH_PREFIX)
+                i += 1
+        if len(term) >= MIN_TYPO_LENGTH:
+            candidates = set()
+            for key in [term] + _deletes(term):
+                candidates |= self._delete_map.get(key, set())
+            for token in candidates:
+                if token not in matches and _within_one_edit(term, token):
+                    matches[token] = MATCH_TYPO
+        return matches
+
+    def _term_scores(self, expansions: list) -> dict:
+        # Gabungkan posting semua token hasil ekspansi, ambil skor terbaik per dokumen
+        if not expansions:
+            return {}
+        posting, quality = expansions[0]
+        scores = {key: quality * weight for key, weight in posting.items()}
+        for posting, quality in expansions[1:]:
+            for key, weight in posting.items():
+                score = quality * weight
+                if score > scores.get(key, 0):
+                    scores[key] = score
+        return scores
+
+    def _intersect(self, candidates: dict, expansions: list) -> dict:
+        # AND dengan kata berikutnya: cukup cek dokumen kandidat, bukan seluruh posting
+        result = {}
+        for key, score in candidates.items():
+            best = 0
+            for posting, quality in expansions:
+                weight = posting.get(key)
+                if weight is not None and weight * quality > best:
+                    best = weight * quality
+            if best:
+                result[key] = score + best
+        return result
+
+    def search(self, q: str = "", doc_type: str = None, cuisine: str = None, category: str = None,
+               band: str = None, restaurant_id: int = None, page: int = 1, size: int = 20) -> dict:
+        terms = list(dict.fromkeys(tokenize(q)))
+        with self._lock:
+            if terms:
+                # AND: mulai dari kata dengan posting paling kecil, kata lain hanya dicek ke kandidat
+                per_term = []
+                for term in terms:
+                    expansions = sorted(
+                        ((self._postings[token], quality) for token, quality in self._expand(term).items()),
+                        key=lambda e: -e[1]
+                    )
+                    per_term.append((sum(len(p) for p, _ in expansions), expansions))
+                per_term.sort(key=lambda t: t[0])
+                candidates = self._term_scores(per_term[0][1])
+                for _, expansions in per_term[1:]:
+                    if not candidates:
+                        break
+                    candidates = self._intersect(candidates, expansions)
+            else:
+                candidates = dict.fromkeys(self._docs, 0.0)
+
+            docs = self._docs
+            if doc_type or cuisine or category or band or restaurant_id:
+                cuisine_l = cuisine.lower() if cuisine else None
+                category_l = category.lower() if category else None
+                filtered = {}
+                for key, score in candidates.items():
+                    doc = docs[key]
+                    if doc_type and doc["type"] != doc_type:
+                        continue
+                    if cuisine_l and (doc.get("cuisine_type") or "").lower() != cuisine_l:
+                        continue
+                    if category_l and (doc.get("category") or "").lower() != category_l:
+                        continue
+                    if band and doc.get("price_band") != band:
+                        continue
+                    if restaurant_id and self._owner[key] != restaurant_id:
+                        continue
+                    filtered[key] = score
+                candidates = filtered
+
+            # Hitung id kombinasi (cuisine, category, price_band) sekali jalan, baru dipecah per facet
+            facets = {"cuisine": {}, "category": {}, "price_band": {}}
+            for combo_id, count in Counter(map(self._facet_combo.__getitem__, candidates)).items():
+                for facet, value in zip(("cuisine", "category", "price_band"), self._combos[combo_id]):
+                    if value:
+                        facets[facet][value] = facets[facet].get(value, 0) + count
+
+            # Ranking: skor, lalu yang tersedia/buka, lalu nama. Cukup urutkan sampai halaman ini:
+            # cari skor batas halaman, dokumen di atas batas diurutkan penuh, yang tepat di batas
+            # hanya diurutkan dengan sort key (string, dibandingkan di C).
+            needed = page * size
+            if len(candidates) > needed:
+                threshold = heapq.nlargest(needed, candidates.values())[-1]
+                above = [k for k, score in candidates.items() if score > threshold]
+                at = [k for k, score in candidates.items() if score == threshold]
+            else:
+                threshold = None
+                above, at = list(candidates), []
+            sort_keys = self._sort_keys
+            above.sort(key=lambda k: (-candidates[k], sort_keys[k]))
+            at.sort(key=sort_keys.__getitem__)
+            ordered = (above + at)[(page - 1) * size:needed]
+
+            results = [dict(docs[key], score=round(candidates[key], 3)) for key in ordered]
+
+        return {
+            "results": results,
+            "total": len(candidates),
+            "page": page,
+            "size": size,
+            "facets": facets
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._docs), "terms": len(self._postings), "locations": len(self.locations)}
+
+# Instance bersama per proses
+index = SearchIndex()
@@ -37,6 +37,7 @@ CREATE TABLE `menu_items` (
   `is_available` tinyint(1) DEFAULT 1,
   `category` varchar(50) DEFAULT 'Makanan',
   `image_url` varchar(500) DEFAULT NULL,
+  `version` int(11) NOT NULL DEFAULT 1,
   `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
   `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -131,6 +132,9 @@ CREATE TABLE `restaurants` (
   `address` text NOT NULL,
   `is_open` tinyint(1) DEFAULT 1,
   `image_url` varchar(500) DEFAULT NULL,
+  `latitude` double DEFAULT NULL,
+  `longitude` double DEFAULT NULL,
+  `version` int(11) NOT NULL DEFAULT 1,
   `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
   `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -18,6 +18,9 @@ def soft_reset():
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 0;"))
             conn.execute(text("TRUNCATE TABLE order_items;"))
             conn.execute(text("TRUNCATE TABLE orders;"))
+            conn.execute(text("TRUNCATE TABLE order_daily_stats;"))
+            conn.execute(text("TRUNCATE TABLE outbox_events;"))
+            conn.execute(text("TRUNCATE TABLE idempotency_keys;"))
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 1;"))
             conn.commit()
         print("Orders Cleared.")
@@ -31,6 +34,8 @@ def soft_reset():
         with engine_payment.connect() as conn:
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 0;"))
             conn.execute(text("TRUNCATE TABLE payments;"))
+            conn.execute(text("TRUNCATE TABLE outbox_events;"))
+            conn.execute(text("TRUNCATE TABLE idempotency_keys;"))
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 1;"))
             conn.commit()
         print("Payments Cleared.")
@@ -44,6 +49,8 @@ def soft_reset():
         with engine_driver.connect() as conn:
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 0;"))
             conn.execute(text("TRUNCATE TABLE driver_salaries;"))
+            conn.execute(text("TRUNCATE TABLE driver_location_tracks;"))
+            conn.execute(text("TRUNCATE TABLE processed_events;")) # Idempotency key memakai id order yang di-reset
             conn.execute(text("UPDATE drivers SET total_earnings = 0;")) 
             conn.execute(text("SET FOREIGN_KEY_CHECKS = 1;"))
             conn.commit()
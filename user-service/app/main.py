@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from strawberry.fastapi import GraphQLRouter
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from jose import jwt, JWTError # Tambahkan Import ini
-import os # Tambahkan Import ini
-from . import models, database, schema
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session, selectinload
+import os
+import json
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from . import models, database, schema, passwords, sessions, http_client
+import threading
+import requests
+from .auth import AuthError
 
 # --- Init Database ---
 models.Base.metadata.create_all(bind=database.engine)
@@ -21,9 +28,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- KONFIGURASI AUTH (SAMA DENGAN SERVICE LAIN) ---
-SECRET_KEY = os.getenv("SECRET_KEY", "kunci_rahasia_project_ini_harus_sama_semua")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+# Process pool bcrypt untuk login / register (passwords.py)
+@app.on_event("startup")
+def start_password_pool():
+    passwords.start()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    passwords.shutdown()
+
+# Hapus refresh token (sessions) yang sudah kedaluwarsa
+@app.on_event("startup")
+def start_session_purge():
+    threading.Thread(target=sessions.purge_loop, args=(database.SessionLocal,), daemon=True).start()
+
+DRIVER_SERVICE_URL = "http://driver-service:8000"
+
+# Statistik client HTTP internal (latency/error per upstream)
+@app.get("/internal/upstream-stats")
+def get_upstream_stats():
+    return {"status": "success", "data": http_client.stats()}
 
 # --- REST API MODELS ---
 class LoginRequest(BaseModel):
@@ -37,19 +61,17 @@ class RegisterRequest(BaseModel):
     role: str = "CUSTOMER"
     phone: str = None
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 # --- REST ENDPOINTS ---
 
-@app.post("/auth/login")
-def login_rest(req: LoginRequest, db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.email == req.email).first()
-    if not user or not schema.verify_password(req.password, user.password):
-        raise HTTPException(status_code=400, detail="Invalid credentials")
-    
+def _auth_response(user: models.User, refresh_token: str):
     # Simpan User ID di 'sub' token
-    token = schema.create_access_token({"sub": str(user.id), "role": user.role, "id": user.id})
-    
+    token = schema.create_access_token({"sub": str(user.id), "role": user.role, "id": user.id, "name": user.name})
     return {
         "token": token,
+        "refresh_token": refresh_token, # Tukar di /auth/refresh saat token expired, tanpa login ulang
         "user": {
             "id": user.id,
             "name": user.name,
@@ -58,13 +80,47 @@ def login_rest(req: LoginRequest, db: Session = Depends(database.get_db)):
         }
     }
 
+def _start_session(db: Session, user: models.User) -> dict:
+    """
+    Refresh token baru + response login. Jalankan di threadpool: commit meng-expire `user`, jadi
+    atributnya dimuat ulang (SELECT) di sini, bukan lazy load di event loop.
+    """
+    refresh_token = sessions.issue(db, user.id)
+    db.commit()
+    return _auth_response(user, refresh_token)
+
+def _password_busy(e: passwords.PasswordHashBusy):
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+# bcrypt jalan di process pool (passwords.py): endpoint async supaya lonjakan login tidak
+# memakan thread pool yang juga melayani endpoint lain
+@app.post("/auth/login")
+async def login_rest(req: LoginRequest, db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(lambda: db.query(models.User).filter(models.User.email == req.email).first())
+    if not user:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    try:
+        valid, new_hash = await passwords.verify_and_update(req.password, user.password)
+    except passwords.PasswordHashBusy as e:
+        raise _password_busy(e)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # Cost bcrypt berubah (BCRYPT_ROUNDS) -> simpan hash baru, transparan bagi user
+        await run_in_threadpool(schema.save_rehashed_password, user.id, new_hash)
+    
+    return await run_in_threadpool(_start_session, db, user)
+
 @app.post("/auth/register")
-def register_rest(req: RegisterRequest, db: Session = Depends(database.get_db)):
-    existing = db.query(models.User).filter(models.User.email == req.email).first()
+async def register_rest(req: RegisterRequest, db: Session = Depends(database.get_db)):
+    existing = await run_in_threadpool(lambda: db.query(models.User).filter(models.User.email == req.email).first())
     if existing:
         raise HTTPException(status_code=400, detail="Email already used")
     
-    hashed = schema.get_password_hash(req.password)
+    try:
+        hashed = await passwords.hash_password(req.password)
+    except passwords.PasswordHashBusy as e:
+        raise _password_busy(e)
     new_user = models.User(
         name=req.name, 
         email=req.email, 
@@ -72,98 +128,242 @@ def register_rest(req: RegisterRequest, db: Session = Depends(database.get_db)):
         role=req.role,
         phone=req.phone
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
-    token = schema.create_access_token({"sub": str(new_user.id), "role": new_user.role, "id": new_user.id})
-    
+    def save():
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        return _start_session(db, new_user)
+    return await run_in_threadpool(save)
+
+# Access token baru dari refresh token: satu lookup index + satu query user, tanpa bcrypt.
+# Refresh token dirotasi (yang lama tidak berlaku lagi), lihat sessions.py
+@app.post("/auth/refresh")
+def refresh_rest(req: RefreshRequest, db: Session = Depends(database.get_db)):
+    try:
+        user_id, refresh_token = sessions.rotate(db, req.refresh_token)
+    except sessions.SessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return _auth_response(user, refresh_token)
+
+@app.post("/auth/logout")
+def logout_rest(req: RefreshRequest, db: Session = Depends(database.get_db)):
+    sessions.revoke(db, req.refresh_token)
+    return {"status": "success", "message": "Logged out"}
+
+# --- INTERNAL API (INTEGRASI) ---
+
+MAX_BATCH_IDS = 500
+
+def _parse_ids(ids: str):
+    try:
+        id_list = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    if len(id_list) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_IDS} ids per request")
+    return id_list
+
+@app.get("/internal/auth/password-hash/stats")
+def get_password_hash_stats():
+    return {"status": "success", "data": passwords.stats()}
+
+# Lookup banyak user sekaligus (satu query IN, kolom seperlunya). Dipanggil Order & Driver Service
+@app.get("/internal/users/batch")
+def get_users_batch_internal(ids: str, db: Session = Depends(database.get_db)):
+    id_list = _parse_ids(ids)
+    rows = []
+    if id_list:
+        rows = db.query(
+            models.User.id, models.User.name, models.User.email, models.User.role, models.User.phone
+        ).filter(models.User.id.in_(id_list)).all()
     return {
-        "token": token,
-        "user": {
-            "id": new_user.id,
-            "name": new_user.name,
-            "email": new_user.email,
-            "role": new_user.role
-        }
+        "status": "success",
+        "data": [
+            {"id": r.id, "name": r.name, "email": r.email, "role": r.role, "phone": r.phone} for r in rows
+        ]
     }
 
-@app.get("/users/admin/all")
-def get_all_users_admin(db: Session = Depends(database.get_db)):
-    users = db.query(models.User).all()
-    data = []
-    for u in users:
-        # Fetch all addresses
-        addrs = db.query(models.Address).filter(models.Address.user_id == u.id).all()
-        addresses_data = [
+# Lookup satu user berdasarkan id (primary key). Dipanggil Driver Service untuk cache nama / telepon driver
+@app.get("/internal/users/{user_id}")
+def get_user_internal(user_id: int, db: Session = Depends(database.get_db)):
+    r = db.query(
+        models.User.id, models.User.name, models.User.email, models.User.role, models.User.phone
+    ).filter(models.User.id == user_id).first()
+    if not r:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {
+        "status": "success",
+        "data": {"id": r.id, "name": r.name, "email": r.email, "role": r.role, "phone": r.phone}
+    }
+
+# Lookup banyak alamat sekaligus berdasarkan address_id
+@app.get("/internal/addresses/batch")
+def get_addresses_batch_internal(ids: str, db: Session = Depends(database.get_db)):
+    id_list = _parse_ids(ids)
+    rows = []
+    if id_list:
+        rows = db.query(
+            models.Address.id, models.Address.user_id, models.Address.label, models.Address.full_address,
+            models.Address.latitude, models.Address.longitude
+        ).filter(models.Address.id.in_(id_list)).all()
+    return {
+        "status": "success",
+        "data": [
+            {
+                "id": r.id, "user_id": r.user_id, "label": r.label, "full_address": r.full_address,
+                "latitude": r.latitude, "longitude": r.longitude
+            } for r in rows
+        ]
+    }
+
+ADMIN_USERS_CHUNK_SIZE = 500
+ADMIN_USERS_MAX_LIMIT = 1000
+
+def _user_admin_data(u: models.User):
+    return {
+        "id": u.id,
+        "name": u.name,
+        "email": u.email,
+        "role": u.role,
+        "phone": u.phone,
+        "created_at": u.created_at, # Added created_at
+        "addresses": [ # Return array
             {
                 "id": a.id,
                 "label": a.label,
                 "full_address": a.full_address,
                 "is_default": bool(a.is_default)
-            } for a in addrs
+            } for a in u.addresses
         ]
-        
-        data.append({
-            "id": u.id,
-            "name": u.name,
-            "email": u.email,
-            "role": u.role,
-            "phone": u.phone,
-            "created_at": u.created_at, # Added created_at
-            "addresses": addresses_data # Return array
-        })
-    return {"status": "success", "data": data}
+    }
+
+@app.get("/users/admin/all")
+def get_all_users_admin(after_id: int = 0, limit: int = None, role: str = None):
+    """
+    Keyset pagination (?after_id=&limit=) + filter role opsional.
+    Tanpa limit -> semua user (kompatibel dengan frontend lama), tetap diambil per chunk
+    dan di-stream sehingga memori tidak tumbuh mengikuti ukuran tabel.
+    """
+    if limit is not None and not (1 <= limit <= ADMIN_USERS_MAX_LIMIT):
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {ADMIN_USERS_MAX_LIMIT}")
+
+    def stream():
+        # Session sendiri: dependency get_db sudah ditutup sebelum response di-stream
+        db = database.SessionLocal()
+        try:
+            yield '{"status": "success", "data": ['
+            last_id = after_id
+            remaining = limit
+            sent = 0
+            while remaining is None or remaining > 0:
+                size = ADMIN_USERS_CHUNK_SIZE if remaining is None else min(ADMIN_USERS_CHUNK_SIZE, remaining)
+                query = db.query(models.User).options(selectinload(models.User.addresses)).filter(models.User.id > last_id)
+                if role:
+                    query = query.filter(models.User.role == role.upper())
+                users = query.order_by(models.User.id).limit(size).all()
+
+                for u in users:
+                    yield ("," if sent else "") + json.dumps(jsonable_encoder(_user_admin_data(u)))
+                    sent += 1
+
+                if users:
+                    last_id = users[-1].id
+                if remaining is not None:
+                    remaining -= len(users)
+                db.expunge_all() # Lepas objek dari identity map agar memori tetap datar
+                if len(users) < size:
+                    break
+
+            next_after_id = last_id if limit is not None and sent == limit else None
+            yield '], "next_after_id": ' + json.dumps(next_after_id) + '}'
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/json")
+
+# --- HELPER: GET CURRENT USER ---
+def get_current_user_id(authorization: str = Header(None)) -> int:
+    # Claim "id" (int); token lama hanya punya "sub"
+    try:
+        return schema.token_verifier.principal(authorization).id
+    except AuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 # --- UPDATE PENTING: GET REAL PROFILE FROM DB ---
 @app.get("/users/profile/me")
-def get_me(authorization: str = Header(None), db: Session = Depends(database.get_db)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Token")
-    
-    try:
-        # Decode Token
-        token = authorization.split(" ")[1]
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
+def get_me(user_id: int = Depends(get_current_user_id), db: Session = Depends(database.get_db)):
+    # Ambil Data dari DB
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
         
-        # Ambil Data dari DB
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-            
-        return {
-            "id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "role": user.role,
-            "phone": user.phone
-        }
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid Token")
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "role": user.role,
+        "phone": user.phone
+    }
     
+class ProfileUpdate(BaseModel):
+    name: Optional[str] = None
+    phone: Optional[str] = None
+
+def _push_driver_display(user_id: int, name: str, phone: Optional[str]):
+    # Best effort (PUT idempotent -> di-retry http_client): kalau tetap gagal, cache di Driver Service
+    # diperbarui setelah TTL-nya habis
+    try:
+        res = http_client.put(
+            f"{DRIVER_SERVICE_URL}/internal/drivers/{user_id}/display",
+            json={"name": name, "phone": phone}
+        )
+        if res.status_code != 200:
+            print(f"Failed to push driver display for user {user_id}: {res.status_code} {res.text}")
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to push driver display for user {user_id}: {e}")
+
+@app.put("/users/profile/me")
+def update_me(
+    req: ProfileUpdate,
+    background_tasks: BackgroundTasks,
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(database.get_db)
+):
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if req.name is not None:
+        user.name = req.name
+    if req.phone is not None:
+        user.phone = req.phone
+    db.commit()
+
+    # Nama & telepon driver ikut tampil di detail order -> perbarui cache di Driver Service
+    if (user.role or "").upper() == "DRIVER":
+        background_tasks.add_task(_push_driver_display, user.id, user.name, user.phone)
+
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "role": user.role,
+        "phone": user.phone
+    }
+
 # --- GRAPHQL ENDPOINT ---
 graphql_app = GraphQLRouter(schema.schema)
 app.include_router(graphql_app, prefix="/graphql")
 
-# --- HELPER: GET CURRENT USER ---
-def get_current_user_id(authorization: str = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Token")
-    try:
-        token = authorization.split(" ")[1]
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid Token")
-
 # --- ADDRESS ENDPOINTS ---
 
 class AddressCreate(BaseModel):
     label: str
     full_address: str
-    latitude: str = None
-    longitude: str = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     is_default: bool = False
 
 @app.get("/users/addresses")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -30,13 +30,26 @@ class Address(Base):
     label = Column(String(100), nullable=False)
     full_address = Column(Text, nullable=False)
     
-    # Di DB lama biasanya DECIMAL, tapi String juga aman untuk mencegah crash
-    latitude = Column(String(20), nullable=True) 
-    longitude = Column(String(20), nullable=True)
+    # Koordinat numerik (derajat desimal), dipakai untuk jarak antar lokasi
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     
     is_default = Column(Integer, default=0)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
-    user = relationship("User", back_populates="addresses")
\ No newline at end of file
+    user = relationship("User", back_populates="addresses")
+
+class UserSession(Base):
+    """Refresh token (opaque). Hanya hash SHA-256 yang disimpan; satu login = satu family yang dirotasi."""
+    __tablename__ = "sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    family_id = Column(String(36), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    rotated_at = Column(DateTime, nullable=True) # Sudah ditukar dengan token baru
+    revoked_at = Column(DateTime, nullable=True) # Logout / reuse terdeteksi
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
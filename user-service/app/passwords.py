@@ -0,0 +1,120 @@
+"""
+Hash & verifikasi password bcrypt di process pool terpisah.
+
+bcrypt sengaja mahal (ratusan ms per hash di cost 12). Kalau dijalankan di thread request, lonjakan login
+pagi menghabiskan CPU dan thread pool worker uvicorn sehingga endpoint lain (alamat, profil) ikut lambat.
+- Hash dijalankan di ProcessPoolExecutor (PASSWORD_HASH_WORKERS proses); login / register cukup `await`.
+- Job yang antre + berjalan dibatasi PASSWORD_HASH_MAX_PENDING. Lebih dari itu -> PasswordHashBusy,
+  dibawa ke 503 + Retry-After supaya client mundur, bukan menumpuk antrean.
+- Cost diatur lewat BCRYPT_ROUNDS. Hash dengan cost / skema lama di-rehash saat login berhasil
+  (CryptContext.needs_update via verify_and_update), jadi mengganti cost tidak perlu migrasi data.
+Benchmark hash/detik per core: python bench_passwords.py
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(WORKERS * 4)))
+RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "2"))
+
+# deprecated="auto" akan otomatis menangani hash lama dan mengupdatenya jika perlu
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordHashBusy(Exception):
+    """Antrean hash penuh. Dibawa ke HTTPException 503 + Retry-After (REST) atau Exception (GraphQL)."""
+    def __init__(self):
+        super().__init__("Too many login attempts in progress, please retry shortly")
+        self.status_code = 503
+        self.detail = str(self)
+        self.retry_after = RETRY_AFTER_SECONDS
+
+# --- Fungsi yang jalan di proses worker (harus level modul supaya bisa di-pickle) ---
+
+def hash_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_and_update_sync(password: str, hashed_password):
+    """(valid, hash_baru). hash_baru terisi kalau hash tersimpan perlu di-rehash (cost / skema berubah)."""
+    # HANDLING KHUSUS: MySQL Connector kadang mengembalikan hash sebagai bytes
+    if isinstance(hashed_password, bytes):
+        hashed_password = hashed_password.decode("utf-8")
+    if not isinstance(hashed_password, str):
+        return False, None
+    try:
+        return pwd_context.verify_and_update(password, hashed_password)
+    except Exception as e:
+        print(f"Auth Verify Error: {e}")
+        return False, None
+
+# --- Pool & batas antrean (di proses API) ---
+
+_pool = None
+_lock = threading.Lock()
+_pending = 0
+_completed = 0
+_rejected = 0
+
+def start():
+    """Buat pool di startup supaya login pertama tidak menanggung biaya spawn proses."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn, bukan fork: proses API sudah punya thread (threadpool, client HTTP)
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+def _done(future):
+    global _pending, _completed, _pool
+    with _lock:
+        _pending -= 1
+        _completed += 1
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        # Worker mati (OOM / kill) -> pool tidak bisa dipakai lagi, buat ulang di request berikutnya
+        with _lock:
+            _pool = None
+
+def _submit(fn, *args):
+    global _pending, _rejected, _pool
+    with _lock:
+        if _pending >= MAX_PENDING:
+            _rejected += 1
+            raise PasswordHashBusy()
+        _pending += 1
+    try:
+        future = start().submit(fn, *args)
+    except Exception as e:
+        with _lock:
+            _pending -= 1
+            if isinstance(e, BrokenProcessPool):
+                _pool = None
+        raise
+    future.add_done_callback(_done)
+    return future
+
+async def hash_password(password: str) -> str:
+    return await asyncio.wrap_future(_submit(hash_sync, password))
+
+async def verify_and_update(password: str, hashed_password):
+    """Lihat verify_and_update_sync. PasswordHashBusy kalau antrean penuh."""
+    return await asyncio.wrap_future(_submit(verify_and_update_sync, password, hashed_password))
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "rounds": BCRYPT_ROUNDS, "workers": WORKERS, "max_pending": MAX_PENDING,
+            "pending": _pending, "completed": _completed, "rejected": _rejected
+        }
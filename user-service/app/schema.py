@@ -3,35 +3,37 @@ from typing import Optional, List
 from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .models import User, Address
-from passlib.context import CryptContext
 from jose import jwt
+from .auth import TokenVerifier
+from . import passwords
+from . import sessions
 import os
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 
 # --- SETUP AUTH ---
-# deprecated="auto" akan otomatis menangani hash lama dan mengupdatenya jika perlu
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "rahasia_super_aman")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+# Versi sinkron (seed / script). Endpoint login & register memakai passwords.hash_password /
+# passwords.verify_and_update yang jalan di process pool
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    return passwords.hash_sync(password)
 
 def verify_password(plain_password: str, hashed_password):
-    # HANDLING KHUSUS: MySQL Connector kadang mengembalikan hash sebagai bytes
-    # Kita paksa ubah jadi string utf-8 agar passlib bisa membacanya
-    if isinstance(hashed_password, bytes):
-        hashed_password = hashed_password.decode("utf-8")
-    
-    # Jika hashed_password masih bukan string (misal None), return False
-    if not isinstance(hashed_password, str):
-        return False
-        
+    return passwords.verify_and_update_sync(plain_password, hashed_password)[0]
+
+def save_rehashed_password(user_id: int, new_hash: str):
+    """Simpan hash baru hasil rehash-on-login. Best effort: gagal simpan tidak menggagalkan login."""
+    db = SessionLocal()
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        db.query(User).filter(User.id == user_id).update({User.password: new_hash}, synchronize_session=False)
+        db.commit()
     except Exception as e:
-        print(f"Auth Verify Error: {e}")
-        return False
+        db.rollback()
+        print(f"Password rehash failed for user {user_id}: {e}")
+    finally:
+        db.close()
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -39,6 +41,8 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM) # Dipakai juga oleh main.py
+
 # --- TYPES ---
 
 @strawberry.type
@@ -74,6 +78,7 @@ class UserType:
 class AuthPayload:
     token: str
     user: UserType
+    refresh_token: Optional[str] = None
 
 # --- RESOLVERS ---
 
@@ -82,10 +87,10 @@ class Query:
     @strawberry.field
     def me(self, token: str) -> Optional[UserType]:
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            email = payload.get("sub")
+            # Cari lewat claim id: "sub" berisi email (GraphQL login) atau id (REST login)
+            user_id = token_verifier.principal(f"Bearer {token}").id
             db = SessionLocal()
-            user = db.query(User).filter(User.email == email).first()
+            user = db.query(User).filter(User.id == user_id).first()
             db.close()
             if user:
                 return UserType(
@@ -108,25 +113,46 @@ class Query:
             )
         return None
 
+def _new_session(user_id: int) -> str:
+    db = SessionLocal()
+    try:
+        refresh_token = sessions.issue(db, user_id)
+        db.commit()
+        return refresh_token
+    finally:
+        db.close()
+
+def _find_user_by_email(email: str):
+    db = SessionLocal()
+    user = db.query(User).filter(User.email == email).first()
+    db.close()
+    return user
+
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    def login(self, email: str, password: str) -> AuthPayload:
-        db = SessionLocal()
-        user = db.query(User).filter(User.email == email).first()
-        db.close()
+    async def login(self, email: str, password: str) -> AuthPayload:
+        user = await run_in_threadpool(_find_user_by_email, email)
         
         if not user:
             raise Exception("User not found")
         
-        # Passlib akan menangani verifikasi
-        if not verify_password(password, user.password):
+        # Verifikasi di process pool (tidak memblok event loop), hash lama di-rehash
+        try:
+            valid, new_hash = await passwords.verify_and_update(password, user.password)
+        except passwords.PasswordHashBusy as e:
+            raise Exception(e.detail)
+        if not valid:
             raise Exception("Invalid credentials")
+        if new_hash:
+            await run_in_threadpool(save_rehashed_password, user.id, new_hash)
             
-        token = create_access_token({"sub": user.email, "role": user.role, "id": user.id})
+        token = create_access_token({"sub": user.email, "role": user.role, "id": user.id, "name": user.name})
+        refresh_token = await run_in_threadpool(_new_session, user.id)
         
         return AuthPayload(
             token=token,
+            refresh_token=refresh_token,
             user=UserType(
                 id=user.id, name=user.name, email=user.email, 
                 role=user.role, phone=user.phone
@@ -134,32 +160,65 @@ class Mutation:
         )
     
     @strawberry.mutation
-    def register(self, name: str, email: str, password: str, phone: str, role: str = "CUSTOMER") -> AuthPayload:
-        db = SessionLocal()
-        if db.query(User).filter(User.email == email).first():
-            db.close()
+    async def register(self, name: str, email: str, password: str, phone: str, role: str = "CUSTOMER") -> AuthPayload:
+        if await run_in_threadpool(_find_user_by_email, email):
             raise Exception("Email already registered")
         
-        hashed_pw = get_password_hash(password)
-        
-        new_user = User(
-            name=name, email=email, password=hashed_pw, 
-            phone=phone, role=role
-        )
+        try:
+            hashed_pw = await passwords.hash_password(password)
+        except passwords.PasswordHashBusy as e:
+            raise Exception(e.detail)
         
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        def save():
+            db = SessionLocal()
+            try:
+                new_user = User(
+                    name=name, email=email, password=hashed_pw, 
+                    phone=phone, role=role
+                )
+                db.add(new_user)
+                db.commit()
+                db.refresh(new_user)
+                db.expunge(new_user)
+                return new_user
+            finally:
+                db.close()
+        new_user = await run_in_threadpool(save)
         
-        token = create_access_token({"sub": new_user.email, "role": new_user.role, "id": new_user.id})
-        db.close()
+        token = create_access_token({"sub": new_user.email, "role": new_user.role, "id": new_user.id, "name": new_user.name})
+        refresh_token = await run_in_threadpool(_new_session, new_user.id)
         
         return AuthPayload(
             token=token,
+            refresh_token=refresh_token,
             user=UserType(
                 id=new_user.id, name=new_user.name, email=new_user.email, 
                 role=new_user.role, phone=new_user.phone
             )
         )
 
+    @strawberry.mutation
+    def refresh_token(self, refresh_token: str) -> AuthPayload:
+        # Tanpa bcrypt: refresh token dirotasi, access token baru diterbitkan (lihat sessions.py)
+        db = SessionLocal()
+        try:
+            user_id, new_refresh_token = sessions.rotate(db, refresh_token)
+            user = db.query(User).filter(User.id == user_id).first()
+        except sessions.SessionError as e:
+            raise Exception(e.detail)
+        finally:
+            db.close()
+        if not user:
+            raise Exception("User not found")
+        
+        token = create_access_token({"sub": user.email, "role": user.role, "id": user.id, "name": user.name})
+        return AuthPayload(
+            token=token,
+            refresh_token=new_refresh_token,
+            user=UserType(
+                id=user.id, name=user.name, email=user.email, 
+                role=user.role, phone=user.phone
+            )
+        )
+
 schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Refresh token untuk memperpanjang sesi tanpa login ulang (tanpa bcrypt).
+
+- Login / register memberi access token JWT (umur pendek) + refresh token opaque (acak, umur panjang).
+- POST /auth/refresh menukar refresh token dengan access token + refresh token BARU (rotasi);
+  token lama tidak berlaku lagi.
+- Di DB hanya disimpan SHA-256 token (kolom unik ber-index), jadi bocornya tabel sessions tidak
+  memberi token yang bisa dipakai.
+- Reuse detection: token yang sudah dirotasi dipakai lagi -> kemungkinan dicuri, seluruh family
+  (rantai rotasi dari satu login) dicabut. Pengecualian REUSE_GRACE_SECONDS untuk dua tab yang
+  refresh bersamaan: request yang kalah cukup ditolak tanpa mencabut sesi.
+- Logout mencabut family; token kedaluwarsa dihapus purge_loop.
+"""
+import hashlib
+import os
+import secrets
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+from .models import UserSession
+
+REFRESH_TOKEN_TTL_DAYS = float(os.getenv("REFRESH_TOKEN_TTL_DAYS", "30"))
+REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_TOKEN_REUSE_GRACE_SECONDS", "10"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("SESSION_PURGE_INTERVAL_SECONDS", "3600"))
+
+class SessionError(Exception):
+    """Dibawa ke HTTPException 401 (REST) atau Exception (GraphQL)."""
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.status_code = 401
+        self.detail = detail
+
+def _hash(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+def issue(db: Session, user_id: int, family_id: str = None) -> str:
+    """Buat refresh token baru (TIDAK commit). family_id None -> sesi (login) baru."""
+    refresh_token = secrets.token_urlsafe(32)
+    db.add(UserSession(
+        user_id=user_id, family_id=family_id or str(uuid.uuid4()), token_hash=_hash(refresh_token),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_TTL_DAYS)
+    ))
+    return refresh_token
+
+def _revoke_family(db: Session, family_id: str, now: datetime):
+    db.query(UserSession).filter(
+        UserSession.family_id == family_id, UserSession.revoked_at.is_(None)
+    ).update({UserSession.revoked_at: now}, synchronize_session=False)
+
+def rotate(db: Session, refresh_token: str):
+    """Return (user_id, refresh_token_baru), sudah commit. SessionError kalau token tidak berlaku."""
+    if not refresh_token:
+        raise SessionError("Missing refresh token")
+    now = datetime.utcnow()
+    current = db.query(UserSession).filter(UserSession.token_hash == _hash(refresh_token)).first()
+    if current is None or current.revoked_at is not None or current.expires_at <= now:
+        raise SessionError("Invalid or expired refresh token")
+
+    if current.rotated_at is not None:
+        if current.rotated_at >= now - timedelta(seconds=REUSE_GRACE_SECONDS):
+            raise SessionError("Refresh token already used")
+        _revoke_family(db, current.family_id, now)
+        db.commit()
+        print(f"Refresh token reuse detected for user {current.user_id}, session family {current.family_id} revoked")
+        raise SessionError("Refresh token reuse detected, please login again")
+
+    # Conditional UPDATE: dua refresh bersamaan dengan token yang sama -> hanya satu yang dapat token baru
+    claimed = db.query(UserSession).filter(
+        UserSession.id == current.id, UserSession.rotated_at.is_(None), UserSession.revoked_at.is_(None)
+    ).update({UserSession.rotated_at: now}, synchronize_session=False)
+    if claimed != 1:
+        db.rollback()
+        raise SessionError("Refresh token already used")
+
+    new_token = issue(db, current.user_id, current.family_id)
+    db.commit()
+    return current.user_id, new_token
+
+def revoke(db: Session, refresh_token: str) -> bool:
+    """Logout: cabut seluruh family dari token ini. False kalau token tidak dikenal."""
+    current = db.query(UserSession).filter(UserSession.token_hash == _hash(refresh_token or "")).first()
+    if current is None:
+        return False
+    _revoke_family(db, current.family_id, datetime.utcnow())
+    db.commit()
+    return True
+
+def purge(db: Session) -> int:
+    deleted = db.query(UserSession).filter(
+        UserSession.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def purge_loop(session_factory):
+    while True:
+        time.sleep(PURGE_INTERVAL_SECONDS)
+        db = session_factory()
+        try:
+            purge(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Session purge failed: {e}")
+        finally:
+            db.close()
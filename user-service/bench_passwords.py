@@ -0,0 +1,39 @@
+import sys
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from passlib.context import CryptContext
+from app import passwords
+
+# Jalankan: docker-compose exec user-service python /app/bench_passwords.py [rounds ...]
+# Mengukur hash bcrypt per detik di satu core lalu di pool PASSWORD_HASH_WORKERS proses,
+# untuk memilih BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS sesuai target login per detik.
+def _hash_n(rounds: int, n: int) -> float:
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    start = time.perf_counter()
+    for _ in range(n):
+        context.hash("benchmark-password")
+    return time.perf_counter() - start
+
+def benchmark(rounds_list, seconds: float = 2.0):
+    workers = passwords.WORKERS
+    print(f"CPU cores: {os.cpu_count()}, PASSWORD_HASH_WORKERS: {workers}")
+    print(f"{'rounds':>6} {'ms/hash':>9} {'hash/s/core':>12} {'hash/s pool':>12} {'per worker':>11}")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rounds in rounds_list:
+            # Kalibrasi jumlah hash supaya tiap pengukuran sekitar `seconds` detik
+            per_hash = _hash_n(rounds, 1)
+            n = max(1, int(seconds / per_hash))
+            single = n / _hash_n(rounds, n)
+
+            start = time.perf_counter()
+            list(pool.map(_hash_n, [rounds] * workers, [n] * workers))
+            pooled = (n * workers) / (time.perf_counter() - start)
+            print(f"{rounds:>6} {1000 / single:>9.1f} {single:>12.1f} {pooled:>12.1f} {pooled / workers:>11.1f}")
+
+if __name__ == "__main__":
+    rounds_list = [int(r) for r in sys.argv[1:]] or sorted({10, 11, 12, passwords.BCRYPT_ROUNDS})
+    benchmark(rounds_list)